@@ -0,0 +1,189 @@
+"""Async HTTP API for the NOC assistant (for the ticketing system and other clients).
+
+    POST /login   {"username", "password"}                  -> {"token", "client", "role"}
+    POST /query   {"question", "session_id"?, "confirmation_id"?} -> answer (text, sql, rows, ...)
+    POST /chat    {"question", "session_id"?, "incident_id"?}   -> conversational answer
+    POST /ingest  multipart file + mode=upsert|append (admin) -> ingest stats
+    POST /ingest/jobs  same as /ingest, loaded in the background (admin) -> job (id, status, progress)
+    GET  /ingest/jobs, /ingest/jobs/{id} (admin)             -> recent jobs / one job with progress
+    POST /ingest/jobs/{id}/cancel, /ingest/jobs/{id}/resume (admin) -> job
+    POST /templates {"question", "sql"} (admin)              -> promote to the SQL template library
+    GET  /metrics Prometheus text metrics of this worker
+    GET  /health
+
+All endpoints but /login, /health and /metrics need ``Authorization: Bearer
+<token>``. The client a query runs for always comes from the token, never from
+the request body. Blocking work (SQLite, Ollama) runs in the worker's thread
+pool, so one worker serves many requests concurrently; ``--workers`` starts
+several processes that share the database file (WAL) and the token secret.
+
+Result handles for follow-ups and queries waiting for confirmation live in the
+worker that answered the question; behind a load balancer use sticky sessions
+(e.g. on session_id), otherwise a follow-up on another worker falls back to a
+full query and a confirmation has to be asked for again.
+
+Usage:
+    python api.py [--host 0.0.0.0] [--port 8000] [--workers 4]
+"""
+import argparse
+import os
+import secrets
+import uuid
+from typing import Optional
+
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from incident_ingest import DuplicateIncidentsError
+from ingest_jobs import JobNotFound
+from noc_service import AuthenticationError, NocService, PermissionDenied, issue_token, user_from_token
+from tracing import tracer
+
+app = FastAPI(title="NOC Assistant API")
+service = NocService()
+
+
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+
+
+class QueryRequest(BaseModel):
+    question: str
+    session_id: Optional[str] = None
+    confirmation_id: Optional[str] = None  # From a "confirm" answer; runs the query it describes
+
+
+class ChatRequest(BaseModel):
+    question: str
+    session_id: Optional[str] = None
+    incident_id: Optional[str] = None
+
+
+class PromoteRequest(BaseModel):
+    question: str
+    sql: str
+
+
+def current_user(authorization: str = Header(default="")):
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Bearer token required")
+    try:
+        return user_from_token(token)
+    except AuthenticationError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+
+@app.post("/login")
+async def login(request: LoginRequest):
+    try:
+        user = service.login(request.username, request.password)
+    except AuthenticationError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return {"token": issue_token(user), "client": user.client, "role": user.role}
+
+
+@app.post("/query")
+async def query(request: QueryRequest, user=Depends(current_user)):
+    session_id = request.session_id or uuid.uuid4().hex
+    answer = await run_in_threadpool(service.ask, user, session_id, request.question, request.confirmation_id)
+    return {"session_id": session_id, **answer.to_dict()}
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest, user=Depends(current_user)):
+    session_id = request.session_id or uuid.uuid4().hex
+    answer = await run_in_threadpool(service.chat, user, session_id, request.question, request.incident_id)
+    return {"session_id": session_id, **answer.to_dict()}
+
+
+@app.post("/ingest")
+async def ingest(file: UploadFile = File(...), mode: str = Form("upsert"), user=Depends(current_user)):
+    if mode not in ("upsert", "append"):
+        raise HTTPException(status_code=422, detail="mode must be 'upsert' or 'append'")
+    try:
+        return await run_in_threadpool(service.ingest, user, file.file, mode, file.filename)
+    except PermissionDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except DuplicateIncidentsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+async def _ingest_job_call(method, user, *args):
+    try:
+        return await run_in_threadpool(method, user, *args)
+    except PermissionDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except JobNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/ingest/jobs")
+async def submit_ingest(file: UploadFile = File(...), mode: str = Form("upsert"), user=Depends(current_user)):
+    return await _ingest_job_call(service.submit_ingest, user, file.file, mode, file.filename)
+
+
+@app.get("/ingest/jobs")
+async def ingest_jobs(limit: int = 20, user=Depends(current_user)):
+    return {"jobs": await _ingest_job_call(service.ingest_job_list, user, limit)}
+
+
+@app.get("/ingest/jobs/{job_id}")
+async def ingest_job(job_id: str, user=Depends(current_user)):
+    return await _ingest_job_call(service.ingest_job, user, job_id)
+
+
+@app.post("/ingest/jobs/{job_id}/cancel")
+async def cancel_ingest(job_id: str, user=Depends(current_user)):
+    return await _ingest_job_call(service.cancel_ingest, user, job_id)
+
+
+@app.post("/ingest/jobs/{job_id}/resume")
+async def resume_ingest(job_id: str, user=Depends(current_user)):
+    return await _ingest_job_call(service.resume_ingest, user, job_id)
+
+
+@app.post("/templates")
+async def promote_template(request: PromoteRequest, user=Depends(current_user)):
+    try:
+        template_id, sql = await run_in_threadpool(service.promote_template, user, request.question, request.sql)
+    except PermissionDenied as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"template_id": template_id, "sql": sql}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return tracer.prometheus_text()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", str(os.cpu_count() or 1))))
+    args = parser.parse_args()
+
+    # Worker processes inherit the environment, so tokens are valid on every worker
+    os.environ.setdefault("NOC_API_SECRET", secrets.token_hex(32))
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
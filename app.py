@@ -1,14 +1,30 @@
+from __future__ import annotations
+
+import os
 import tempfile
-import chromadb
+from importlib import import_module
+from typing import TYPE_CHECKING
+
 import requests
 import streamlit as st
-from chromadb.utils.embedding_functions.ollama_embedding_function import OllamaEmbeddingFunction
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import CrossEncoder
 from streamlit.runtime.uploaded_file_manager import UploadedFile
 
+from ollama_client import embed, preload
+from tracing import llm_tokens, request_context, span, start_metrics_server
+from warmup import start_warmup
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# langchain, the vector store backends and the reranker model are imported on first use,
+# so the page renders without them; warm_up() loads them in the background afterwards
+
+# "chroma" (PersistentClient) or "mmap" (memory-mapped store in vector_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float16")  # mmap only: float16 or int8
+EMBEDDINGS_URL = "http://192.168.5.201:11434/api/embeddings"
+EMBEDDING_MODEL = "nomic-embed-text:latest"
+
 system_prompt = """
 You are an AI assistant tasked with providing detailed answers based solely on the given context. Your goal is to analyze the information provided and formulate a comprehensive, well-structured response to the question.
 
@@ -38,22 +54,41 @@ def process_document(uploaded_file: UploadedFile) -> list[Document]:
     temp_file = tempfile.NamedTemporaryFile("wb", suffix=".pdf", delete=False)
     temp_file.write(uploaded_file.read())
 
-    loader = PyMuPDFLoader(temp_file.name)
-    docs = loader.load()
-    #os.unlink(temp_file.name)  # Delete temp file
+    from langchain_community.document_loaders import PyMuPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    with span("document.split") as s:
+        loader = PyMuPDFLoader(temp_file.name)
+        docs = loader.load()
+        #os.unlink(temp_file.name)  # Delete temp file
+
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=400,
+            chunk_overlap=100,
+            separators=["\n\n", "\n", ".", "?", "!", " ", ""],
+        )
+        splits = text_splitter.split_documents(docs)
+        s.set(rows=len(splits))
+    return splits
+
+
+def embed_documents(texts: list[str]) -> list[list[float]]:
+    return [embed(text, url=EMBEDDINGS_URL, model=EMBEDDING_MODEL) for text in texts]
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=400,
-        chunk_overlap=100,
-        separators=["\n\n", "\n", ".", "?", "!", " ", ""],
-    )
-    return text_splitter.split_documents(docs)
 
+def get_vector_collection():
+    if VECTOR_BACKEND == "mmap":
+        from vector_store import open_store
+
+        # Same upsert / query interface, without Chroma's client startup and SQLite metadata
+        return open_store("./demo-rag-vectors", embedding_function=embed_documents, dtype=VECTOR_DTYPE)
+
+    import chromadb
+    from chromadb.utils.embedding_functions.ollama_embedding_function import OllamaEmbeddingFunction
 
-def get_vector_collection() -> chromadb.Collection:
     ollama_ef = OllamaEmbeddingFunction(
-        url="http://192.168.5.201:11434/api/embeddings",
-        model_name="nomic-embed-text:latest",
+        url=EMBEDDINGS_URL,
+        model_name=EMBEDDING_MODEL,
     )
 
     chroma_client = chromadb.PersistentClient(path="./demo-rag-chroma")
@@ -73,30 +108,40 @@ def add_to_vector_collection(all_splits: list[Document], file_name: str):
         metadatas.append(split.metadata)
         ids.append(f"{file_name}_{idx}")
 
-    collection.upsert(
-        documents=documents,
-        metadatas=metadatas,
-        ids=ids,
-    )
+    # The collection embeds the chunks through Ollama inside upsert
+    with span("embedding.index") as s:
+        collection.upsert(
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids,
+        )
+        s.set(rows=len(documents))
     st.success("Data added to the vector store!")
 
 
 def query_collection(prompt: str, n_results: int = 10):
     collection = get_vector_collection()
-    results = collection.query(query_texts=[prompt], n_results=n_results)
+    # Includes embedding the question
+    with span("retrieval") as s:
+        results = collection.query(query_texts=[prompt], n_results=n_results)
+        s.set(rows=len(results.get("documents")[0]))
     return results
 
 
 OLLAMA_URL = "http://localhost:11434/api/generate"  # Ollama's API URL
+ANSWER_MODEL = "deepseek-r1:8b"
 
 def call_llm(context: str, prompt: str):
     payload = {
-        "model": "deepseek-r1:8b",
+        "model": ANSWER_MODEL,
         "prompt": f"Context: {context}, Question: {prompt}",
         "system": system_prompt,
         "stream": False,  # Disable streaming
     }
-    response = requests.post(OLLAMA_URL, json=payload)
+    with span("llm.answer", model=payload["model"]) as s:
+        response = requests.post(OLLAMA_URL, json=payload)
+        if response.status_code == 200:
+            s.set(tokens=llm_tokens(response.json()))
     if response.status_code == 200:
         return response.json().get("response", "Error: No response from LLM")
     else:
@@ -104,11 +149,15 @@ def call_llm(context: str, prompt: str):
 
 def re_rank_cross_encoders(documents: list[str]) -> tuple[str, list[int]]:
    
+    from reranker import RERANK_BACKEND, get_reranker
+
     relevant_text = ""
     relevant_text_ids = []
 
-    encoder_model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-    ranks = encoder_model.rank(prompt, documents, top_k=3)
+    # torch (CrossEncoder) or onnx (int8-quantized), loaded once per process
+    with span("rerank", backend=RERANK_BACKEND) as s:
+        ranks = get_reranker().rank(prompt, documents, top_k=3)
+        s.set(rows=len(documents))
     for rank in ranks:
         relevant_text += documents[rank["corpus_id"]]
         relevant_text_ids.append(rank["corpus_id"])
@@ -116,7 +165,29 @@ def re_rank_cross_encoders(documents: list[str]) -> tuple[str, list[int]]:
     return relevant_text, relevant_text_ids
 
 
+def warm_up():
+    """Import the document pipeline, open the vector store and load the models after the first render"""
+    def load_reranker():
+        from reranker import get_reranker
+
+        get_reranker()
+
+    def load_models():
+        preload(EMBEDDING_MODEL, EMBEDDINGS_URL, embedding=True)
+        preload(ANSWER_MODEL, OLLAMA_URL)
+
+    start_warmup("rag", [
+        ("langchain", lambda: (import_module("langchain_community.document_loaders"),
+                               import_module("langchain_text_splitters"))),
+        ("vector_store", get_vector_collection),
+        ("reranker", load_reranker),
+        ("models", load_models),
+    ])
+
+
 if __name__ == "__main__":
+    start_metrics_server()
+
     # Document Upload Area
     with st.sidebar:
         st.set_page_config(page_title="RAG Question Answer")
@@ -142,10 +213,11 @@ if __name__ == "__main__":
     )
 
     if ask and prompt:
-        results = query_collection(prompt)
-        context = results.get("documents")[0]
-        relevant_text, relevant_text_ids = re_rank_cross_encoders(context)
-        response = call_llm(context=relevant_text, prompt=prompt)
+        with request_context(app="rag"):
+            results = query_collection(prompt)
+            context = results.get("documents")[0]
+            relevant_text, relevant_text_ids = re_rank_cross_encoders(context)
+            response = call_llm(context=relevant_text, prompt=prompt)
         st.write(response)
 
         with st.expander("See retrieved documents"):
@@ -154,3 +226,6 @@ if __name__ == "__main__":
         with st.expander("See most relevant document ids"):
             st.write(relevant_text_ids)
             st.write(relevant_text)
+
+    # Preload in the background once the page is on screen
+    warm_up()
@@ -0,0 +1,117 @@
+"""Benchmark LIKE '%x%' text search against the FTS5 index on a synthetic incidents table.
+
+Builds a throwaway database with --rows synthetic incidents (default 1M), times the
+index build and insert overhead, then runs the prompt's keyword searches both as
+LIKE chains and through rewrite_like_to_fts().
+
+Usage:
+    python benchmarks/bench_fts.py [--rows 1000000] [--db /tmp/bench_fts.db]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fts_index import ensure_fts_index, rewrite_like_to_fts  # noqa: E402
+
+# (reason, relative frequency) -- specific causes are rare, as in the real exports
+REASONS = [
+    ("Others : Client end Power Outage/Ckt Breaker Trip/Others", 30),
+    ("Link flapping, optical power low", 25),
+    ("Unknown, link restored automatically", 25),
+    ("Fiber cut due to road construction", 8),
+    ("Cable cut by miscreants near bridge", 4),
+    ("Voltage drop at POP, rectifier fault", 4),
+    ("Theft of battery bank at site", 0.5),
+    ("Fire at BTS site, smoke reported by guard", 0.2),
+]
+REMARKS = [
+    "oss_bot(NOC) : link is down",
+    "field team dispatched, waiting for access",
+    "splicing done, link is up now",
+    "client informed, please check and close tt",
+]
+
+QUERIES = {
+    "fire": "SELECT COUNT(*) FROM incidents WHERE client_name = 'GP' AND (LOWER(reason) LIKE '%fire%' OR LOWER(reason) LIKE '%burn%' OR LOWER(reason) LIKE '%smoke%' OR LOWER(reason) LIKE '%flames%')",
+    "cable cut": "SELECT COUNT(*) FROM incidents WHERE (LOWER(reason) LIKE '%cable cut%' OR LOWER(reason) LIKE '%fiber cut%' OR LOWER(reason) LIKE '%line break%')",
+    "power": "SELECT COUNT(*) FROM incidents WHERE (LOWER(reason) LIKE '%voltage drop%' OR LOWER(remarks) LIKE '%electric failure%')",
+    "theft": "SELECT incident_id, event_time, reason FROM incidents WHERE client_name = 'GP' AND LOWER(reason) LIKE '%theft%'",
+}
+
+
+def build(path, rows):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE incidents (incident_id TEXT, client_name TEXT, event_time TEXT, reason TEXT, "
+        "remarks TEXT, task_comments TEXT, client_comments TEXT, task_resolutions TEXT)"
+    )
+    rng = random.Random(7)
+    reasons, weights = zip(*REASONS)
+    batch = []
+    start = time.perf_counter()
+    for i in range(rows):
+        reason = rng.choices(reasons, weights)[0]
+        remark = rng.choice(REMARKS)
+        batch.append((
+            str(2_000_000 + i), rng.choice(["GP", "Banglalink", "Robi", "Teletalk"]),
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 00:00:00",
+            reason, remark, f"[noc][{i}] {remark} || {reason}", f"[client] {remark}", reason,
+        ))
+        if len(batch) == 50_000:
+            conn.executemany("INSERT INTO incidents VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO incidents VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    load_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ensure_fts_index(conn)
+    index_s = time.perf_counter() - start
+    return conn, load_s, index_s
+
+
+def timed(conn, sql, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(sql).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best, len(result) if len(result) != 1 else result[0][0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", default="/tmp/bench_fts.db")
+    args = parser.parse_args()
+
+    conn, load_s, index_s = build(args.db, args.rows)
+    print(f"rows: {args.rows:,}  load: {load_s:.1f}s  fts build: {index_s:.1f}s  db size: {os.path.getsize(args.db) / 2**20:.0f} MiB")
+
+    # Incremental cost of keeping the index in sync through the triggers
+    start = time.perf_counter()
+    with conn:
+        conn.executemany(
+            "INSERT INTO incidents VALUES (?, 'GP', '2025-01-01 00:00:00', ?, 'x', 'x', 'x', 'x')",
+            [(str(9_000_000 + i), REASONS[i % len(REASONS)][0]) for i in range(10_000)],
+        )
+    print(f"10k inserts with fts triggers: {time.perf_counter() - start:.2f}s")
+
+    print(f"{'query':<10} {'LIKE s':>8} {'FTS s':>8} {'speedup':>8} {'LIKE rows':>10} {'FTS rows':>10}")
+    for name, sql in QUERIES.items():
+        like_s, like_rows = timed(conn, sql)
+        fts_s, fts_rows = timed(conn, rewrite_like_to_fts(sql))
+        print(f"{name:<10} {like_s:>8.3f} {fts_s:>8.3f} {like_s / fts_s:>7.1f}x {like_rows:>10} {fts_rows:>10}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Import-time profile of the Streamlit apps' cold start, with a check.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter for
+each app module (importing main.py, demo.py or app.py executes everything the
+first render needs before ``main()``), --runs times, keeping the fastest run.
+Reports the total and the cumulative time of each direct import, and then
+checks that none of the HEAVY libraries is imported at startup by the app's
+own code. Heavy libraries that arrive through streamlit itself are listed but
+allowed. Exits with status 1 if a check fails, or if --budget-ms is given and
+an app's total exceeds it.
+
+Usage:
+    python benchmarks/bench_import_time.py [--modules main,demo,app] [--runs 3] [--top 12] [--budget-ms 1500]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that must only load when the feature using them runs (or in warm-up)
+HEAVY = [
+    "pandas", "numpy", "sqlalchemy", "openpyxl", "chromadb", "sentence_transformers",
+    "torch", "transformers", "onnxruntime", "tokenizers", "langchain_community", "langchain_core",
+    "langchain_text_splitters", "fitz", "pymupdf",
+]
+# Direct imports whose own dependencies are outside the apps' control
+ALLOWED_VIA = {"streamlit"}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def profile(module, python=sys.executable):
+    """``[(depth, name, self_us, cumulative_us)]`` for the import of ``module`` (depth 0 = the module)"""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    lines = result.stderr.splitlines()
+    if result.returncode:
+        raise RuntimeError(next((line for line in reversed(lines) if line.strip()), "import failed"))
+    entries = []
+    for line in lines:
+        found = _LINE_RE.match(line)
+        if found:
+            entries.append((len(found.group(3)) // 2, found.group(4), int(found.group(1)), int(found.group(2))))
+    # Output is post-order: the module's own line comes after everything it imported
+    end = max(i for i, entry in enumerate(entries) if entry[0] == 0 and entry[1] == module)
+    start = end
+    while start > 0 and entries[start - 1][0] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+
+def direct_imports(entries):
+    """``{name: (cumulative_us, direct import it came through)}`` for every module in the profile"""
+    via, ancestors = {}, {}
+    for depth, name, _, cumulative in reversed(entries):
+        ancestors[depth] = name
+        via[name] = (cumulative, ancestors.get(1, name))
+    return via
+
+
+def check(module, entries, top):
+    """Print the report for one module; returns the list of violations"""
+    total_ms = entries[-1][3] / 1000
+    via = direct_imports(entries)
+    print(f"{module}: {total_ms:.0f} ms, {len(entries) - 1} modules")
+    direct = sorted((entry for entry in entries if entry[0] == 1), key=lambda entry: -entry[3])
+    for _, name, _, cumulative in direct[:top]:
+        print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    violations = []
+    for name in HEAVY:
+        if name not in via:
+            continue
+        cumulative, importer = via[name]
+        allowed = importer in ALLOWED_VIA
+        source = "directly" if importer == name else f"via {importer}"
+        print(f"  {'note' if allowed else 'FAIL'}: {name} ({cumulative / 1000:.0f} ms) imported at startup {source}")
+        if not allowed:
+            violations.append(f"{module} imports {name} {source}")
+    return violations, total_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", default="main,demo,app", help="comma-separated modules to profile")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per module; the fastest is kept")
+    parser.add_argument("--top", type=int, default=12, help="direct imports listed per module")
+    parser.add_argument("--budget-ms", type=float, help="fail if a module's total import time exceeds this")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules.split(","):
+        try:
+            runs = [profile(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module}: cannot be imported here ({e})")
+            failures.append(f"{module} failed to import")
+            continue
+        violations, total_ms = check(module, min(runs, key=lambda entries: entries[-1][3]), args.top)
+        failures += violations
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            failures.append(f"{module} takes {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if failures:
+        print("\n".join(["", "FAILED:"] + [f"  {failure}" for failure in failures]))
+        sys.exit(1)
+    print("\nOK: no heavy imports at startup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Measure SQL-generation prefill time with and without system-prompt reuse.
+
+Runs every question in text_csv_db.txt through three request layouts:
+
+- legacy: the old single /api/generate prompt with client and question embedded
+- cold:   the chat layout, but with a unique nonce at the start of the system
+          message so Ollama can never reuse the cached prefix
+- cached: the chat layout with the stable system message used by main.py
+
+Usage:
+    python benchmarks/bench_prompt_cache.py [--rounds 2] [--client GP]
+"""
+import argparse
+import os
+import statistics
+import sys
+import uuid
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from noc_service import SQL_MODEL, SQL_SYSTEM_PROMPT, build_sql_prompt  # noqa: E402
+from ollama_client import OLLAMA_KEEP_ALIVE, OLLAMA_URL, post_chat, prefill_stats  # noqa: E402
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "text_csv_db.txt")
+
+
+def run_legacy(client, question):
+    payload = {
+        "model": SQL_MODEL,
+        "prompt": SQL_SYSTEM_PROMPT + build_sql_prompt(client, question),
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+    }
+    return requests.post(OLLAMA_URL, json=payload).json()
+
+
+def run_chat(client, question, bust_cache=False):
+    system_prompt = SQL_SYSTEM_PROMPT
+    if bust_cache:
+        system_prompt = f"[request {uuid.uuid4()}]\n{system_prompt}"
+    user_prompt = build_sql_prompt(client, question)
+    return post_chat(OLLAMA_URL, SQL_MODEL, system_prompt, user_prompt).json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--client", default="GP")
+    args = parser.parse_args()
+
+    with open(QUESTIONS_FILE) as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    modes = {
+        "legacy": lambda q: run_legacy(args.client, q),
+        "cold": lambda q: run_chat(args.client, q, bust_cache=True),
+        "cached": lambda q: run_chat(args.client, q),
+    }
+
+    # Warm the model once so load time is not attributed to the first mode
+    run_chat(args.client, questions[0])
+
+    print(f"{'mode':<8} {'requests':>8} {'prompt tok (avg)':>17} {'prefill ms p50':>15} {'prefill ms p95':>15}")
+    for name, run in modes.items():
+        stats = [prefill_stats(run(q)) for _ in range(args.rounds) for q in questions]
+        prefill = sorted(s["prefill_ms"] for s in stats)
+        tokens = statistics.mean(s["prompt_tokens"] for s in stats)
+        p95 = prefill[min(len(prefill) - 1, int(len(prefill) * 0.95))]
+        print(f"{name:<8} {len(stats):>8} {tokens:>17.0f} {statistics.median(prefill):>15.1f} {p95:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
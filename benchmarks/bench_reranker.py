@@ -0,0 +1,120 @@
+"""Benchmark the quantized ONNX reranker against the PyTorch CrossEncoder.
+
+Splits readme.md into paragraph chunks and, for each question below and each
+candidate count in --docs, reranks the --docs chunks sharing the most words
+with the question (as a retriever would return them). Reports p50 / p95
+rerank latency per backend and, for the ONNX path, how closely its ranking
+follows PyTorch: Kendall tau over all candidates and overlap of the top 3
+(the chunks app.py passes to the LLM). --threads sweeps the onnxruntime
+intra-op thread count; PyTorch uses the same count via torch.set_num_threads.
+
+Usage:
+    python benchmarks/bench_reranker.py [--docs 10,25,50] [--threads 1,2,4] [--rounds 3]
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reranker import OnnxReranker, TorchReranker  # noqa: E402
+
+README = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "readme.md")
+TOP = 3
+
+QUESTIONS = [
+    "How do I install and start Ollama?",
+    "Which models are used for SQL generation and chat?",
+    "How are GP users prevented from seeing Banglalink incidents?",
+    "What happens when an uploaded file contains duplicate incident ids?",
+    "How does the assistant remember the previous result for follow-up questions?",
+    "Why is full-text search faster than LIKE queries?",
+    "What does the query plan guard do with expensive queries?",
+    "How can I see p95 latency per pipeline stage?",
+    "How do I run the load test against the HTTP API?",
+    "What should I check when the LLM service connection fails?",
+]
+
+
+def chunks(path=README):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    return [chunk.strip() for chunk in re.split(r"\n\s*\n", text) if len(chunk.split()) >= 8]
+
+
+def candidates(question, corpus, n):
+    words = set(re.findall(r"\w{4,}", question.lower()))
+    overlap = [len(words & set(re.findall(r"\w{4,}", chunk.lower()))) for chunk in corpus]
+    return [corpus[i] for i in sorted(range(len(corpus)), key=lambda i: -overlap[i])[:n]]
+
+
+def kendall_tau(a, b):
+    """Kendall tau-a between two score lists over the same items"""
+    n = len(a)
+    concordant = discordant = 0
+    for i in range(n):
+        for j in range(i + 1, n):
+            sign = (a[i] - a[j]) * (b[i] - b[j])
+            concordant += sign > 0
+            discordant += sign < 0
+    pairs = n * (n - 1) / 2
+    return (concordant - discordant) / pairs if pairs else 1.0
+
+
+def top_ids(scores, k=TOP):
+    return set(sorted(range(len(scores)), key=lambda i: -scores[i])[:k])
+
+
+def timed_scores(reranker, question, documents, rounds):
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        scores = reranker.scores(question, documents)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return list(scores), latencies
+
+
+def p95(values):
+    values = sorted(values)
+    return values[int(0.95 * (len(values) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", default="10,25,50", help="comma-separated candidate counts")
+    parser.add_argument("--threads", default="1,2,4", help="comma-separated intra-op thread counts")
+    parser.add_argument("--rounds", type=int, default=3, help="timed runs per question")
+    args = parser.parse_args()
+
+    import torch
+
+    corpus = chunks()
+    print(f"chunks: {len(corpus)}  questions: {len(QUESTIONS)}")
+    torch_model = TorchReranker()
+    print(f"{'docs':>4} {'threads':>7} {'torch p50':>9} {'torch p95':>9} {'onnx p50':>8} {'onnx p95':>8} "
+          f"{'speedup':>7} {'tau':>6} {'top3':>5}")
+    for threads in [int(t) for t in args.threads.split(",")]:
+        torch.set_num_threads(threads)
+        onnx_model = OnnxReranker(threads=threads)
+        for n in [int(d) for d in args.docs.split(",")]:
+            torch_ms, onnx_ms, taus, overlaps = [], [], [], []
+            for question in QUESTIONS:
+                documents = candidates(question, corpus, n)
+                torch_model.scores(question, documents)  # Warm-up
+                onnx_model.scores(question, documents)
+                reference, latencies = timed_scores(torch_model, question, documents, args.rounds)
+                torch_ms += latencies
+                scores, latencies = timed_scores(onnx_model, question, documents, args.rounds)
+                onnx_ms += latencies
+                taus.append(kendall_tau(reference, scores))
+                overlaps.append(len(top_ids(reference) & top_ids(scores)) / min(TOP, len(documents)))
+            torch_p50, onnx_p50 = statistics.median(torch_ms), statistics.median(onnx_ms)
+            print(f"{n:>4} {threads:>7} {torch_p50:>9.1f} {p95(torch_ms):>9.1f} {onnx_p50:>8.1f} {p95(onnx_ms):>8.1f} "
+                  f"{torch_p50 / onnx_p50:>6.1f}x {statistics.mean(taus):>6.3f} {statistics.mean(overlaps):>5.2f}")
+
+
+if __name__ == "__main__":
+    main()
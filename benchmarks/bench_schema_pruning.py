@@ -0,0 +1,119 @@
+"""Compare full-schema and pruned-schema SQL prompts on the text_csv_db.txt questions.
+
+Always reports prompt token counts per question and how many of the columns the
+reference query needs survive pruning (``cols``). With ``--db`` it also asks the
+SQL model for a query in both modes, executes it and compares the result set
+with a hand-written reference query (order-insensitive, column names ignored).
+
+Usage:
+    python benchmarks/bench_schema_pruning.py [--db noc_incidents.db] [--top-n 12]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from noc_service import SQL_GENERATION_PROMPT, SQL_MODEL, SQL_SYSTEM_PROMPT  # noqa: E402
+from ollama_client import OLLAMA_URL, message_content, post_chat  # noqa: E402
+from schema_catalog import COLUMN_NAMES, estimate_tokens, format_schema, select_columns  # noqa: E402
+from sql_templates import format_examples  # noqa: E402
+
+CLIENT = "ALL"
+
+# Reference SQL for each question in text_csv_db.txt, in file order
+REFERENCE_SQL = [
+    "SELECT client_name, COUNT(*) FROM incidents GROUP BY client_name ORDER BY COUNT(*) DESC LIMIT 5",
+    "SELECT link_name_nttn, COUNT(*) FROM incidents GROUP BY link_name_nttn",
+    "SELECT * FROM incidents WHERE event_time >= '2024-07-01' AND event_time < '2024-08-01'",
+    "SELECT client_name, COUNT(*) FROM incidents WHERE client_priority = 'VVIP' GROUP BY client_name ORDER BY COUNT(*) DESC LIMIT 5",
+    "SELECT AVG((julianday(clear_time) - julianday(event_time)) * 24 * 60) FROM incidents WHERE clear_time IS NOT NULL AND clear_time != ''",
+    "SELECT district, COUNT(*) FROM incidents GROUP BY district ORDER BY COUNT(*) DESC",
+    "SELECT client_name, COUNT(*) FROM incidents GROUP BY client_name, reason HAVING COUNT(*) > 1 ORDER BY COUNT(*) DESC LIMIT 10",
+    "SELECT * FROM incidents WHERE LOWER(fault_status) != 'closed'",
+    "SELECT * FROM incidents WHERE (julianday(escalation_time) - julianday(event_time)) * 24 * 60 > 10",
+    "SELECT client_name, SUM(CAST(duration AS REAL)) FROM incidents GROUP BY client_name ORDER BY SUM(CAST(duration AS REAL)) DESC LIMIT 5",
+]
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "text_csv_db.txt")
+
+
+def build_prompt(question, columns):
+    return SQL_GENERATION_PROMPT.format(
+        schema=format_schema(columns), examples=format_examples(None), client=CLIENT, question=question
+    )
+
+
+def referenced_columns(sql):
+    return {name for name in COLUMN_NAMES if re.search(rf"\b{name}\b", sql)}
+
+
+def result_set(conn, sql):
+    rows = conn.execute(sql).fetchall()
+    return sorted(tuple("" if v is None else str(v) for v in row) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="SQLite database to execute generated SQL against")
+    parser.add_argument("--top-n", type=int, default=12)
+    args = parser.parse_args()
+
+    with open(QUESTIONS_FILE) as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    conn = sqlite3.connect(args.db) if args.db else None
+    system_tokens = estimate_tokens(SQL_SYSTEM_PROMPT)
+    totals = {"full": [0, 0, 0.0], "pruned": [0, 0, 0.0]}  # tokens, correct, seconds
+    recall = [0, 0]  # reference columns kept, needed
+
+    print(f"system prompt: ~{system_tokens} tokens (shared, prefix-cached)")
+    print(f"{'#':>2} {'full tok':>8} {'pruned tok':>10} {'cols':>5} {'full ok':>7} {'pruned ok':>9}  question")
+    for i, question in enumerate(questions):
+        columns = select_columns(question, top_n=args.top_n)
+        prompts = {
+            "full": build_prompt(question, None),
+            "pruned": build_prompt(question, columns),
+        }
+        cols = "-"
+        if i < len(REFERENCE_SQL):
+            needed = referenced_columns(REFERENCE_SQL[i])
+            kept = len(needed & set(columns))
+            recall[0] += kept
+            recall[1] += len(needed)
+            cols = f"{kept}/{len(needed)}"
+        row = {}
+        for mode, prompt in prompts.items():
+            tokens = estimate_tokens(prompt)
+            totals[mode][0] += tokens
+            ok = "-"
+            if conn is not None and i < len(REFERENCE_SQL):
+                start = time.perf_counter()
+                response = post_chat(OLLAMA_URL, SQL_MODEL, SQL_SYSTEM_PROMPT, prompt)
+                totals[mode][2] += time.perf_counter() - start
+                sql = message_content(response.json()).strip()
+                try:
+                    ok = result_set(conn, sql) == result_set(conn, REFERENCE_SQL[i])
+                except sqlite3.Error:
+                    ok = False
+                totals[mode][1] += int(ok)
+            row[mode] = (tokens, ok)
+        print(
+            f"{i + 1:>2} {row['full'][0]:>8} {row['pruned'][0]:>10} {cols:>5} "
+            f"{str(row['full'][1]):>7} {str(row['pruned'][1]):>9}  {question}"
+        )
+
+    n = len(questions)
+    for mode, (tokens, correct, seconds) in totals.items():
+        line = f"{mode:<7} avg prompt tokens: {tokens / n:.0f}"
+        if conn is not None:
+            line += f"  accuracy: {correct}/{min(n, len(REFERENCE_SQL))}  avg latency: {seconds / n:.2f}s"
+        print(line)
+    print(f"reference columns kept by pruning: {recall[0]}/{recall[1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark recall and latency of the mmap vector store against Chroma.
+
+Generates --rows clustered unit vectors (default 100k x 768, like
+nomic-embed-text) and --queries perturbed copies, computes the exact float32
+top-10 for each query, then measures recall@10, p50 / p95 query latency, build
+time and size on disk for
+
+    fp16 exact   MmapVectorStore, float16, brute-force scan
+    int8 exact   MmapVectorStore, int8 + per-row scale, brute-force scan
+    fp16 ivf     MmapVectorStore, float16, IVF index (--nprobe lists)
+    int8 ivf     MmapVectorStore, int8, IVF index
+    chroma       chromadb PersistentClient, cosine HNSW (skipped if not installed)
+
+All backends get the same precomputed embeddings, so no embedding model is
+needed.
+
+Usage:
+    python benchmarks/bench_vector_store.py [--rows 100000] [--dim 768] [--queries 200] [--nprobe 0]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import MmapVectorStore, _normalize  # noqa: E402
+
+K = 10
+BATCH = 5000
+
+
+def synthetic_vectors(rows, dim, queries, seed=0):
+    """Unit vectors around rows // 100 topic centroids, plus noisy copies of random rows as queries"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(max(1, rows // 100), dim)).astype(np.float32)
+    vectors = centroids[rng.integers(0, len(centroids), rows)]
+    vectors += 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    vectors = _normalize(vectors)
+    picked = vectors[rng.choice(rows, queries, replace=False)]
+    return vectors, _normalize(picked + 0.02 * rng.normal(size=picked.shape).astype(np.float32))
+
+
+def ground_truth(vectors, queries):
+    return [set(np.argpartition(-(vectors @ query), K)[:K]) for query in queries]
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measure(search, queries, truth):
+    """(recall@K, p50 ms, p95 ms) for search(query) -> row numbers"""
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & set(rows))
+    latencies.sort()
+    return hits / (K * len(queries)), statistics.median(latencies), latencies[int(0.95 * (len(latencies) - 1))]
+
+
+def build_mmap(path, vectors, dtype, indexed, nprobe):
+    shutil.rmtree(path, ignore_errors=True)
+    start = time.perf_counter()
+    # Index once after loading rather than at every rebuild point on the way
+    store = MmapVectorStore(path, dtype=dtype, ann_threshold=len(vectors) + 1, nprobe=nprobe)
+    for offset in range(0, len(vectors), BATCH):
+        batch = vectors[offset:offset + BATCH]
+        store.upsert([str(offset + i) for i in range(len(batch))], embeddings=batch)
+    if indexed:
+        store.build_index()
+    return store, time.perf_counter() - start
+
+
+def bench_chroma(path, vectors, queries, truth):
+    try:
+        import chromadb
+    except ImportError:
+        return None
+    shutil.rmtree(path, ignore_errors=True)
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=path).create_collection("bench", metadata={"hnsw:space": "cosine"})
+    for offset in range(0, len(vectors), BATCH):
+        batch = vectors[offset:offset + BATCH]
+        collection.add(ids=[str(offset + i) for i in range(len(batch))], embeddings=batch.tolist())
+    build_s = time.perf_counter() - start
+
+    def search(query):
+        ids = collection.query(query_embeddings=[query.tolist()], n_results=K)["ids"][0]
+        return [int(i) for i in ids]
+
+    return measure(search, queries, truth), build_s
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=0, help="IVF lists probed (0 = store default)")
+    parser.add_argument("--dir", default="/tmp/bench_vector_store")
+    args = parser.parse_args()
+
+    vectors, queries = synthetic_vectors(args.rows, args.dim, args.queries)
+    truth = ground_truth(vectors, queries)
+    print(f"rows: {args.rows:,}  dim: {args.dim}  queries: {args.queries}  float32 size: {vectors.nbytes / 2**20:.0f} MiB")
+
+    print(f"{'backend':<12} {'recall@10':>9} {'p50 ms':>8} {'p95 ms':>8} {'build s':>8} {'disk MiB':>9}")
+    configs = [
+        ("fp16 exact", "float16", False),
+        ("int8 exact", "int8", False),
+        ("fp16 ivf", "float16", True),
+        ("int8 ivf", "int8", True),
+    ]
+    for name, dtype, indexed in configs:
+        path = os.path.join(args.dir, name.replace(" ", "_"))
+        store, build_s = build_mmap(path, vectors, dtype, indexed, args.nprobe)
+        recall, p50, p95 = measure(lambda query: [row for row, _ in store.search(query, K)], queries, truth)
+        print(f"{name:<12} {recall:>9.3f} {p50:>8.2f} {p95:>8.2f} {build_s:>8.1f} {directory_size(path) / 2**20:>9.0f}")
+
+    path = os.path.join(args.dir, "chroma")
+    chroma = bench_chroma(path, vectors, queries, truth)
+    if chroma is None:
+        print("chroma: chromadb not installed, skipped")
+    else:
+        (recall, p50, p95), build_s = chroma
+        print(f"{'chroma':<12} {recall:>9.3f} {p50:>8.2f} {p95:>8.2f} {build_s:>8.1f} {directory_size(path) / 2**20:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
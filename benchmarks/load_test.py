@@ -0,0 +1,542 @@
+"""Concurrent-user load test of the NOC assistant pipeline.
+
+Simulates N logged-in operators (cycling through the accounts in USER_DB), each
+replaying a mix of new questions, follow-ups on their previous result and
+incident chats with some think time in between. Concurrency ramps through the
+``--concurrency`` steps; every step reports throughput, latency percentiles,
+the error rate and SQLite lock contention ("database is locked" errors and the
+latency of a background writer upserting batches while the users read).
+
+By default the pipeline runs in-process (``NocService``, as inside one
+Streamlit or API worker) against the bundled Ollama stub (stub_ollama.py) and
+a synthetic incidents database, and the report adds p95 per pipeline stage.
+With ``--api`` it drives a running ``api.py`` instead.
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 1,2,4,8,16] [--duration 20] [--out run.json]
+    python benchmarks/load_test.py --baseline old.json --out new.json   # run, then compare
+    python benchmarks/load_test.py --compare old.json new.json          # compare saved runs
+
+Against the HTTP API with several workers:
+    python benchmarks/load_test.py --build-only --db /tmp/loadtest.db
+    python benchmarks/stub_ollama.py --port 11500 &
+    OLLAMA_URL=http://127.0.0.1:11500/api/generate DATABASE_PATH=/tmp/loadtest.db python api.py --workers 4 &
+    python benchmarks/load_test.py --api http://127.0.0.1:8000 --db /tmp/loadtest.db
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Project modules read OLLAMA_URL etc. at import time, so they are imported after main() sets them
+import stub_ollama  # noqa: E402
+
+QUESTIONS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "text_csv_db.txt")
+
+CLIENTS = [("GP", 35), ("Banglalink", 25), ("Robi", 15), ("Teletalk", 10), ("Summit", 8), ("Fiber@Home", 7)]
+DISTRICTS = ["Dhaka", "Chittagong", "Sylhet", "Khulna", "Rajshahi", "Barisal", "Rangpur", "Mymensingh", "Comilla", "Bogra"]
+REASONS = [
+    ("Others : Client end Power Outage/Ckt Breaker Trip/Others", 30),
+    ("Link flapping, optical power low", 25),
+    ("Unknown, link restored automatically", 25),
+    ("Fiber cut due to road construction", 8),
+    ("Cable cut by miscreants near bridge", 4),
+    ("Voltage drop at POP, rectifier fault", 4),
+    ("Theft of battery bank at site", 1),
+    ("Fire at BTS site, smoke reported by guard", 0.5),
+]
+
+EXTRA_QUESTIONS = [
+    "Show the latest incidents",
+    "Are there any open incidents?",
+    "Which incidents were caused by fire?",
+    "List cable cut incidents",
+    "Show power outage incidents in july 2024",
+    "Which districts have the most incidents?",
+]
+FOLLOWUPS = [
+    "how many of those?",
+    "which of those are in Dhaka",
+    "which of them are still open",
+    "group those by district",
+    "what was the reason for the previous result",
+    "which of those had the longest duration",
+]
+CHATS = [
+    "What caused this incident?",
+    "How long did it take to resolve?",
+    "Who closed the ticket?",
+]
+# Relative frequency of each action
+MIX = {"question": 60, "followup": 25, "chat": 15}
+
+LOCK_MARKERS = ("database is locked", "database table is locked", "busy")
+
+
+# Synthetic database
+
+def synthetic_incidents(rows, seed=7, start_id=3_000_000):
+    """DataFrame of incident rows with the real column names and plausible values"""
+    from schema_catalog import COLUMN_NAMES
+
+    rng = random.Random(seed)
+    clients, client_weights = zip(*CLIENTS)
+    reasons, reason_weights = zip(*REASONS)
+    base = datetime(2024, 1, 1)
+    records = []
+    for i in range(rows):
+        event = base + timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+        hours = round(rng.expovariate(1 / 3), 4)
+        is_open = rng.random() < 0.08
+        link = f"LNK{rng.randint(1, 400):04d}_A to LNK{rng.randint(1, 400):04d}_B"
+        reason = rng.choices(reasons, reason_weights)[0]
+        record = dict.fromkeys(COLUMN_NAMES, "")
+        record.update({
+            "incident_id": str(start_id + i),
+            "ticket_id": str(start_id + 500_000 + i),
+            "incident_title": f"Auto Ticket: {link} is down",
+            "client_name": rng.choices(clients, client_weights)[0],
+            "link_name_nttn": link,
+            "issue_type": rng.choice(["NTTN", "Gateway"]),
+            "client_priority": rng.choice(["VVIP", "VIP", "Normal", "Normal"]),
+            "problem_category": rng.choice(["Link Down", "Link Down", "Degradation"]),
+            "reason": reason,
+            "event_time": event.strftime("%Y-%m-%d %H:%M:%S"),
+            "escalation_time": (event + timedelta(minutes=rng.randint(1, 30))).strftime("%Y-%m-%d %H:%M:%S"),
+            "clear_time": "" if is_open else (event + timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S"),
+            "remarks": f"oss_bot(NOC) : {link} is down",
+            "task_comments": f"[noc][{i}] field team dispatched || {reason}",
+            "fault_status": "open" if is_open else "closed",
+            "district": rng.choice(DISTRICTS),
+            "duration": "" if is_open else str(hours),
+            "task_resolutions": reason,
+        })
+        records.append(record)
+    return pd.DataFrame.from_records(records, columns=COLUMN_NAMES)
+
+
+def build_database(path, rows, seed=7):
+    """Create the synthetic database through the regular upsert path (indexes, FTS, stats)"""
+    from incident_ingest import upsert_incidents
+
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    start = time.perf_counter()
+    frames = (synthetic_incidents(min(50_000, rows - offset), seed + offset, 3_000_000 + offset)
+              for offset in range(0, rows, 50_000))
+    upsert_incidents(path, frames, source="load_test")
+    return time.perf_counter() - start
+
+
+def incident_ids_by_client(path, per_client=200):
+    conn = sqlite3.connect(path)
+    try:
+        ids = {}
+        for client, incident_id in conn.execute(
+            "SELECT client_name, incident_id FROM incidents ORDER BY RANDOM() LIMIT ?", (per_client * 20,)
+        ):
+            ids.setdefault(client, []).append(incident_id)
+        return ids
+    finally:
+        conn.close()
+
+
+def load_questions():
+    with open(QUESTIONS_FILE) as f:
+        questions = [line.strip() for line in f if line.strip()]
+    return questions + EXTRA_QUESTIONS
+
+
+# Drivers: the same calls in-process or over HTTP, each returning (status, error text)
+
+class ServiceDriver:
+    """Runs requests through NocService in this process"""
+
+    def __init__(self, database_path):
+        from noc_service import NocService
+
+        self.service = NocService(database_path)
+
+    def login(self, username, password):
+        return self.service.login(username, password)
+
+    def query(self, user, session_id, question):
+        answer = self.service.ask(user, session_id, question)
+        return answer.status, answer.extra.get("error"), answer.handle is not None and answer.handle.row_count > 1
+
+    def chat(self, user, session_id, question, incident_id=None):
+        answer = self.service.chat(user, session_id, question, incident_id)
+        return answer.status, answer.extra.get("error"), False
+
+    def ingest(self, user, df):
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False)
+        buffer.seek(0)
+        self.service.ingest(user, buffer, "upsert", "load_test.csv")
+
+
+class HttpDriver:
+    """Runs requests against a running api.py"""
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.http = threading.local()
+
+    def _session(self):
+        if not hasattr(self.http, "session"):
+            self.http.session = requests.Session()
+        return self.http.session
+
+    def _post(self, path, token=None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = self._session().post(self.base_url + path, headers=headers, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def login(self, username, password):
+        return self._post("/login", json={"username": username, "password": password})["token"]
+
+    def query(self, token, session_id, question):
+        data = self._post("/query", token, json={"question": question, "session_id": session_id})
+        return data["status"], data.get("error"), data.get("handle", {}).get("rows", 0) > 1
+
+    def chat(self, token, session_id, question, incident_id=None):
+        data = self._post("/chat", token, json={"question": question, "session_id": session_id,
+                                                 "incident_id": incident_id})
+        return data["status"], data.get("error"), False
+
+    def ingest(self, token, df):
+        buffer = io.BytesIO(df.to_csv(index=False).encode())
+        self._post("/ingest", token, files={"file": ("load_test.csv", buffer, "text/csv")}, data={"mode": "upsert"})
+
+
+# Load generation
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))]
+
+
+def is_lock_error(error):
+    return bool(error) and any(marker in str(error).lower() for marker in LOCK_MARKERS)
+
+
+class VirtualUser(threading.Thread):
+    """One operator: log in, then ask / follow up / chat until the deadline"""
+
+    def __init__(self, driver, username, password, client, questions, incident_ids, deadline, think_ms, seed, results):
+        super().__init__(daemon=True)
+        self.driver = driver
+        self.username = username
+        self.password = password
+        self.client = client
+        self.questions = questions
+        self.incident_ids = incident_ids
+        self.deadline = deadline
+        self.think_ms = think_ms
+        self.rng = random.Random(seed)
+        self.results = results
+        self.session_id = uuid.uuid4().hex
+
+    def _action(self, has_handle):
+        kinds, weights = zip(*MIX.items())
+        kind = self.rng.choices(kinds, weights)[0]
+        if kind == "followup" and not has_handle:
+            kind = "question"
+        return kind
+
+    def run(self):
+        try:
+            user = self.driver.login(self.username, self.password)
+        except Exception as e:
+            self.results.append({"kind": "login", "ms": 0.0, "status": "error", "error": str(e)})
+            return
+        has_handle = False
+        while time.monotonic() < self.deadline:
+            kind = self._action(has_handle)
+            start = time.perf_counter()
+            try:
+                if kind == "question":
+                    status, error, has_handle = self.driver.query(user, self.session_id, self.rng.choice(self.questions))
+                elif kind == "followup":
+                    status, error, has_handle = self.driver.query(user, self.session_id, self.rng.choice(FOLLOWUPS))
+                else:
+                    ids = self.incident_ids.get(self.client) or [None]
+                    status, error, _ = self.driver.chat(user, self.session_id, self.rng.choice(CHATS), self.rng.choice(ids))
+            except Exception as e:
+                status, error = "error", str(e)
+            self.results.append({
+                "kind": kind,
+                "ms": (time.perf_counter() - start) * 1000,
+                "status": status,
+                "error": error,
+            })
+            if self.think_ms:
+                time.sleep(min(self.rng.expovariate(1 / self.think_ms) / 1000, max(0.0, self.deadline - time.monotonic())))
+
+
+class Writer(threading.Thread):
+    """Admin upserting a batch of changed incidents every ``interval`` seconds"""
+
+    def __init__(self, driver, admin, batch, interval, deadline, results):
+        super().__init__(daemon=True)
+        self.driver = driver
+        self.admin = admin
+        self.batch = batch
+        self.interval = interval
+        self.deadline = deadline
+        self.results = results
+
+    def run(self):
+        round_ = 0
+        while time.monotonic() + self.interval < self.deadline:
+            time.sleep(self.interval)
+            batch = self.batch.copy()
+            batch["remarks"] = batch["remarks"] + f" [update {round_}]"
+            round_ += 1
+            start = time.perf_counter()
+            try:
+                self.driver.ingest(self.admin, batch)
+                error = None
+            except Exception as e:
+                error = str(e)
+            self.results.append({"ms": (time.perf_counter() - start) * 1000, "error": error})
+
+
+def _stage_p95():
+    from tracing import tracer
+
+    with tracer._lock:
+        return {stage: round(percentile(list(m.recent), 0.95) * 1000, 1) for stage, m in sorted(tracer.metrics.items())}
+
+
+def _reset_stages():
+    from tracing import tracer
+
+    with tracer._lock:
+        tracer.metrics.clear()
+
+
+def run_step(driver, users, questions, incident_ids, duration, think_ms, writer_options, seed, in_process):
+    from noc_service import USER_DB
+
+    accounts = list(USER_DB.items())
+    results, writes = [], []
+    deadline = time.monotonic() + duration
+    if in_process:
+        _reset_stages()
+    threads = []
+    for i in range(users):
+        username, record = accounts[i % len(accounts)]
+        threads.append(VirtualUser(driver, username, record["password"], record["client"], questions,
+                                   incident_ids, deadline, think_ms, seed + i, results))
+    if writer_options:
+        admin_name = next(name for name, record in accounts if record["role"] == "admin")
+        admin = driver.login(admin_name, USER_DB[admin_name]["password"])
+        threads.append(Writer(driver, admin, writer_options["batch"], writer_options["interval"], deadline, writes))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [r["ms"] for r in results if r["kind"] != "login"]
+    errors = [r for r in results if r["status"] == "error"]
+    step = {
+        "users": users,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 2),
+        "rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "lock_errors": sum(is_lock_error(r["error"]) for r in results) + sum(is_lock_error(w["error"]) for w in writes),
+        "writes": len(writes),
+        "write_errors": sum(1 for w in writes if w["error"]),
+        "write_p95_ms": round(percentile([w["ms"] for w in writes], 0.95), 1),
+        "by_kind": {},
+        "sample_errors": sorted({str(r["error"])[:200] for r in errors})[:5],
+    }
+    for kind in MIX:
+        kind_ms = [r["ms"] for r in results if r["kind"] == kind]
+        if kind_ms:
+            step["by_kind"][kind] = {"requests": len(kind_ms), "p50_ms": round(percentile(kind_ms, 0.5), 1),
+                                     "p95_ms": round(percentile(kind_ms, 0.95), 1)}
+    if in_process:
+        step["stage_p95_ms"] = _stage_p95()
+    return step
+
+
+# Reporting
+
+def capacity(steps, slo_ms, max_error_rate):
+    """Largest number of users whose p95 and error rate stay within the SLO"""
+    within = [s["users"] for s in steps if s["p95_ms"] <= slo_ms and s["error_rate"] <= max_error_rate]
+    return max(within) if within else 0
+
+
+def print_steps(run):
+    print(f"{'users':>6} {'reqs':>6} {'rps':>7} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'err%':>6} "
+          f"{'locked':>6} {'writes':>6} {'write_p95':>9}")
+    for s in run["steps"]:
+        print(f"{s['users']:>6} {s['requests']:>6} {s['rps']:>7.2f} {s['p50_ms']:>8.0f} {s['p95_ms']:>8.0f} "
+              f"{s['p99_ms']:>8.0f} {s['error_rate'] * 100:>6.1f} {s['lock_errors']:>6} {s['writes']:>6} "
+              f"{s['write_p95_ms']:>9.0f}")
+    stages = [s for s in run["steps"] if s.get("stage_p95_ms")]
+    if stages:
+        print("\nStage p95 (ms):")
+        names = [name for name, _ in sorted(stages[-1]["stage_p95_ms"].items(), key=lambda item: -item[1])][:6]
+        print(f"{'users':>6} " + " ".join(f"{name:>14}" for name in names))
+        for s in stages:
+            print(f"{s['users']:>6} " + " ".join(f"{s['stage_p95_ms'].get(name, 0):>14.0f}" for name in names))
+    for s in run["steps"]:
+        for error in s["sample_errors"]:
+            print(f"  [{s['users']} users] {error}")
+    print(f"\nUsers within SLO (p95 <= {run['config']['slo_ms']:.0f} ms, errors <= "
+          f"{run['config']['max_error_rate'] * 100:.0f}%): {run['capacity']}")
+
+
+def _change(old, new):
+    if not old:
+        return "   n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def compare_runs(baseline, candidate):
+    """Print throughput / latency / error changes between two saved runs"""
+    print(f"Baseline:  {baseline['label']} ({baseline['started_at']})")
+    print(f"Candidate: {candidate['label']} ({candidate['started_at']})\n")
+    old_steps = {s["users"]: s for s in baseline["steps"]}
+    print(f"{'users':>6} {'rps':>17} {'':>7} {'p95_ms':>17} {'':>7} {'err%':>13} {'locked':>9}")
+    for new in candidate["steps"]:
+        old = old_steps.get(new["users"])
+        if old is None:
+            continue
+        print(f"{new['users']:>6} {old['rps']:>8.2f}->{new['rps']:<7.2f} {_change(old['rps'], new['rps'])} "
+              f"{old['p95_ms']:>8.0f}->{new['p95_ms']:<7.0f} {_change(old['p95_ms'], new['p95_ms'])} "
+              f"{old['error_rate'] * 100:>5.1f}->{new['error_rate'] * 100:<5.1f} "
+              f"{old['lock_errors']:>4}->{new['lock_errors']:<4}")
+    print(f"\nUsers within SLO: {baseline['capacity']} -> {candidate['capacity']}")
+
+
+def load_run(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="comma-separated user counts to ramp through")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per concurrency step")
+    parser.add_argument("--think-ms", type=float, default=1000, help="mean pause between a user's requests")
+    parser.add_argument("--db", default="/tmp/noc_load_test.db")
+    parser.add_argument("--rows", type=int, default=100_000, help="synthetic incidents")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the synthetic database")
+    parser.add_argument("--build-only", action="store_true", help="only build the synthetic database")
+    parser.add_argument("--writer-interval", type=float, default=5, help="seconds between upserts (0 = no writer)")
+    parser.add_argument("--writer-rows", type=int, default=2000)
+    parser.add_argument("--api", help="base URL of a running api.py instead of the in-process service")
+    parser.add_argument("--ollama-url", help="use this Ollama instead of the bundled stub (in-process mode)")
+    parser.add_argument("--slo-ms", type=float, default=10_000, help="p95 latency target for the capacity figure")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--label", help="name of the run in comparisons")
+    parser.add_argument("--out", help="write the run as JSON")
+    parser.add_argument("--baseline", help="saved run to compare this run against")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two saved runs and exit")
+    stub_ollama.add_model_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_runs(load_run(args.compare[0]), load_run(args.compare[1]))
+        return
+
+    stub = None
+    in_process = not args.api and not args.build_only
+    if in_process:
+        if args.ollama_url:
+            ollama_url = args.ollama_url
+        else:
+            stub, base_url = stub_ollama.start_server(seed=args.seed, **stub_ollama.model_options(args))
+            ollama_url = f"{base_url}/api/generate"
+        # Read by ollama_client / query_guard / tracing at import time
+        os.environ["OLLAMA_URL"] = ollama_url
+        os.environ.setdefault("QUERY_PLAN_LOG", os.devnull)
+        os.environ.setdefault("TRACE_LOG", os.devnull)
+
+    if args.rebuild or args.build_only or not os.path.exists(args.db):
+        print(f"Building {args.rows} synthetic incidents in {args.db} ...")
+        print(f"  {build_database(args.db, args.rows, args.seed):.1f}s")
+    if args.build_only:
+        return
+    driver = ServiceDriver(args.db) if in_process else HttpDriver(args.api)
+
+    questions = load_questions()
+    incident_ids = incident_ids_by_client(args.db)
+    writer_options = None
+    if args.writer_interval > 0:
+        writer_options = {"interval": args.writer_interval,
+                          "batch": synthetic_incidents(args.writer_rows, args.seed + 99)}
+
+    run = {
+        "label": args.label or (args.api or "in-process"),
+        "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {
+            "mode": "http" if args.api else "in-process",
+            "ollama": "stub" if stub else (args.ollama_url or "api server"),
+            "stub": stub_ollama.model_options(args) if stub else None,
+            "rows": args.rows,
+            "duration_s": args.duration,
+            "think_ms": args.think_ms,
+            "writer_interval_s": args.writer_interval,
+            "writer_rows": args.writer_rows,
+            "slo_ms": args.slo_ms,
+            "max_error_rate": args.max_error_rate,
+        },
+        "steps": [],
+    }
+    for users in [int(n) for n in args.concurrency.split(",") if n.strip()]:
+        print(f"Running {users} users for {args.duration:.0f}s ...", flush=True)
+        step = run_step(driver, users, questions, incident_ids, args.duration, args.think_ms,
+                        writer_options, args.seed, in_process)
+        if stub:
+            with stub.model.lock:
+                step["llm_requests"], step["llm_queued_s"] = stub.model.requests, round(stub.model.queued_s, 2)
+                stub.model.requests, stub.model.queued_s = 0, 0.0
+        run["steps"].append(step)
+    run["capacity"] = capacity(run["steps"], args.slo_ms, args.max_error_rate)
+
+    print()
+    print_steps(run)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"\nSaved {args.out}")
+    if args.baseline:
+        print()
+        compare_runs(load_run(args.baseline), run)
+    if stub:
+        stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
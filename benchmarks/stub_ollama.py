@@ -0,0 +1,241 @@
+"""Ollama-compatible stub server for load tests.
+
+Answers /api/chat, /api/generate and /api/embeddings like a local Ollama, with
+a configurable fixed latency (prefill / queueing) plus a generation time of
+``output tokens / --tokens-per-s``. ``--parallel`` requests are served at once
+(like ``OLLAMA_NUM_PARALLEL``); the rest wait in line, as on a real GPU box.
+
+SQL-generation requests get plausible SQL for the question (see SQL_RULES), so
+the guard, executor and follow-up path downstream do real work; chat requests
+get filler text of ``--chat-tokens`` tokens.
+
+Usage:
+    python benchmarks/stub_ollama.py [--port 11500] [--latency-ms 300] [--tokens-per-s 40] [--parallel 1]
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBED_DIM = 64
+
+# (question pattern, SQL) -- first match wins; \1 refers to the pattern's group
+SQL_RULES = [
+    (r"incident\s*(?:id)?\s*#?(\d{5,})", "SELECT * FROM incidents WHERE incident_id = '\\1'"),
+    (r"clients?.*most|most.*clients?", "SELECT client_name, COUNT(*) AS incidents FROM incidents GROUP BY client_name ORDER BY incidents DESC LIMIT 5"),
+    (r"link_name|links?\b", "SELECT link_name_nttn, COUNT(*) AS incidents FROM incidents GROUP BY link_name_nttn ORDER BY incidents DESC LIMIT 20"),
+    (r"district", "SELECT district, COUNT(*) AS incidents FROM incidents GROUP BY district ORDER BY incidents DESC"),
+    (r"average|avg", "SELECT AVG((julianday(clear_time) - julianday(event_time)) * 24) AS avg_hours FROM incidents WHERE clear_time != ''"),
+    (r"unresolved|open|pending", "SELECT * FROM incidents WHERE fault_status = 'open' ORDER BY event_time DESC"),
+    (r"fire|smoke", "SELECT * FROM incidents WHERE incident_id IN (SELECT incident_id FROM incidents_fts WHERE incidents_fts MATCH '{reason remarks} : (\"fire\"* OR \"smoke\"* OR \"burn\"*)')"),
+    (r"cable|fiber|cut", "SELECT * FROM incidents WHERE incident_id IN (SELECT incident_id FROM incidents_fts WHERE incidents_fts MATCH '{reason} : (\"cable cut\" OR \"fiber cut\")')"),
+    (r"power|voltage", "SELECT * FROM incidents WHERE incident_id IN (SELECT incident_id FROM incidents_fts WHERE incidents_fts MATCH '{reason} : (\"power outage\" OR \"voltage drop\")')"),
+    (r"july 2024|in july", "SELECT * FROM incidents WHERE event_time >= '2024-07-01' AND event_time < '2024-08-01'"),
+    (r"escalat", "SELECT * FROM incidents WHERE (julianday(escalation_time) - julianday(event_time)) * 1440 > 10"),
+    (r"vvip|priority", "SELECT client_name, COUNT(*) AS vvip FROM incidents WHERE client_priority = 'VVIP' GROUP BY client_name ORDER BY vvip DESC LIMIT 5"),
+    (r"duration|longest", "SELECT client_name, SUM(CAST(duration AS REAL)) AS hours FROM incidents GROUP BY client_name ORDER BY hours DESC LIMIT 5"),
+    (r"today|yesterday|recent|latest|last", "SELECT * FROM incidents ORDER BY event_time DESC LIMIT 20"),
+]
+
+FOLLOWUP_RULES = [
+    (r"in (\w+)$", "SELECT * FROM result WHERE district = '\\1'"),
+    (r"open|unresolved", "SELECT * FROM result WHERE fault_status = 'open'"),
+    (r"district", "SELECT district, COUNT(*) AS incidents FROM result GROUP BY district ORDER BY incidents DESC"),
+    (r"reason|cause", "SELECT reason, COUNT(*) AS incidents FROM result GROUP BY reason ORDER BY incidents DESC"),
+    (r"longest|duration", "SELECT * FROM result ORDER BY CAST(duration AS REAL) DESC LIMIT 5"),
+]
+
+DEFAULT_SQL = "SELECT * FROM incidents ORDER BY event_time DESC LIMIT 50"
+DEFAULT_FOLLOWUP_SQL = "SELECT * FROM result LIMIT 5"
+
+FILLER = (
+    "The incident was raised by the NMS when the link went down and was escalated to the field team, "
+    "who restored the service after checking power and optical levels at both ends"
+).split()
+
+
+def _match(rules, text, default):
+    for pattern, sql in rules:
+        found = re.search(pattern, text, re.IGNORECASE)
+        if found:
+            return found.expand(sql)
+    return default
+
+
+def _line_after(prefix, text):
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return line[len(prefix):].strip()
+    return text
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def stub_embedding(text):
+    """Bag of hashed words, so texts sharing words get similar vectors"""
+    vector = [0.0] * EMBED_DIM
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBED_DIM] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class StubModel:
+    """Latency model and canned answers shared by all handler threads"""
+
+    def __init__(self, latency_ms=300, tokens_per_s=40, parallel=1, chat_tokens=120, embed_ms=5,
+                 bad_sql_rate=0.0, seed=None):
+        self.latency_s = latency_ms / 1000
+        self.tokens_per_s = tokens_per_s
+        self.chat_tokens = chat_tokens
+        self.embed_s = embed_ms / 1000
+        self.bad_sql_rate = bad_sql_rate
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.queued_s = 0.0
+
+    def generate(self, system_prompt, prompt):
+        """Return (text, prompt_tokens, output_tokens) after the simulated delay"""
+        if "answers follow-up questions" in system_prompt:
+            text = _match(FOLLOWUP_RULES, _line_after("Follow-up question:", prompt), DEFAULT_FOLLOWUP_SQL)
+        elif "into SQL queries" in system_prompt:
+            text = _match(SQL_RULES, _line_after("Question:", prompt), DEFAULT_SQL)
+            with self.lock:
+                broken = self.rng.random() < self.bad_sql_rate
+            if broken:
+                text = text.replace("FROM incidents", "FROM incident", 1)
+        else:
+            text = " ".join(FILLER[i % len(FILLER)] for i in range(self.chat_tokens)) + "."
+        prompt_tokens = estimate_tokens(system_prompt + prompt)
+        output_tokens = estimate_tokens(text)
+        self._wait(self.latency_s + output_tokens / self.tokens_per_s)
+        return text, prompt_tokens, output_tokens
+
+    def _wait(self, seconds):
+        queued = time.perf_counter()
+        with self.slots:
+            waited = time.perf_counter() - queued
+            time.sleep(seconds)
+        with self.lock:
+            self.requests += 1
+            self.queued_s += waited
+
+    def embed(self, text):
+        time.sleep(self.embed_s)
+        return stub_embedding(text)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    model = None  # StubModel, set by make_server
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?")[0]
+        start = time.perf_counter()
+        if path == "/api/embeddings":
+            self._reply({"embedding": self.model.embed(body.get("prompt", ""))})
+            return
+        if path == "/api/chat":
+            messages = body.get("messages", [])
+            system_prompt = "".join(m["content"] for m in messages if m.get("role") == "system")
+            prompt = "".join(m["content"] for m in messages if m.get("role") != "system")
+        elif path == "/api/generate":
+            if not body.get("prompt"):
+                # Like Ollama, a request without a prompt only loads the model
+                self._reply({"model": body.get("model", "stub"), "response": "", "done": True, "done_reason": "load"})
+                return
+            system_prompt, prompt = body.get("system", ""), body.get("prompt", "")
+        else:
+            self.send_error(404)
+            return
+        text, prompt_tokens, output_tokens = self.model.generate(system_prompt, prompt)
+        total_ns = int((time.perf_counter() - start) * 1e9)
+        reply = {
+            "model": body.get("model", "stub"),
+            "done": True,
+            "total_duration": total_ns,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.model.latency_s * 1e9),
+            "eval_count": output_tokens,
+            "eval_duration": int(output_tokens / self.model.tokens_per_s * 1e9),
+        }
+        if path == "/api/chat":
+            reply["message"] = {"role": "assistant", "content": text}
+        else:
+            reply["response"] = text
+        self._reply(reply)
+
+    def _reply(self, data):
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=0, **model_options):
+    """Create (but do not start) a stub server; ``server.model`` holds the counters"""
+    handler = type("BoundStubHandler", (StubHandler,), {"model": StubModel(**model_options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.model = handler.model
+    return server
+
+
+def start_server(host="127.0.0.1", port=0, **model_options):
+    """Start a stub server on a background thread; returns (server, base_url)"""
+    server = make_server(host, port, **model_options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def add_model_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=300, help="fixed time per LLM request")
+    parser.add_argument("--tokens-per-s", type=float, default=40, help="generation speed")
+    parser.add_argument("--parallel", type=int, default=1, help="requests served at once")
+    parser.add_argument("--chat-tokens", type=int, default=120, help="length of chat answers")
+    parser.add_argument("--embed-ms", type=float, default=5, help="time per embedding")
+    parser.add_argument("--bad-sql-rate", type=float, default=0.0, help="fraction of SQL answers that fail")
+
+
+def model_options(args):
+    return {
+        "latency_ms": args.latency_ms,
+        "tokens_per_s": args.tokens_per_s,
+        "parallel": args.parallel,
+        "chat_tokens": args.chat_tokens,
+        "embed_ms": args.embed_ms,
+        "bad_sql_rate": args.bad_sql_rate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, **model_options(args))
+    print(f"Stub Ollama on http://{args.host}:{server.server_address[1]}/api/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
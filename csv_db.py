@@ -2,7 +2,10 @@ import streamlit as st
 import pandas as pd
 import sqlite3
 import requests
-from sqlalchemy import create_engine
+from ollama_client import message_content, post_chat
+from tracing import llm_tokens, request_context, span, start_metrics_server, traced
+from fts_index import fts_available, rewrite_like_to_fts
+from ingest_jobs import IngestQueue
 
 # Initialize session state for persistence
 if "query_result" not in st.session_state:
@@ -14,28 +17,58 @@ if "show_summarization" not in st.session_state:
 if "summary" not in st.session_state:
     st.session_state.summary = None  # Stores the generated summary
 
+@st.cache_resource
+def get_ingest_queue():
+    """Background loader for data.db; one worker thread per server process"""
+    return IngestQueue("data.db")
+
 def create_database(csv_file):
-    try:
-        df = pd.read_csv(csv_file, dtype=str, low_memory=False)
+    """Queue the CSV for appending to data.db as is (any columns); returns the job right away"""
+    return get_ingest_queue().submit(csv_file, csv_file.name, mode="raw")
 
-        if df.empty:
-            raise ValueError("Uploaded CSV file is empty. Please upload a valid file.")
+def show_ingest_progress():
+    """Progress of the most recent upload in the sidebar"""
+    jobs = get_ingest_queue().jobs(limit=1)
+    if not jobs:
+        return
+    job = jobs[0]
+    label = f"{job['filename']}: {job['rows_done']:,} rows {job['status']}"
+    if job['rows_per_sec']:
+        label += f" · {job['rows_per_sec']:,.0f} rows/s"
+    if job['eta_s'] is not None:
+        label += f" · ETA {job['eta_s']:.0f}s"
+    st.progress((job['percent'] or 0) / 100, text=label)
+    if job['status'] == "failed":
+        st.error(f"Error loading CSV: {job['error']}")
+    if job['status'] in ("failed", "cancelled") and st.button("↻ Resume upload"):
+        get_ingest_queue().resume(job['job_id'])
+        st.rerun()
+    if job['status'] in ("queued", "running") and not job['cancel_requested'] and st.button("✖ Cancel upload"):
+        get_ingest_queue().cancel(job['job_id'])
+        st.rerun()
 
-        engine = create_engine("sqlite:///data.db", echo=False)
-        df.to_sql("incidents", con=engine, if_exists="append", index=False)
-        
-        return engine
-    except Exception as e:
-        print(f"Error loading CSV: {e}")
-        return None
+def has_fts_index():
+    """Whether data.db has the incidents_fts index the FTS prompt relies on"""
+    try:
+        conn = sqlite3.connect("file:data.db?mode=ro", uri=True)
+    except sqlite3.Error:
+        return False  # Nothing uploaded yet
+    try:
+        return fts_available(conn)
+    finally:
+        conn.close()
 
 def query_database(query):
     conn = sqlite3.connect("data.db")
-    result = pd.read_sql_query(query, conn)
+    if fts_available(conn):
+        query = rewrite_like_to_fts(query)
+    with span("sql.execute") as s:
+        result = pd.read_sql_query(query, conn)
+        s.set(rows=len(result))
     conn.close()
     return result
 
-SYSTEM_PROMPT = """
+_SYSTEM_PROMPT_HEAD = """
 You are an AI assistant that converts natural language questions into SQL queries for an SQLite database.
 Analyze the database schema and generate a valid SQL query.
 Ensure that the query is correctly structured and retrieves the desired information.
@@ -47,16 +80,32 @@ Database schema:
 - **DO NOT** wrap the query inside ```sql``` or '''sql''' blocks.
 - **DO NOT** prepend text like "Generated query:", "Here is your query:", or any other commentary.  
 - The output must start **directly** with `SELECT`
-## IMPORTANT INSTRUCTIONS ##
+"""
+
+SYSTEM_PROMPT = _SYSTEM_PROMPT_HEAD + """## IMPORTANT INSTRUCTIONS ##
 - If the user asks about a specific problem type (e.g., fire, theft, power outage), **do not rely only on the `problem_category` column**.
-- Also check the `reason` column for relevant terms using **`LOWER(reason) LIKE '%keyword%'`**.
+- Also search the `reason` column, which is full-text indexed in `incidents_fts` together with `remarks`, `task_comments`, `client_comments` and `task_resolutions`.
+- Do not use `LIKE '%keyword%'` for these columns. Use **`incident_id IN (SELECT incident_id FROM incidents_fts WHERE incidents_fts MATCH '{reason} : ("fire"* OR "burn"*)')`**.
 - Automatically infer relevant keywords. Example:
   - For "fire incidents," search for **'fire', 'burn', 'smoke', 'flames'** in the `reason` column.
   - For "cable cut issues," search for **'cable cut', 'fiber cut', 'line break'**.
   - For "power failure," search for **'power outage', 'voltage drop', 'electric failure'**.
 - Ensure the query retrieves all relevant data, even if the user does not explicitly mention technical terms.
+"""
 
-Context: {context}
+# Used while data.db has no incidents_fts index (e.g. a CSV without the free-text columns)
+SYSTEM_PROMPT_LIKE = _SYSTEM_PROMPT_HEAD + """## IMPORTANT INSTRUCTIONS ##
+- If the user asks about a specific problem type (e.g., fire, theft, power outage), **do not rely only on the `problem_category` column**.
+- Also search the `reason` column using `LIKE`, e.g. **`(LOWER(reason) LIKE '%fire%' OR LOWER(reason) LIKE '%burn%')`**.
+- Automatically infer relevant keywords. Example:
+  - For "fire incidents," search for **'fire', 'burn', 'smoke', 'flames'** in the `reason` column.
+  - For "cable cut issues," search for **'cable cut', 'fiber cut', 'line break'**.
+  - For "power failure," search for **'power outage', 'voltage drop', 'electric failure'**.
+- Ensure the query retrieves all relevant data, even if the user does not explicitly mention technical terms.
+"""
+
+# Per-question suffix, kept out of SYSTEM_PROMPT so its prefill can be reused
+QUESTION_PROMPT = """Context: {context}
 Question: {question}
 """
 
@@ -84,14 +133,15 @@ Please generate the analysis report in the format outlined above."""
 OLLAMA_URL = "http://192.168.5.201:11434/api/generate"
 
 def call_llm(context, prompt):
-    payload = {
-        "model": "qwen2.5-coder:7b",
-        "prompt": SYSTEM_PROMPT.format(context=context, question=prompt),
-        "stream": False,
-    }
-    response = requests.post(OLLAMA_URL, json=payload)
+    response = post_chat(
+        OLLAMA_URL,
+        "qwen2.5-coder:7b",
+        SYSTEM_PROMPT if has_fts_index() else SYSTEM_PROMPT_LIKE,
+        QUESTION_PROMPT.format(context=context, question=prompt),
+        stage="llm.sql",
+    )
     if response.status_code == 200:
-        return response.json().get("response", "Error: No response from LLM")
+        return message_content(response.json(), "Error: No response from LLM")
     else:
         return f"Error: {response.status_code} - {response.text}"
 
@@ -101,12 +151,16 @@ def sum_llm(context, data, prompt):
         "prompt": SYSTEM_PROMPT_2.format(context=context, prompt=prompt, data=data),
         "stream": False,
     }
-    response = requests.post(OLLAMA_URL, json=payload)
+    with span("llm.summary", model=payload["model"]) as s:
+        response = requests.post(OLLAMA_URL, json=payload)
+        if response.status_code == 200:
+            s.set(tokens=llm_tokens(response.json()))
     if response.status_code == 200:
         return response.json().get("response", "Error: No response from LLM")
     else:
         return f"Error: {response.status_code} - {response.text}"
     
+@traced("df.prepare")
 def prepare_data_for_summarization(df):
 
     original_columns = list(df.columns)
@@ -148,6 +202,7 @@ def prepare_data_for_summarization(df):
 
 # Streamlit UI
 st.set_page_config(page_title="CSV Data Query LLM", layout="wide")
+start_metrics_server()
 
 with st.sidebar:
     st.sidebar.header("📑 Upload CSV File")
@@ -155,21 +210,28 @@ with st.sidebar:
     process = st.button("⚡ Process CSV")    
 
     if uploaded_file and process:
-        engine = create_database(uploaded_file)
-        st.sidebar.success("CSV file loaded successfully!")
+        job = create_database(uploaded_file)
+        st.sidebar.success(f"CSV file queued for loading (job {job['job_id']})")
+
+    if hasattr(st, "fragment"):
+        st.fragment(run_every=2)(show_ingest_progress)()
+    else:
+        show_ingest_progress()
 
 st.header("🔎 Query Your Data Using Natural Language")
 prompt = st.text_input("Enter your question:")
 ask = st.button("Generate SQL & Query Data")
 
 if ask and prompt:
-    generated_sql = call_llm("Table: incidents", prompt)
+    with request_context(app="csv_db"):
+        generated_sql = call_llm("Table: incidents", prompt)
     st.session_state.generated_sql = generated_sql  # Store SQL query in session state
     st.subheader("Generated SQL Query")
     st.code(generated_sql, language="sql")
     
     try:
-        result_df = query_database(generated_sql)
+        with request_context(app="csv_db"):
+            result_df = query_database(generated_sql)
         st.session_state.query_result = result_df  # Store results in session state
         st.session_state.show_summarization = True  # Make summarization button visible
         st.session_state.summary = None  # Reset summary when new query is made
@@ -193,8 +255,9 @@ if st.session_state.query_result is not None:
 
         if summarize:
             st.session_state.show_summarization = False  # Hide button after clicking            
-            data_text = prepare_data_for_summarization(st.session_state.query_result)            
-            summary = sum_llm("Table: incidents", prompt, data_text)
+            with request_context(app="csv_db"):
+                data_text = prepare_data_for_summarization(st.session_state.query_result)            
+                summary = sum_llm("Table: incidents", prompt, data_text)
             st.session_state.summary = summary  # Store summary in session state
 
 # Show summary below the table after it's generated
@@ -0,0 +1,233 @@
+"""Stats catalog for the incidents database.
+
+The admin panel used to run ``COUNT(*)`` / ``COUNT(DISTINCT client_name)`` over
+``incidents`` on every Streamlit rerun. Instead, the ingest path keeps a small
+catalog up to date inside its own write transaction:
+
+- ``incident_stats``: rows and min/max ``event_time`` per client
+- ``db_stats``: key/value facts such as the last load time and size on disk
+- ``ingest_history``: one row per upload (file, rows, counts, duration)
+
+Counts are maintained from deltas, so they are exact. ``min_event_time`` /
+``max_event_time`` only ever widen; an update that moves an incident's
+event_time inwards leaves the old bound until ``recompute_stats`` runs.
+"""
+import sqlite3
+import time
+
+import pandas as pd
+
+STATS_TABLE = "incident_stats"
+META_TABLE = "db_stats"
+HISTORY_TABLE = "ingest_history"
+
+
+def _now():
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _has_column(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def _stats_exist(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (STATS_TABLE,)).fetchone()
+    return row is not None
+
+
+def ensure_stats_tables(conn):
+    """Create the catalog tables if missing, seeding them from the incidents table.
+
+    Runs inside the caller's transaction; has no transaction handling of its own.
+    Returns True if the catalog was just created (and seeded).
+    """
+    seed = not _stats_exist(conn)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+            client_name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            min_event_time TEXT,
+            max_event_time TEXT,
+            updated_at TEXT
+        )""")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value)")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+            id INTEGER PRIMARY KEY,
+            loaded_at TEXT,
+            file_name TEXT,
+            mode TEXT,
+            rows INTEGER,
+            inserted INTEGER,
+            updated INTEGER,
+            unchanged INTEGER,
+            skipped INTEGER,
+            duration_s REAL
+        )""")
+    if seed:
+        _recompute(conn)
+    return seed
+
+
+def _set_meta(conn, key, value):
+    conn.execute(
+        f"INSERT INTO {META_TABLE} (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+
+def _apply_client_deltas(conn, deltas):
+    """deltas: iterable of (client_name, row_delta, min_event_time, max_event_time)"""
+    conn.executemany(
+        f"""INSERT INTO {STATS_TABLE} (client_name, row_count, min_event_time, max_event_time, updated_at)
+            VALUES (?1, ?2, ?3, ?4, ?5)
+            ON CONFLICT(client_name) DO UPDATE SET
+                row_count = row_count + excluded.row_count,
+                min_event_time = COALESCE(MIN(min_event_time, excluded.min_event_time), min_event_time, excluded.min_event_time),
+                max_event_time = COALESCE(MAX(max_event_time, excluded.max_event_time), max_event_time, excluded.max_event_time),
+                updated_at = excluded.updated_at""",
+        [(client, delta, low, high, _now()) for client, delta, low, high in deltas],
+    )
+    conn.execute(f"DELETE FROM {STATS_TABLE} WHERE row_count <= 0")
+    _set_meta(conn, "last_load_at", _now())
+
+
+def apply_staging_delta(conn, staging_table, key_column="incident_id"):
+    """Fold a deduplicated staging table into the catalog before it is merged.
+
+    Must run inside the upsert transaction, before the ``INSERT ... ON
+    CONFLICT`` so that existing rows still show their previous client.
+    """
+    ensure_stats_tables(conn)
+    time_expr = "s.event_time" if _has_column(conn, staging_table, "event_time") else "NULL"
+    deltas = {}
+
+    def add(client, count, low=None, high=None):
+        entry = deltas.setdefault(client, [0, None, None])
+        entry[0] += count
+        if low is not None:
+            entry[1] = low if entry[1] is None else min(entry[1], low)
+        if high is not None:
+            entry[2] = high if entry[2] is None else max(entry[2], high)
+
+    # New incidents count towards their client; every staged row may widen its time range
+    for client, new_rows, low, high in conn.execute(
+        f"""SELECT IFNULL(s.client_name, ''),
+                   SUM(NOT EXISTS (SELECT 1 FROM incidents i WHERE i.{key_column} = s.{key_column})),
+                   MIN({time_expr}), MAX({time_expr})
+            FROM {staging_table} s GROUP BY 1"""
+    ):
+        add(client, new_rows, low, high)
+    # Existing incidents re-assigned to another client move between the counters
+    for old_client, new_client, moved in conn.execute(
+        f"""SELECT IFNULL(i.client_name, ''), IFNULL(s.client_name, ''), COUNT(*)
+            FROM {staging_table} s JOIN incidents i ON i.{key_column} = s.{key_column}
+            WHERE IFNULL(i.client_name, '') != IFNULL(s.client_name, '')
+            GROUP BY 1, 2"""
+    ):
+        add(old_client, -moved)
+        add(new_client, moved)
+
+    _apply_client_deltas(conn, [(client, *entry) for client, entry in deltas.items()])
+
+
+def apply_frame_delta(conn, df):
+    """Fold rows appended from a DataFrame (legacy append mode) into the catalog.
+
+    Call after the rows were appended.
+    """
+    if ensure_stats_tables(conn):
+        _set_meta(conn, "last_load_at", _now())
+        return  # Seeded from incidents, which already holds the appended rows
+    frame = pd.DataFrame({
+        "client": df["client_name"].fillna(""),
+        "t": df["event_time"] if "event_time" in df.columns else None,
+    })
+    grouped = frame.groupby("client")["t"].agg(["size", "min", "max"])
+    _apply_client_deltas(conn, [
+        (client, int(row["size"]), None if pd.isna(row["min"]) else row["min"], None if pd.isna(row["max"]) else row["max"])
+        for client, row in grouped.iterrows()
+    ])
+
+
+def record_database_size(conn):
+    """Store the database size in bytes (pages in use, WAL excluded)"""
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    _set_meta(conn, "size_bytes", page_count * page_size)
+
+
+def record_ingest(conn, file_name, mode, stats):
+    """Append one upload to the ingest history"""
+    ensure_stats_tables(conn)
+    conn.execute(
+        f"""INSERT INTO {HISTORY_TABLE}
+            (loaded_at, file_name, mode, rows, inserted, updated, unchanged, skipped, duration_s)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (
+            _now(), file_name, mode, stats.get("rows", 0), stats.get("inserted", 0),
+            stats.get("updated", 0), stats.get("unchanged", 0), stats.get("skipped", 0),
+            round(stats.get("seconds", 0.0), 3),
+        ),
+    )
+
+
+def _recompute(conn):
+    conn.execute(f"DELETE FROM {STATS_TABLE}")
+    if _has_column(conn, "incidents", "client_name"):
+        time_expr = "event_time" if _has_column(conn, "incidents", "event_time") else "NULL"
+        conn.execute(
+            f"""INSERT INTO {STATS_TABLE} (client_name, row_count, min_event_time, max_event_time, updated_at)
+                SELECT IFNULL(client_name, ''), COUNT(*), MIN({time_expr}), MAX({time_expr}), ?
+                FROM incidents GROUP BY 1""",
+            (_now(),),
+        )
+    _set_meta(conn, "recomputed_at", _now())
+
+
+def recompute_stats(database_path):
+    """Rebuild the per-client catalog from a full scan of incidents"""
+    conn = sqlite3.connect(database_path, timeout=30)
+    try:
+        with conn:
+            ensure_stats_tables(conn)
+            _recompute(conn)
+            record_database_size(conn)
+    finally:
+        conn.close()
+
+
+def load_stats(database_path, history_limit=20):
+    """Catalog contents for display: totals, per-client rows, facts and recent loads.
+
+    Returns None when the catalog has not been created yet.
+    """
+    conn = sqlite3.connect(f"file:{database_path}?mode=ro", uri=True)
+    try:
+        try:
+            clients = pd.read_sql_query(
+                f"SELECT client_name, row_count, min_event_time, max_event_time, updated_at "
+                f"FROM {STATS_TABLE} ORDER BY row_count DESC",
+                conn,
+            )
+        except pd.errors.DatabaseError:
+            return None
+        meta = dict(conn.execute(f"SELECT key, value FROM {META_TABLE}").fetchall())
+        history = pd.read_sql_query(
+            f"SELECT loaded_at, file_name, mode, rows, inserted, updated, unchanged, skipped, duration_s "
+            f"FROM {HISTORY_TABLE} ORDER BY id DESC LIMIT ?",
+            conn,
+            params=(history_limit,),
+        )
+    finally:
+        conn.close()
+    return {
+        "total_rows": int(clients["row_count"].sum()) if len(clients) else 0,
+        "client_count": len(clients),
+        "clients": clients,
+        "last_load_at": meta.get("last_load_at"),
+        "recomputed_at": meta.get("recomputed_at"),
+        "size_bytes": meta.get("size_bytes"),
+        "history": history,
+    }
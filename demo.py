@@ -1,14 +1,16 @@
 import streamlit as st
-import requests
 from datetime import datetime
-import uuid
 import os
+from importlib import import_module
+from importlib.util import find_spec
 from dotenv import load_dotenv
-import pandas as pd
 import io
 import json
-import traceback
-import openpyxl
+from tracing import llm_tokens, request_context, span, start_metrics_server
+from warmup import start_warmup
+
+# pandas and requests are imported where they are used, so the login page renders
+# without them; start_warmup loads them (and the model) in the background
 
 # Set up error handling
 try:
@@ -51,6 +53,7 @@ SAMPLE_DATA = """
 
 # Function to load incident data - with dependency checking
 def load_incident_data(file=None):
+    import pandas as pd
     try:
         if file is not None:
             if file.name.endswith(('.xlsx', '.xls')):
@@ -174,7 +177,11 @@ def call_llm(client, question, incident_data):
     }
     
     try:
-        response = requests.post(OLLAMA_URL, json=payload)
+        import requests
+        with span("llm.chat", model=MODEL) as s:
+            response = requests.post(OLLAMA_URL, json=payload)
+            if response.status_code == 200:
+                s.set(tokens=llm_tokens(response.json()))
         if response.status_code == 200:
             return response.json().get("response", "I couldn't process your request.")
         else:
@@ -228,20 +235,22 @@ def chat_interface():
             st.session_state.incident_df = load_incident_data()
         
         try:
-            # Find relevant data for the query
-            relevant_data = find_relevant_data(
-                prompt, 
-                st.session_state.incident_df, 
-                st.session_state.client
-            )
-            
-            # Call LLM with the data
-            with st.spinner("Thinking..."):
-                response = call_llm(
-                    st.session_state.client,
-                    prompt,
-                    relevant_data
-                )
+            with request_context(app="demo", client=st.session_state.client):
+                # Find relevant data for the query
+                with span("retrieval"):
+                    relevant_data = find_relevant_data(
+                        prompt, 
+                        st.session_state.incident_df, 
+                        st.session_state.client
+                    )
+                
+                # Call LLM with the data
+                with st.spinner("Thinking..."):
+                    response = call_llm(
+                        st.session_state.client,
+                        prompt,
+                        relevant_data
+                    )
         except Exception as e:
             st.error(f"Error processing query: {str(e)}")
             response = "I encountered an error processing your request. Please try a different question or check the error message."
@@ -282,17 +291,26 @@ def chat_interface():
             st.session_state.authenticated = False
             st.rerun()
 
+def warm_up():
+    """Import pandas and load the model after the first render"""
+    def load_model():
+        from ollama_client import preload
+        preload(MODEL, OLLAMA_URL)
+    start_warmup("demo", [
+        ("pandas", lambda: import_module("pandas")),
+        ("model", load_model),
+    ])
+
 # Main function
 def main():
     """Main app"""
     st.set_page_config(page_title="NOC Assistant", page_icon="📡")
+    start_metrics_server()
     
-    # Check for required dependencies
-    try:
-        import requests
-        import pandas as pd
-    except ImportError as e:
-        st.error(f"Missing required dependency: {e}")
+    # Check for required dependencies without importing them (they load on first use)
+    missing = [name for name in ("requests", "pandas") if find_spec(name) is None]
+    if missing:
+        st.error(f"Missing required dependency: {', '.join(missing)}")
         return
     
     # Initialize session state
@@ -307,19 +325,21 @@ def main():
         st.session_state.first_run = True
         
     
-    # Make sure we have incident data
-    try:
-        if "incident_df" not in st.session_state:
-            st.session_state.incident_df = load_incident_data()
-    except Exception as e:
-        st.error(f"Error initializing data: {str(e)}")
-        st.session_state.incident_df = pd.read_csv(io.StringIO(SAMPLE_DATA.strip()))
-    
-
     if st.session_state.authenticated:
+        # Make sure we have incident data (not needed for the login page)
+        try:
+            if "incident_df" not in st.session_state:
+                st.session_state.incident_df = load_incident_data()
+        except Exception as e:
+            import pandas as pd
+            st.error(f"Error initializing data: {str(e)}")
+            st.session_state.incident_df = pd.read_csv(io.StringIO(SAMPLE_DATA.strip()))
         chat_interface()
     else:
         login_page()
+    
+    # Preload in the background once the page is on screen
+    warm_up()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""Continuous delta ingestion from a directory of incident CSV exports.
+
+The OSS system drops a new incident export every few minutes (or appends to
+one CSV). ``ExportWatcher`` polls ``WATCH_DIR`` (a directory, or a single CSV
+file) every ``WATCH_INTERVAL_S`` seconds and loads only what is new:
+
+- per file it keeps the byte offset of the last ingested record, the header,
+  a checksum of the file's first bytes and the size and mtime it had at the
+  last poll in ``ingest_watch_files``. Files whose size and mtime did not
+  change are skipped without being opened. A file whose checksum changed, or
+  that got shorter, was replaced and is read again from the start (the upsert
+  makes that harmless);
+- new bytes are read up to the last complete record (a trailing half-written
+  line, or a quoted field still open, waits for the next poll) in
+  micro-batches of ``WATCH_BATCH_ROWS`` records;
+- each micro-batch is upserted on incident_id, so a status change such as
+  ``fault_status`` moving to closed updates the existing row, and the file's
+  new offset commits in the same transaction. A restart therefore resumes
+  exactly after the last committed batch;
+- the full-text index (triggers) and the stats catalog (row deltas) follow
+  each batch incrementally; only the first load builds them.
+
+Freshness lag, from the last write of the exported bytes (the file's mtime)
+to the commit that makes them queryable, is recorded per batch as the
+``ingest.watch.freshness`` stage: p50/p95 on the Prometheus endpoint and in
+the admin panel's pipeline table.
+
+Usage:
+    python export_watcher.py [--dir exports] [--db noc_incidents.db] [--interval 5] [--once]
+"""
+import argparse
+import fnmatch
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from incident_ingest import (
+    connect_for_ingest, finalize_ingest, merge_staging, new_ingest_stats, prepare_upsert, record_history, stage_chunk,
+)
+from tracing import observe, span, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+FILES_TABLE = "ingest_watch_files"
+WATCH_DIR = os.getenv("WATCH_DIR", "exports")
+WATCH_PATTERN = os.getenv("WATCH_PATTERN", "*.csv")
+WATCH_INTERVAL_S = float(os.getenv("WATCH_INTERVAL_S", "5"))
+WATCH_BATCH_ROWS = int(os.getenv("WATCH_BATCH_ROWS", "5000"))
+# Leading bytes whose checksum tells an appended-to file from a replaced one
+CHECKSUM_BYTES = 65536
+
+
+def _checksum(path, length):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+
+def read_records(f, max_rows):
+    """Read up to ``max_rows`` complete CSV records from the current position of ``f``.
+
+    Returns ``(data, rows)``; stops before a record that is not fully written yet
+    (no trailing newline, or a quoted field spanning lines that is still open)
+    and leaves ``f`` right after the last record returned.
+    """
+    start = f.tell()
+    data, pending, rows, quoted = [], [], 0, False
+    while rows < max_rows:
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            break
+        pending.append(line)
+        quoted ^= line.count(b'"') % 2 == 1
+        if not quoted:
+            data += pending
+            pending = []
+            rows += 1
+    data = b"".join(data)
+    f.seek(start + len(data))
+    return data, rows
+
+
+class ExportWatcher:
+    """Polls a directory of CSV exports and upserts their new rows"""
+
+    def __init__(self, database_path, watch_path=WATCH_DIR, pattern=WATCH_PATTERN, batch_rows=WATCH_BATCH_ROWS):
+        self.database_path = database_path
+        self.watch_path = watch_path
+        self.pattern = pattern
+        self.batch_rows = batch_rows
+        self._thread = None
+
+    def files(self):
+        """Export files to watch, oldest first"""
+        if os.path.isfile(self.watch_path):
+            return [self.watch_path]
+        if not os.path.isdir(self.watch_path):
+            return []
+        paths = [
+            os.path.join(self.watch_path, name) for name in os.listdir(self.watch_path)
+            if fnmatch.fnmatch(name, self.pattern)
+        ]
+        return sorted((path for path in paths if os.path.isfile(path)), key=os.path.getmtime)
+
+    def _known_files(self):
+        """``{path: (size, mtime)}`` of every file as of its last poll"""
+        conn = connect_for_ingest(self.database_path)
+        try:
+            with conn:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {FILES_TABLE} (
+                        path TEXT PRIMARY KEY,
+                        byte_offset INTEGER NOT NULL,
+                        header BLOB,
+                        checksum TEXT,
+                        checksum_bytes INTEGER NOT NULL DEFAULT 0,
+                        rows INTEGER NOT NULL DEFAULT 0,
+                        size INTEGER,
+                        mtime REAL,
+                        updated_at REAL
+                    )""")
+            return {path: (size, mtime) for path, size, mtime in conn.execute(f"SELECT path, size, mtime FROM {FILES_TABLE}")}
+        finally:
+            conn.close()
+
+    def _state(self, conn, path):
+        row = conn.execute(
+            f"SELECT byte_offset, header, checksum, checksum_bytes, rows FROM {FILES_TABLE} WHERE path = ?", (path,)
+        ).fetchone()
+        return dict(zip(("byte_offset", "header", "checksum", "checksum_bytes", "rows"), row)) if row else None
+
+    def poll(self):
+        """Ingest the new rows of every watched file once; returns the total stats"""
+        total = new_ingest_stats()
+        known = self._known_files()
+        for path in self.files():
+            try:
+                stat = os.stat(path)
+                if known.get(path) == (stat.st_size, stat.st_mtime):
+                    continue  # Unchanged since the last poll: no need to open or hash it
+                stats = self.ingest_file(path, stat)
+            except Exception:
+                logger.exception("Could not ingest %s", path)
+                continue
+            for key in ("rows", "inserted", "updated", "unchanged", "skipped"):
+                total[key] += stats[key]
+            total["clients"] |= stats["clients"]
+        return total
+
+    def ingest_file(self, path, stat=None):
+        """Upsert the records appended to ``path`` since the last poll, one transaction per batch.
+
+        ``stat`` is the file's ``os.stat`` taken before reading; its size and mtime
+        are stored so the next poll skips the file unless it changed.
+        """
+        start = time.perf_counter()
+        stat = stat or os.stat(path)
+        stats = new_ingest_stats()
+        conn = connect_for_ingest(self.database_path)
+        try:
+            first_load = not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'incidents'"
+            ).fetchone()
+            state = self._state(conn, path)
+            # What the file's row must still hold when a batch commits (several watchers may share a database)
+            stored = (state["byte_offset"], state["checksum"]) if state else None
+            size = stat.st_size
+            if state is not None and (
+                size < state["byte_offset"] or _checksum(path, state["checksum_bytes"]) != state["checksum"]
+            ):
+                logger.info("%s was replaced; reading it again from the start", path)
+                state = None
+            if state is not None and size == state["byte_offset"]:
+                self._seen(conn, path, stat)
+                return stats  # Nothing new (e.g. only touched)
+
+            with open(path, "rb") as f, span("ingest.watch", file=os.path.basename(path)) as s:
+                if state is None:
+                    header = f.readline()
+                    if not header.endswith(b"\n"):
+                        return stats  # Header not fully written yet
+                    state = {"byte_offset": f.tell(), "header": header, "checksum": None, "checksum_bytes": 0, "rows": 0}
+                f.seek(state["byte_offset"])
+                prepared = False
+                while True:
+                    data, rows = read_records(f, self.batch_rows)
+                    # Last write of the file: exact lag for the batch's newest rows, a lower bound for older ones
+                    written_at = os.path.getmtime(path)
+                    if not rows:
+                        break
+                    chunk = pd.read_csv(io.BytesIO(state["header"] + data), dtype=str)
+                    batch_stats = new_ingest_stats()
+                    columns = list(chunk.columns)
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        if not self._claim(conn, path, stored):
+                            conn.execute("ROLLBACK")
+                            break  # Another watcher ingested these bytes first
+                        if not prepared:
+                            # Table, unique index and staging table; the header is the same for every batch
+                            prepare_upsert(conn, columns)
+                            prepared = True
+                        stage_chunk(conn, chunk, columns, batch_stats)
+                        merge_staging(conn, columns, batch_stats)
+                        state["byte_offset"] = f.tell()
+                        state["rows"] += len(chunk)
+                        self._save(conn, path, state)
+                        conn.execute("COMMIT")
+                        stored = (state["byte_offset"], state["checksum"])
+                    except Exception:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        raise
+                    observe("ingest.watch.freshness", max(time.time() - written_at, 0.0), rows=len(chunk),
+                            file=os.path.basename(path))
+                    for key in ("rows", "inserted", "updated", "unchanged", "skipped"):
+                        stats[key] += batch_stats[key]
+                    stats["clients"] |= batch_stats["clients"]
+                s.set(rows=stats["rows"])
+            self._seen(conn, path, stat)
+        finally:
+            conn.close()
+
+        if stats["rows"]:
+            if first_load:
+                # Create the full-text index on first load; its triggers keep it in sync afterwards
+                finalize_ingest(self.database_path)
+            stats["seconds"] = time.perf_counter() - start
+            record_history(self.database_path, os.path.basename(path), "watch", stats)
+        return stats
+
+    def _claim(self, conn, path, stored):
+        """Inside the batch's transaction: is the file's row still the one this watcher last saw?"""
+        row = conn.execute(f"SELECT byte_offset, checksum FROM {FILES_TABLE} WHERE path = ?", (path,)).fetchone()
+        return (tuple(row) if row else None) == stored
+
+    def _seen(self, conn, path, stat):
+        """Remember the size and mtime the file had before this poll read it"""
+        with conn:
+            conn.execute(
+                f"UPDATE {FILES_TABLE} SET size = ?, mtime = ? WHERE path = ?", (stat.st_size, stat.st_mtime, path)
+            )
+
+    def _save(self, conn, path, state):
+        checksum_bytes = min(CHECKSUM_BYTES, state["byte_offset"])
+        if state["checksum"] is None or checksum_bytes != state["checksum_bytes"]:
+            # Only while the file is shorter than CHECKSUM_BYTES does the checksummed prefix grow
+            state["checksum_bytes"] = checksum_bytes
+            state["checksum"] = _checksum(path, checksum_bytes)
+        conn.execute(
+            f"INSERT OR REPLACE INTO {FILES_TABLE} (path, byte_offset, header, checksum, checksum_bytes, rows, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, state["byte_offset"], state["header"], state["checksum"], state["checksum_bytes"],
+             state["rows"], time.time()),
+        )
+
+    def run(self, interval=WATCH_INTERVAL_S, stop=None):
+        """Poll until ``stop`` (a threading.Event) is set"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            stats = self.poll()
+            if stats["rows"]:
+                logger.info(
+                    "Ingested %s rows (%s inserted, %s updated)", stats["rows"], stats["inserted"], stats["updated"]
+                )
+            stop.wait(interval)
+
+    def start(self, interval=WATCH_INTERVAL_S):
+        """Run the watcher on a daemon thread; returns the Event that stops it"""
+        stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, args=(interval, stop), name="export-watcher", daemon=True)
+        self._thread.start()
+        return stop
+
+
+def main():
+    from noc_service import DATABASE_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=WATCH_DIR, help="directory of exports, or a single CSV file to tail")
+    parser.add_argument("--pattern", default=WATCH_PATTERN, help="file name pattern inside --dir")
+    parser.add_argument("--db", default=DATABASE_PATH, help="SQLite database to load into")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL_S, help="seconds between polls")
+    parser.add_argument("--batch-rows", type=int, default=WATCH_BATCH_ROWS, help="records per transaction")
+    parser.add_argument("--once", action="store_true", help="poll once and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    watcher = ExportWatcher(args.db, args.dir, args.pattern, args.batch_rows)
+    if args.once:
+        stats = watcher.poll()
+        print(f"{stats['rows']} rows: {stats['inserted']} inserted, {stats['updated']} updated, "
+              f"{stats['unchanged']} unchanged, {stats['skipped']} skipped")
+        return
+    start_metrics_server()
+    watcher.run(args.interval)
+
+
+if __name__ == "__main__":
+    main()
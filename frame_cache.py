@@ -0,0 +1,131 @@
+"""On-disk cache for the result tables shown in the chat history.
+
+Chat messages used to carry full DataFrames in ``st.session_state.messages``,
+so long sessions grew without bound and every rerun re-rendered every table.
+Tables now go into an SQLite cache file, one table per message, and the
+message keeps only the frame id, its shape and a few preview rows.
+
+The cache is capped at ``FRAME_CACHE_MAX_FRAMES`` tables across all sessions;
+the least recently read ones are dropped first, and their messages fall back
+to the preview.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+FRAME_CACHE_PATH = os.getenv("FRAME_CACHE_PATH", "chat_frames.db")
+FRAME_CACHE_MAX_FRAMES = int(os.getenv("FRAME_CACHE_MAX_FRAMES", "200"))
+PREVIEW_ROWS = 5
+
+
+def _table(frame_id):
+    return f'"frame_{frame_id}"'
+
+
+class FrameCache:
+    """LRU cache of DataFrames in an SQLite file, keyed by message frame id"""
+
+    def __init__(self, path=FRAME_CACHE_PATH, max_frames=FRAME_CACHE_MAX_FRAMES):
+        self.path = path
+        self.max_frames = max_frames
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            # Must be set before the first table so dropped frames give space back
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS frames (
+                        frame_id TEXT PRIMARY KEY,
+                        session_id TEXT,
+                        rows INTEGER,
+                        created_at REAL,
+                        accessed_at REAL
+                    )""")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_frames_accessed_at ON frames(accessed_at)")
+            self._initialized = True
+        return conn
+
+    def put(self, df, session_id=None):
+        """Store a DataFrame and return its frame id"""
+        frame_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    df.to_sql(f"frame_{frame_id}", conn, index=False)
+                    conn.execute(
+                        "INSERT INTO frames (frame_id, session_id, rows, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                        (frame_id, session_id, len(df), now, now),
+                    )
+                self._evict(conn)
+            finally:
+                conn.close()
+        return frame_id
+
+    def get(self, frame_id):
+        """Load a cached DataFrame, or None if it was evicted"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    found = conn.execute(
+                        "UPDATE frames SET accessed_at = ? WHERE frame_id = ?", (time.time(), frame_id)
+                    ).rowcount
+                if not found:
+                    return None
+                return pd.read_sql_query(f"SELECT * FROM {_table(frame_id)}", conn)
+            finally:
+                conn.close()
+
+    def drop_session(self, session_id):
+        """Remove all frames of a session (Clear Chat / logout)"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                ids = [row[0] for row in conn.execute("SELECT frame_id FROM frames WHERE session_id = ?", (session_id,))]
+                self._drop(conn, ids)
+            finally:
+                conn.close()
+
+    def _evict(self, conn):
+        excess = conn.execute("SELECT COUNT(*) FROM frames").fetchone()[0] - self.max_frames
+        if excess > 0:
+            ids = [row[0] for row in conn.execute(
+                "SELECT frame_id FROM frames ORDER BY accessed_at LIMIT ?", (excess,)
+            )]
+            self._drop(conn, ids)
+
+    def _drop(self, conn, frame_ids):
+        if not frame_ids:
+            return
+        with conn:
+            for frame_id in frame_ids:
+                conn.execute(f"DROP TABLE IF EXISTS {_table(frame_id)}")
+                conn.execute("DELETE FROM frames WHERE frame_id = ?", (frame_id,))
+        conn.execute("PRAGMA incremental_vacuum")
+
+
+frame_cache = FrameCache()
+
+
+def dataframe_message(df, session_id=None, cache=None):
+    """Chat message for a result table: a cache reference plus a small preview"""
+    cache = cache or frame_cache
+    return {
+        "role": "assistant",
+        "type": "dataframe",
+        "frame_id": cache.put(df, session_id),
+        "rows": len(df),
+        "columns": len(df.columns),
+        "preview": df.head(PREVIEW_ROWS),
+    }
@@ -0,0 +1,135 @@
+"""SQLite FTS5 full-text index over the free-text incident columns.
+
+``incidents_fts`` is an external-content FTS5 table over ``incidents``: it stores
+only the inverted index and reads the text back from ``incidents`` by rowid.
+Triggers keep it in sync with every insert, update and delete, so any ingest
+path (``to_sql`` appends, upserts) maintains it automatically.
+
+Queries use it through ``incident_id IN (SELECT incident_id FROM incidents_fts
+WHERE incidents_fts MATCH ...)``, which stays valid when ``incidents`` is
+replaced by a per-client view.
+
+Note: ``incidents`` has no INTEGER PRIMARY KEY, so ``VACUUM`` may renumber
+rowids. Call ``rebuild_fts_index`` after vacuuming.
+"""
+import re
+
+FTS_TABLE = "incidents_fts"
+FTS_COLUMNS = ["reason", "remarks", "task_comments", "client_comments", "task_resolutions"]
+
+
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def fts_available(conn):
+    """Whether the FTS index exists in this database"""
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+def ensure_fts_index(conn):
+    """Create the FTS index and its sync triggers if missing. Returns True if the index is usable."""
+    if fts_available(conn):
+        return True
+
+    columns = _table_columns(conn, "incidents")
+    if not columns or any(col not in columns for col in ["incident_id"] + FTS_COLUMNS):
+        return False  # No data yet, or an export without the free-text columns
+
+    indexed = ", ".join(FTS_COLUMNS)
+    new_values = ", ".join(f"new.{col}" for col in ["incident_id"] + FTS_COLUMNS)
+    old_values = ", ".join(f"old.{col}" for col in ["incident_id"] + FTS_COLUMNS)
+    with conn:
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"incident_id UNINDEXED, {indexed}, "
+            f"content='incidents', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')"
+        )
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON incidents BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, incident_id, {indexed}) VALUES (new.rowid, {new_values});
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON incidents BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, incident_id, {indexed}) VALUES ('delete', old.rowid, {old_values});
+            END""")
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON incidents BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, incident_id, {indexed}) VALUES ('delete', old.rowid, {old_values});
+                INSERT INTO {FTS_TABLE}(rowid, incident_id, {indexed}) VALUES (new.rowid, {new_values});
+            END""")
+        # The IN (SELECT incident_id ...) probe needs an index on the outer side
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_incidents_incident_id ON incidents(incident_id)")
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def rebuild_fts_index(conn):
+    """Rebuild the index from the incidents table (after VACUUM or bulk repair)"""
+    with conn:
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def fts_match_expression(keywords, columns=None):
+    """Build an FTS5 MATCH expression for any of the keywords in the given columns"""
+    terms = []
+    for keyword in keywords:
+        words = re.findall(r"\w+", keyword.lower())
+        if words:
+            phrase = " ".join(words).replace('"', '""')
+            terms.append(f'"{phrase}"*')
+    expression = " OR ".join(terms)
+    if columns:
+        expression = "{" + " ".join(columns) + "} : (" + expression + ")"
+    return expression
+
+
+def _match_predicate(expression):
+    expression = expression.replace("'", "''")
+    return f"incident_id IN (SELECT incident_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH '{expression}')"
+
+
+def fts_filter(keywords, columns=None):
+    """SQL predicate restricting incidents to rows whose text matches any keyword"""
+    return _match_predicate(fts_match_expression(keywords, columns))
+
+
+_FTS_COLUMN_RE = "|".join(FTS_COLUMNS)
+_LIKE_TERM = (
+    rf"(?:LOWER\(\s*(?:incidents\.)?(?:{_FTS_COLUMN_RE})\s*\)|(?:incidents\.)?(?:{_FTS_COLUMN_RE}))"
+    r"\s+LIKE\s+'%[^'%_]+%'"
+)
+_LIKE_TERM_PARTS = re.compile(
+    rf"(?:LOWER\(\s*(?:incidents\.)?({_FTS_COLUMN_RE})\s*\)|(?:incidents\.)?({_FTS_COLUMN_RE}))"
+    r"\s+LIKE\s+'%([^'%_]+)%'",
+    re.IGNORECASE,
+)
+_PAREN_CHAIN = re.compile(rf"\(\s*{_LIKE_TERM}(?:\s+OR\s+{_LIKE_TERM})*\s*\)", re.IGNORECASE)
+_SINGLE_TERM = re.compile(_LIKE_TERM, re.IGNORECASE)
+
+
+def _chain_to_fts(match):
+    keywords_by_column = {}
+    for name, plain_name, keyword in _LIKE_TERM_PARTS.findall(match.group(0)):
+        keywords_by_column.setdefault((name or plain_name).lower(), []).append(keyword)
+    return _match_predicate(" OR ".join(
+        fts_match_expression(keywords, [column]) for column, keywords in keywords_by_column.items()
+    ))
+
+
+def rewrite_like_to_fts(sql):
+    """Rewrite LIKE '%x%' searches on the free-text columns into FTS5 MATCH lookups.
+
+    Parenthesised OR-chains such as ``(LOWER(reason) LIKE '%fire%' OR LOWER(reason)
+    LIKE '%smoke%')`` become a single MATCH; any remaining lone terms are rewritten
+    one by one, which keeps AND/OR precedence intact. Matching becomes token-prefix
+    based ("fire" matches "fireman" but no longer "bonfire"). Queries with joins are
+    left unchanged because the bare incident_id reference could be ambiguous.
+    """
+    if re.search(r"\bJOIN\b", sql, re.IGNORECASE):
+        return sql
+    sql = _PAREN_CHAIN.sub(_chain_to_fts, sql)
+    return _SINGLE_TERM.sub(_chain_to_fts, sql)
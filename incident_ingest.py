@@ -0,0 +1,323 @@
+"""Bulk ingest of incident exports into the incidents table.
+
+``upsert_incidents`` loads rows into a temp staging table and merges them into
+``incidents`` with ``INSERT ... ON CONFLICT(incident_id) DO UPDATE`` under a
+unique index, all in one transaction. Re-uploading an overlapping export
+therefore updates rows in place instead of duplicating them; rows whose values
+did not change are left untouched (and do not fire the FTS triggers). The
+stats catalog (``db_stats``) is updated in the same transaction.
+
+``dedupe_incidents`` is the one-off job for databases that were filled by plain
+appends: it keeps the latest copy of every incident and creates the unique index.
+
+Usage:
+    python incident_ingest.py export.csv [--db noc_incidents.db]
+    python incident_ingest.py --dedupe [--db noc_incidents.db]
+"""
+import argparse
+import itertools
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from db_stats import apply_frame_delta, apply_staging_delta, recompute_stats, record_database_size, record_ingest
+from fts_index import ensure_fts_index
+from sql_templates import ensure_templates_table
+from tenant_db import ensure_client_index
+
+KEY_COLUMN = "incident_id"
+UNIQUE_INDEX = "idx_incidents_incident_id"
+CSV_CHUNK_ROWS = 100_000
+
+
+class DuplicateIncidentsError(Exception):
+    """The existing table has duplicate incident_ids, so the unique index cannot be built"""
+
+
+def _quote_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def read_incident_file(file, chunk_rows=CSV_CHUNK_ROWS, name=None):
+    """Yield DataFrame chunks (all columns as text) from a CSV or Excel upload"""
+    name = name or getattr(file, "name", str(file))
+    if name.endswith((".xlsx", ".xls")):
+        yield pd.read_excel(file, dtype=str)
+    else:
+        yield from pd.read_csv(file, dtype=str, chunksize=chunk_rows)
+
+
+def connect_for_ingest(database_path):
+    """Writer connection with explicit transaction control"""
+    conn = sqlite3.connect(database_path, isolation_level=None, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers keep working during long loads
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-65536")
+    return conn
+
+
+def _table_columns(conn, table="incidents"):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _ensure_incidents_table(conn, columns):
+    """Create incidents, or add any columns the export has that the table lacks"""
+    existing = _table_columns(conn)
+    if not existing:
+        column_defs = ", ".join(f"{_quote_ident(col)} TEXT" for col in columns)
+        conn.execute(f"CREATE TABLE incidents ({column_defs})")
+        return
+    for col in columns:
+        if col not in existing:
+            conn.execute(f"ALTER TABLE incidents ADD COLUMN {_quote_ident(col)} TEXT")
+
+
+def _ensure_unique_index(conn):
+    unique = any(
+        row[1] == UNIQUE_INDEX and row[2]
+        for row in conn.execute("PRAGMA index_list(incidents)")
+    )
+    if unique:
+        return
+    conn.execute(f"DROP INDEX IF EXISTS {UNIQUE_INDEX}")
+    try:
+        conn.execute(f"CREATE UNIQUE INDEX {UNIQUE_INDEX} ON incidents({KEY_COLUMN})")
+    except sqlite3.IntegrityError as e:
+        raise DuplicateIncidentsError(
+            "The incidents table already contains duplicate incident_ids. "
+            "Run `python incident_ingest.py --dedupe` once before upserting."
+        ) from e
+
+
+def new_ingest_stats():
+    return {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "clients": set()}
+
+
+def check_upsert_columns(columns):
+    if KEY_COLUMN not in columns:
+        raise ValueError(f"File must contain '{KEY_COLUMN}' column for upserts.")
+    if "client_name" not in columns:
+        raise ValueError("File must contain 'client_name' column for data isolation.")
+
+
+def prepare_upsert(conn, columns):
+    """Create / extend incidents and its unique index and an empty staging table.
+
+    Runs inside the caller's write transaction.
+    """
+    check_upsert_columns(columns)
+    _ensure_incidents_table(conn, columns)
+    _ensure_unique_index(conn)
+    conn.execute("DROP TABLE IF EXISTS temp.incidents_staging")
+    conn.execute(f"CREATE TEMP TABLE incidents_staging ({', '.join(_quote_ident(col) for col in columns)})")
+
+
+def stage_chunk(conn, chunk, columns, stats):
+    """Copy the rows of one chunk that have an incident_id into the staging table"""
+    if list(chunk.columns) != columns:
+        raise ValueError("All chunks of an upload must have the same columns.")
+    stats["rows"] += len(chunk)
+    keyed = chunk[chunk[KEY_COLUMN].notna() & (chunk[KEY_COLUMN].str.strip() != "")]
+    stats["skipped"] += len(chunk) - len(keyed)
+    stats["clients"].update(keyed["client_name"].dropna().unique().tolist())
+    rows = keyed.astype(object).where(keyed.notna(), None).itertuples(index=False, name=None)
+    conn.executemany(f"INSERT INTO incidents_staging VALUES ({', '.join('?' * len(columns))})", rows)
+
+
+def merge_staging(conn, columns, stats):
+    """Merge the staged rows into incidents and empty the staging table"""
+    # The last occurrence of an incident within the file wins
+    conn.execute(
+        "DELETE FROM incidents_staging WHERE rowid NOT IN "
+        f"(SELECT MAX(rowid) FROM incidents_staging GROUP BY {KEY_COLUMN})"
+    )
+    distinct = conn.execute("SELECT COUNT(*) FROM incidents_staging").fetchone()[0]
+    inserted = conn.execute(
+        f"SELECT COUNT(*) FROM incidents_staging s WHERE NOT EXISTS "
+        f"(SELECT 1 FROM incidents i WHERE i.{KEY_COLUMN} = s.{KEY_COLUMN})"
+    ).fetchone()[0]
+    apply_staging_delta(conn, "incidents_staging", KEY_COLUMN)
+
+    quoted = [_quote_ident(col) for col in columns]
+    column_list = ", ".join(quoted)
+    value_columns = [q for col, q in zip(columns, quoted) if col != KEY_COLUMN]
+    assignments = ", ".join(f"{q} = excluded.{q}" for q in value_columns)
+    changed = " OR ".join(f"incidents.{q} IS NOT excluded.{q}" for q in value_columns) or "0"
+    cursor = conn.execute(
+        f"INSERT INTO incidents ({column_list}) SELECT {column_list} FROM incidents_staging WHERE true "
+        f"ON CONFLICT({KEY_COLUMN}) DO UPDATE SET {assignments} WHERE {changed}"
+    )
+    # rowcount excludes trigger changes: inserted + actually-updated rows
+    updated = cursor.rowcount - inserted
+    stats["inserted"] += inserted
+    stats["updated"] += updated
+    stats["unchanged"] += distinct - inserted - updated
+    conn.execute("DELETE FROM incidents_staging")
+
+
+def insert_chunk(conn, chunk, stats):
+    """Insert one chunk as is, whatever its columns, inside the caller's transaction"""
+    columns = list(chunk.columns)
+    _ensure_incidents_table(conn, columns)
+    conn.executemany(
+        f"INSERT INTO incidents ({', '.join(_quote_ident(col) for col in columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))})",
+        chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None),
+    )
+    stats["rows"] += len(chunk)
+    stats["inserted"] += len(chunk)
+
+
+def append_chunk(conn, chunk, stats):
+    """Plain insert of one chunk (legacy append mode), inside the caller's transaction"""
+    if "client_name" not in chunk.columns:
+        raise ValueError("File must contain 'client_name' column for data isolation.")
+    insert_chunk(conn, chunk, stats)
+    apply_frame_delta(conn, chunk)
+    stats["clients"].update(chunk["client_name"].dropna().unique().tolist())
+
+
+def upsert_incidents(database_path, frames, source=None):
+    """Merge DataFrame chunks into incidents keyed on incident_id.
+
+    Returns a dict with rows read, inserted, updated, unchanged and skipped
+    (rows without an incident_id) counts, the clients seen and timings.
+    ``source`` is the file name recorded in the ingest history.
+    """
+    start = time.perf_counter()
+    conn = connect_for_ingest(database_path)
+    stats = new_ingest_stats()
+    try:
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None or first.empty:
+            raise ValueError("Uploaded file is empty.")
+        columns = list(first.columns)
+        check_upsert_columns(columns)
+
+        conn.execute("BEGIN IMMEDIATE")
+        prepare_upsert(conn, columns)
+        for chunk in itertools.chain([first], frames):
+            stage_chunk(conn, chunk, columns, stats)
+        merge_staging(conn, columns, stats)
+        conn.execute("DROP TABLE temp.incidents_staging")
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    finalize_ingest(database_path)
+    stats["clients"] = sorted(stats["clients"])
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    record_history(database_path, source, "upsert", stats)
+    return stats
+
+
+def append_incidents(database_path, frames, source=None):
+    """Insert DataFrame chunks into incidents as they are (legacy append mode).
+
+    All chunks and their stats catalog deltas are written in one transaction.
+    Returns the same stats as ``upsert_incidents``.
+    """
+    start = time.perf_counter()
+    conn = connect_for_ingest(database_path)
+    stats = new_ingest_stats()
+    try:
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None or first.empty:
+            raise ValueError("Uploaded file is empty.")
+
+        conn.execute("BEGIN IMMEDIATE")
+        for chunk in itertools.chain([first], frames):
+            append_chunk(conn, chunk, stats)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    finalize_ingest(database_path)
+    stats["clients"] = sorted(stats["clients"])
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    record_history(database_path, source, "append", stats)
+    return stats
+
+
+def finalize_ingest(database_path):
+    """Create derived indexes and the SQL template library on first load, refresh planner statistics"""
+    conn = sqlite3.connect(database_path)
+    try:
+        ensure_fts_index(conn)
+        ensure_client_index(conn)
+        ensure_templates_table(conn)
+        conn.execute("ANALYZE")
+        with conn:
+            record_database_size(conn)
+    finally:
+        conn.close()
+
+
+def record_history(database_path, source, mode, stats):
+    """Add a finished load to the ingest history"""
+    conn = sqlite3.connect(database_path, timeout=30)
+    try:
+        with conn:
+            record_ingest(conn, source, mode, stats)
+    finally:
+        conn.close()
+
+
+def dedupe_incidents(database_path):
+    """Keep the latest copy of each incident_id and add the unique index. Returns rows removed."""
+    conn = connect_for_ingest(database_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.execute(
+            f"DELETE FROM incidents WHERE {KEY_COLUMN} IS NOT NULL AND rowid NOT IN "
+            f"(SELECT MAX(rowid) FROM incidents WHERE {KEY_COLUMN} IS NOT NULL GROUP BY {KEY_COLUMN})"
+        )
+        removed = cursor.rowcount
+        _ensure_unique_index(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    recompute_stats(database_path)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", help="CSV or Excel export to upsert")
+    parser.add_argument("--db", default="noc_incidents.db")
+    parser.add_argument("--dedupe", action="store_true", help="Remove duplicate incident_ids and add the unique index")
+    args = parser.parse_args()
+
+    if args.dedupe:
+        print(f"Removed {dedupe_incidents(args.db)} duplicate rows")
+    if args.file:
+        stats = upsert_incidents(args.db, read_incident_file(args.file), source=os.path.basename(args.file))
+        print(
+            f"{stats['rows']} rows in {stats['seconds']:.1f}s ({stats['rows_per_sec']:,.0f} rows/s): "
+            f"{stats['inserted']} inserted, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['skipped']} skipped"
+        )
+    if not args.dedupe and not args.file:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""Background ingest jobs with progress, cancel and resume.
+
+``IngestQueue.submit`` spools an upload to ``INGEST_SPOOL_DIR`` and records a
+job in the ``ingest_jobs`` table of the target database, then returns at once
+with the job id. The upload therefore survives a browser reload, and any
+process (Streamlit session, API worker) can show the job's progress.
+
+A worker thread per process claims queued jobs (the claim is a conditional
+UPDATE, so several processes can share one queue) and loads the file in chunks
+of ``INGEST_CHUNK_ROWS`` rows. Each chunk is merged (``upsert``) or inserted
+(``append``; ``raw`` for any CSV, without the client_name check, per-client
+stats and indexes, used by the generic csv_db app) in its own transaction,
+together with the job's checkpoint
+(``rows_done``). A cancelled, failed or interrupted job thus resumes after the
+last committed chunk: earlier rows are parsed again but skipped. Readers see
+the rows of finished chunks while the rest of the file is still loading.
+
+Cancelling sets a flag that the worker checks between chunks. A running job
+whose worker stopped heartbeating for ``INGEST_STALE_S`` seconds, for
+example because its process was restarted, goes back to the queue the next
+time a worker polls.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from fts_index import ensure_fts_index
+from incident_ingest import (
+    append_chunk, connect_for_ingest, finalize_ingest, insert_chunk, merge_staging, new_ingest_stats,
+    prepare_upsert, read_incident_file, record_history, stage_chunk,
+)
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = "ingest_jobs"
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "ingest_uploads")
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "20000"))
+# Seconds an idle worker waits before looking for jobs submitted by other processes
+INGEST_POLL_S = float(os.getenv("INGEST_POLL_S", "2"))
+INGEST_STALE_S = float(os.getenv("INGEST_STALE_S", "60"))
+
+MODES = ("upsert", "append", "raw")
+RESUMABLE = ("failed", "cancelled")
+
+
+class JobNotFound(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _safe_name(filename):
+    return re.sub(r"[^\w.-]", "_", os.path.basename(filename)) or "upload.csv"
+
+
+def estimate_rows(path, filename):
+    """Data rows in a CSV, counting lines (quoted line breaks overcount); None for Excel"""
+    if filename.endswith((".xlsx", ".xls")):
+        return None
+    lines, last = 0, b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    lines += last != b"\n"
+    return max(lines - 1, 0)
+
+
+def _progress(row):
+    """Job row as a dict with percent done, rows/s over the current run and ETA"""
+    job = dict(row)
+    job["stats"] = json.loads(job["stats"] or "{}")
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    elapsed = (job["heartbeat_at"] or 0) - (job["started_at"] or 0)
+    run_rows = job["rows_done"] - job["run_rows_start"]
+    job["rows_per_sec"] = run_rows / elapsed if run_rows and elapsed > 0 else None
+    total = job["rows_total"]
+    if job["status"] == "done":
+        job["percent"] = 100.0
+    elif total:
+        job["percent"] = min(99.0, 100.0 * job["rows_done"] / total)
+    else:
+        job["percent"] = None
+    job["eta_s"] = None
+    if job["status"] == "running" and job["rows_per_sec"] and total:
+        job["eta_s"] = max(total - job["rows_done"], 0) / job["rows_per_sec"]
+    return job
+
+
+class IngestQueue:
+    """Persistent ingest jobs of one database plus this process's worker thread"""
+
+    def __init__(self, database_path, spool_dir=INGEST_SPOOL_DIR, chunk_rows=INGEST_CHUNK_ROWS):
+        self.database_path = database_path
+        self.spool_dir = spool_dir
+        self.chunk_rows = chunk_rows
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._table_ready:
+            with conn:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+                        job_id TEXT PRIMARY KEY,
+                        filename TEXT,
+                        path TEXT,
+                        mode TEXT,
+                        status TEXT NOT NULL,
+                        rows_done INTEGER NOT NULL DEFAULT 0,
+                        rows_total INTEGER,
+                        run_rows_start INTEGER NOT NULL DEFAULT 0,
+                        run_seconds REAL NOT NULL DEFAULT 0,
+                        stats TEXT,
+                        error TEXT,
+                        cancel_requested INTEGER NOT NULL DEFAULT 0,
+                        worker TEXT,
+                        created_by TEXT,
+                        created_at REAL,
+                        started_at REAL,
+                        heartbeat_at REAL,
+                        finished_at REAL
+                    )""")
+            self._table_ready = True
+        return conn
+
+    # Submitting and inspecting jobs
+
+    def submit(self, file, filename=None, mode="upsert", username=None):
+        """Spool ``file`` (path or file object) and queue it; returns the job dict"""
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        filename = filename or getattr(file, "name", None) or str(file)
+        job_id = uuid.uuid4().hex[:12]
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f"{job_id}_{_safe_name(filename)}")
+        if isinstance(file, (str, os.PathLike)):
+            shutil.copyfile(file, path)
+        else:
+            if hasattr(file, "seek"):
+                file.seek(0)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(file, out)
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"INSERT INTO {JOBS_TABLE} (job_id, filename, path, mode, status, rows_total, stats, "
+                    "created_by, created_at) VALUES (?, ?, ?, ?, 'queued', ?, '{}', ?, ?)",
+                    (job_id, filename, path, mode, estimate_rows(path, filename), username, time.time()),
+                )
+        finally:
+            conn.close()
+        self.start()
+        return self.job(job_id)
+
+    def job(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT * FROM {JOBS_TABLE} WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            raise JobNotFound(f"No ingest job {job_id}")
+        return _progress(row)
+
+    def jobs(self, limit=20):
+        """Most recent jobs first; also makes sure interrupted jobs get picked up again"""
+        self.start()
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT * FROM {JOBS_TABLE} ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [_progress(row) for row in rows]
+
+    def cancel(self, job_id):
+        """Cancel a queued job now, or a running one after its current chunk"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                    (time.time(), job_id),
+                )
+                conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,)
+                )
+        finally:
+            conn.close()
+        return self.job(job_id)
+
+    def resume(self, job_id):
+        """Queue a failed or cancelled job again; it continues after its last checkpoint"""
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET status = 'queued', cancel_requested = 0, error = NULL, "
+                    f"finished_at = NULL WHERE job_id = ? AND status IN ({', '.join('?' * len(RESUMABLE))})",
+                    (job_id, *RESUMABLE),
+                )
+        finally:
+            conn.close()
+        if not cursor.rowcount:
+            job = self.job(job_id)
+            raise ValueError(f"Job {job_id} is {job['status']}; only failed or cancelled jobs can be resumed")
+        self.start()
+        return self.job(job_id)
+
+    # Worker
+
+    def start(self):
+        """Start this process's worker thread if it is not running, and wake it"""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name="ingest-worker", daemon=True)
+                self._worker.start()
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            try:
+                self._requeue_stale()
+                job = self._claim()
+            except Exception:
+                logger.exception("Ingest worker could not poll the job table")
+                job = None
+            if job is not None:
+                self._run(job)
+                continue
+            self._wake.wait(INGEST_POLL_S)
+            self._wake.clear()
+
+    def _requeue_stale(self):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET status = 'queued', worker = NULL "
+                    "WHERE status = 'running' AND heartbeat_at < ?",
+                    (time.time() - INGEST_STALE_S,),
+                )
+        finally:
+            conn.close()
+
+    def _claim(self):
+        """Mark the oldest queued job as running in this process; None if there is none"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                f"SELECT job_id FROM {JOBS_TABLE} WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            with conn:
+                cursor = conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, "
+                    "run_rows_start = rows_done WHERE job_id = ? AND status = 'queued'",
+                    (self.worker_id, now, now, row["job_id"]),
+                )
+            if not cursor.rowcount:
+                return None  # Another process claimed it first
+            return dict(conn.execute(f"SELECT * FROM {JOBS_TABLE} WHERE job_id = ?", (row["job_id"],)).fetchone())
+        finally:
+            conn.close()
+
+    def _heartbeat(self, job_id, stop):
+        """Keep the job's heartbeat fresh while a long step (e.g. the first FTS build) runs"""
+        while not stop.wait(INGEST_STALE_S / 3):
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(f"UPDATE {JOBS_TABLE} SET heartbeat_at = ? WHERE job_id = ?", (time.time(), job_id))
+            except sqlite3.Error:
+                pass  # The next chunk's checkpoint updates it as well
+            finally:
+                conn.close()
+
+    def _run(self, job):
+        job_id, mode = job["job_id"], job["mode"]
+        start = time.perf_counter()
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, stop), daemon=True).start()
+        try:
+            with span(f"ingest.job.{mode}") as s:
+                stats, rows_done = self._load_chunks(job, s)
+            stats["seconds"] = job["run_seconds"] + time.perf_counter() - start
+            stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+            if mode == "raw":
+                self._index_raw()
+            else:
+                # Create the full-text index on first load; its triggers keep it in sync afterwards
+                finalize_ingest(self.database_path)
+                record_history(self.database_path, job["filename"], mode, {**stats, "clients": sorted(stats["clients"])})
+            self._finish(job_id, "done", start, stats=stats, rows_total=rows_done)
+            os.remove(job["path"])
+        except JobCancelled:
+            self._finish(job_id, "cancelled", start)
+        except Exception as e:
+            logger.exception("Ingest job %s failed", job_id)
+            self._finish(job_id, "failed", start, error=str(e))
+        finally:
+            stop.set()
+
+    def _load_chunks(self, job, s):
+        """Commit the job's remaining chunks one transaction each; returns (stats, rows_done)"""
+        job_id, mode, rows_done = job["job_id"], job["mode"], job["rows_done"]
+        stats = json.loads(job["stats"] or "{}") or new_ingest_stats()
+        stats["clients"] = set(stats.get("clients", []))
+        read, prepared = 0, False
+        conn = connect_for_ingest(self.database_path)
+        try:
+            for frame in read_incident_file(job["path"], self.chunk_rows, name=job["filename"]):
+                if job["rows_total"] is None:
+                    # Excel: the whole sheet arrives as one frame, so now the total is known
+                    job["rows_total"] = len(frame)
+                    with conn:
+                        conn.execute(f"UPDATE {JOBS_TABLE} SET rows_total = ? WHERE job_id = ?", (len(frame), job_id))
+                for offset in range(0, len(frame), self.chunk_rows):
+                    chunk = frame.iloc[offset:offset + self.chunk_rows]
+                    if read + len(chunk) <= rows_done:
+                        read += len(chunk)
+                        continue  # Committed by an earlier run
+                    chunk = chunk.iloc[rows_done - read:] if read < rows_done else chunk
+                    read += len(chunk)
+                    if self._cancel_requested(conn, job_id):
+                        raise JobCancelled()
+
+                    columns = list(chunk.columns)
+                    conn.execute("BEGIN IMMEDIATE")
+                    if mode == "upsert":
+                        if not prepared:
+                            prepare_upsert(conn, columns)
+                            prepared = True
+                        stage_chunk(conn, chunk, columns, stats)
+                        merge_staging(conn, columns, stats)
+                    elif mode == "append":
+                        append_chunk(conn, chunk, stats)
+                    else:
+                        insert_chunk(conn, chunk, stats)
+                    rows_done = read
+                    self._checkpoint(conn, job_id, rows_done, stats)
+                    conn.execute("COMMIT")
+                    s.set(rows=len(chunk))
+            if rows_done == 0:
+                raise ValueError("Uploaded file is empty.")
+            return stats, rows_done
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _index_raw(self):
+        """Full-text index for a raw load, if the CSV has the free-text columns; nothing client-specific"""
+        conn = sqlite3.connect(self.database_path, timeout=30)
+        try:
+            ensure_fts_index(conn)
+        finally:
+            conn.close()
+
+    def _cancel_requested(self, conn, job_id):
+        row = conn.execute(f"SELECT cancel_requested FROM {JOBS_TABLE} WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _checkpoint(self, conn, job_id, rows_done, stats):
+        """Record progress inside the chunk's transaction, so rows and checkpoint commit together"""
+        conn.execute(
+            f"UPDATE {JOBS_TABLE} SET rows_done = ?, stats = ?, heartbeat_at = ?, "
+            "rows_total = MAX(IFNULL(rows_total, 0), ?) WHERE job_id = ?",
+            (rows_done, json.dumps({**stats, "clients": sorted(stats["clients"])}), time.time(), rows_done, job_id),
+        )
+
+    def _finish(self, job_id, status, start, stats=None, rows_total=None, error=None):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"UPDATE {JOBS_TABLE} SET status = ?, error = ?, finished_at = ?, heartbeat_at = ?, "
+                    "run_seconds = run_seconds + ?, cancel_requested = 0, "
+                    "stats = IFNULL(?, stats), rows_total = IFNULL(?, rows_total) WHERE job_id = ?",
+                    (
+                        status, error, time.time(), time.time(), time.perf_counter() - start,
+                        json.dumps({**stats, "clients": sorted(stats["clients"])}) if stats else None,
+                        rows_total, job_id,
+                    ),
+                )
+        finally:
+            conn.close()
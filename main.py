@@ -1,17 +1,14 @@
 import streamlit as st
-import requests
-from datetime import datetime
 import uuid
 import os
+from importlib import import_module
+from importlib.util import find_spec
 from dotenv import load_dotenv
-import pandas as pd
-import io
-import json
-import traceback
-import openpyxl
-import sqlite3
-from sqlalchemy import create_engine, text
-import hashlib
+from tracing import start_metrics_server
+from warmup import start_warmup
+
+# pandas, sqlalchemy and the pipeline (noc_service, frame_cache) are imported where they
+# are used, so the login page renders without them; start_warmup loads them in the background
 
 # Set up error handling
 try:
@@ -20,58 +17,24 @@ try:
 except Exception as e:
     pass  # Continue even if .env file doesn't exist
 
-# Enhanced user credentials with admin user
-USER_DB = {
-    "gp_user": {"password": "gp123", "client": "GP", "role": "user"},
-    "bl_user": {"password": "bl123", "client": "Banglalink", "role": "user"},
-    "admin": {"password": "admin123", "client": "ALL", "role": "admin"},
-}
-
-# Database configuration
-DATABASE_PATH = "noc_incidents.db"
-
-# System prompts
-SQL_GENERATION_PROMPT = """
-You are an AI assistant that converts natural language questions into SQL queries for an SQLite database.
-Analyze the database schema and generate a valid SQL query with proper client filtering.
-Return ONLY the SQL query. DO NOT RETURN ANYTHING ELSE! Do not include any explanation or formatting, just the raw SQL.
-
-Database schema: 
-[incident_id, incident_title, ticket_id, ticket_title, fault_id, client_name, link_name_nttn, link_name_gateway, link_id, LH, capacity_nttn, capacity_gateway, uni_nni, issue_type, client_priority, link_type, problem_category, problem_source, reason, event_time, escalation_time, clear_time, client_side_impact, provider_side_impact, remarks, responsible_concern, responsible_field_team, fault_status, created_time, task_comments, client_comments, provider, task_resolutions, subcenter, region, district, vendor, duration, last_om_comment_id, last_om_end_time, last_om_end_time_db, ticket_initiator_id, ticket_closer_id, fault_closer_id, sms_time, force_majeure, vlan_id, assigned_dept_names, number_of_occurance]
-
-STRICT OUTPUT RULES:
-- DO NOT include explanations, formatting, or prefixes
-- DO NOT wrap the query inside ```sql``` blocks
-- The output must start directly with SELECT
-- ALWAYS include WHERE client_name = '{client}' for data isolation
-
+# The pipeline lives in noc_service; this module is the Streamlit UI on top of it
+@st.cache_resource
+def get_service():
+    """One service (and connection pool) per Streamlit server process"""
+    from noc_service import DATABASE_PATH, NocService
+    return NocService(DATABASE_PATH)
 
-Current client: {client}
-Question: {question}
-"""
-
-CONVERSATION_PROMPT = """You are a helpful NOC assistant answering network incident queries.
-Current date: {current_date}
-Client: {client}
-
-You have access to specific incident data in your conversation memory:
-{incident_data}
-
-User question: {question}
-
-Provide a clear, concise answer based on the incident data in your memory. 
-Focus on the specific incident details, timeline, resolution steps, and any relevant technical information.
-If the user asks about information not available in the current incident data, 
-respond with "I don't have that specific information for this incident."
-"""
-
-# Define API endpoint and models
-OLLAMA_URL = os.getenv("OLLAMA_URL", "http://192.168.5.201:11434/api/generate")
-SQL_MODEL = os.getenv("SQL_MODEL", "qwen2.5-coder:7b")
-CHAT_MODEL = os.getenv("CHAT_MODEL", "llama3.2")
+def warm_up():
+    """Import the pipeline, open its connections and load the models after the first render"""
+    start_warmup("noc", [
+        ("service", lambda: get_service().warm_up()),
+        ("frame_cache", lambda: import_module("frame_cache")),
+    ])
 
 def init_database():
     """Initialize the database with proper schema"""
+    from sqlalchemy import create_engine, text
+    from noc_service import DATABASE_PATH
     try:
         engine = create_engine(f"sqlite:///{DATABASE_PATH}", echo=False)
         
@@ -86,139 +49,6 @@ def init_database():
         st.error(f"Database initialization error: {str(e)}")
         return None
 
-def create_or_append_data(file, engine):
-    """Create or append data to database"""
-    try:
-        if file.name.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file, dtype=str)
-        else:
-            df = pd.read_csv(file, dtype=str)
-        
-        if df.empty:
-            raise ValueError("Uploaded file is empty.")
-        
-        # Ensure client_name column exists for data isolation
-        if 'client_name' not in df.columns:
-            raise ValueError("File must contain 'client_name' column for data isolation.")
-        
-        # Append to database
-        df.to_sql("incidents", con=engine, if_exists="append", index=False)
-        
-        return len(df), df['client_name'].unique().tolist()
-    except Exception as e:
-        raise Exception(f"Error processing file: {str(e)}")
-
-def execute_sql_query(query, client):
-    """Execute SQL query with client filtering and security measures"""
-    try:
-        # Additional security: ensure client filtering is present
-        query_lower = query.lower()
-        if "where" not in query_lower or client.lower() not in query_lower:
-            if client != "ALL":  # Admin can see all data
-                # Add client filtering if missing (security failsafe)
-                if "where" in query_lower:
-                    query += f" AND client_name = '{client}'"
-                else:
-                    query += f" WHERE client_name = '{client}'"
-        
-        engine = create_engine(f"sqlite:///{DATABASE_PATH}", echo=False)
-        with engine.connect() as conn:
-            result = pd.read_sql_query(text(query), conn)
-        
-        return result
-    except Exception as e:
-        raise Exception(f"Query execution error: {str(e)}")
-
-def call_sql_llm(client, question):
-    """Call LLM for SQL generation"""
-    payload = {
-        "model": SQL_MODEL,
-        "prompt": SQL_GENERATION_PROMPT.format(
-            client=client,
-            question=question
-        ),
-        "stream": False
-    }
-    
-    try:
-        response = requests.post(OLLAMA_URL, json=payload)
-        if response.status_code == 200:
-            return response.json().get("response", "").strip()
-        else:
-            return None
-    except Exception as e:
-        st.error(f"SQL LLM error: {str(e)}")
-        return None
-
-def call_chat_llm(client, question, incident_data):
-    """Call LLM for conversational responses"""
-    if isinstance(incident_data, dict):
-        data_str = json.dumps(incident_data, indent=2)
-    else:
-        data_str = str(incident_data)
-    
-    payload = {
-        "model": CHAT_MODEL,
-        "prompt": CONVERSATION_PROMPT.format(
-            client=client,
-            question=question,
-            current_date=datetime.now().strftime("%Y-%m-%d"),
-            incident_data=data_str
-        ),
-        "stream": False
-    }
-    
-    try:
-        response = requests.post(OLLAMA_URL, json=payload)
-        if response.status_code == 200:
-            return response.json().get("response", "I couldn't process your request.")
-        else:
-            return "I'm having trouble accessing my knowledge base right now."
-    except Exception as e:
-        st.error(f"Chat LLM error: {str(e)}")
-        return "I'm currently unable to process your request due to a connection issue."
-
-def is_single_incident_query(query_result):
-    """Determine if query result is a single incident"""
-    return len(query_result) == 1
-
-def prepare_summary_for_memory(df):
-    """Prepare a summary of multiple incidents for conversational memory"""
-    if len(df) == 0:
-        return "No incidents found."
-    
-    summary_data = {
-        "total_incidents": len(df),
-        "clients": df.get('client_name', pd.Series()).unique().tolist(),
-        "incident_ids": df.get('incident_id', pd.Series()).head(10).tolist(),  # First 10 IDs
-        "ticket_ids": df.get('ticket_id', pd.Series()).head(10).tolist(),
-        "link_names": df.get('link_name_nttn', pd.Series()).dropna().head(10).tolist(),
-        "recent_events": df.get('event_time', pd.Series()).head(5).tolist()
-    }
-    
-    return summary_data
-
-def prepare_data_for_display(df):
-    """Optimize data for display in dataframe"""
-    if len(df.columns) <= 10:
-        return df
-    
-    # Key columns for display
-    key_columns = [
-        'incident_id', 'ticket_id', 'client_name', 'link_name_nttn', 
-        'issue_type', 'problem_category', 'fault_status', 'event_time', 
-        'clear_time', 'duration', 'region', 'district'
-    ]
-    
-    # Keep only existing key columns
-    columns_to_show = [col for col in key_columns if col in df.columns]
-    
-    # If no key columns exist, show first 10 columns
-    if not columns_to_show:
-        columns_to_show = df.columns[:10].tolist()
-    
-    return df[columns_to_show]
-
 def login_page():
     """Display login form"""
     st.title("NOC Assistant Login")
@@ -229,31 +59,63 @@ def login_page():
         submit_button = st.form_submit_button("Login")
     
     if submit_button:
-        user = USER_DB.get(username)
-        if user and user["password"] == password:
+        from noc_service import AuthenticationError
+        try:
+            user = get_service().login(username, password)
+        except AuthenticationError as e:
+            st.error(str(e))
+        else:
             st.session_state.authenticated = True
-            st.session_state.username = username
-            st.session_state.client = user["client"]
-            st.session_state.role = user["role"]
+            st.session_state.user = user
+            st.session_state.username = user.username
+            st.session_state.client = user.client
+            st.session_state.role = user.role
             st.session_state.messages = []
             st.session_state.conversation_memory = None
+            forget_result()
+            clear_cached_tables()
             st.rerun()
-        else:
-            st.error("Invalid username or password")
 
 def admin_interface():
     """Admin interface for data management"""
     st.header("Admin Panel - Data Management")
+    import pandas as pd
+    from noc_service import DATABASE_PATH
     
-    # Database status
-    try:
-        engine = create_engine(f"sqlite:///{DATABASE_PATH}", echo=False)
-        with engine.connect() as conn:
-            result = conn.execute(text("SELECT COUNT(*) as count, COUNT(DISTINCT client_name) as clients FROM incidents"))
-            stats = result.fetchone()
-            st.info(f"Database contains {stats[0]} incidents from {stats[1]} clients")
-    except:
+    service = get_service()
+    user = st.session_state.user
+    
+    # Database status, read from the stats catalog maintained by the ingest path
+    stats = service.database_stats(user)
+    if stats is None:
         st.warning("Database not initialized or empty")
+    else:
+        st.info(f"Database contains {stats['total_rows']} incidents from {stats['client_count']} clients")
+        col1, col2 = st.columns(2)
+        col1.caption(f"Last load: {stats['last_load_at'] or 'never'}")
+        if stats['size_bytes']:
+            col2.caption(f"Size on disk: {int(stats['size_bytes']) / 2**20:.1f} MiB")
+        with st.expander("Per-client statistics"):
+            st.dataframe(stats['clients'], use_container_width=True, hide_index=True)
+        with st.expander("Ingest history"):
+            st.dataframe(stats['history'], use_container_width=True, hide_index=True)
+    
+    if os.path.exists(DATABASE_PATH) and st.button("Recompute statistics"):
+        with st.spinner("Scanning incidents..."):
+            service.recompute_stats(user)
+        st.rerun()
+    
+    # Where time goes, per pipeline stage, from the trace log
+    with st.expander("Pipeline performance"):
+        summary = service.pipeline_summary(user)
+        if summary:
+            st.dataframe(pd.DataFrame(summary), use_container_width=True, hide_index=True)
+        else:
+            st.caption("No traces recorded yet.")
+        repairs = service.repair_summary(user)
+        if repairs:
+            st.caption("SQL self-repair")
+            st.dataframe(pd.DataFrame(repairs), use_container_width=True, hide_index=True)
     
     # File upload
     st.subheader("Upload Incident Data")
@@ -263,15 +125,153 @@ def admin_interface():
         help="File must contain 'client_name' column for proper data isolation"
     )
     
-    if uploaded_file and st.button("Process and Append Data"):
+    mode = st.radio(
+        "Load mode",
+        ["Upsert (by incident_id)", "Append"],
+        help="Upsert updates incidents that already exist instead of adding duplicates"
+    )
+    
+    if uploaded_file and st.button("Process Data"):
         try:
             engine = init_database()
             if engine:
-                with st.spinner("Processing file..."):
-                    record_count, clients = create_or_append_data(uploaded_file, engine)
-                    st.success(f"✅ Successfully added {record_count} records for clients: {', '.join(clients)}")
+                # Loads in the background; progress shows below and survives a page reload
+                job = service.submit_ingest(user, uploaded_file, "append" if mode == "Append" else "upsert",
+                                            uploaded_file.name)
+                st.success(f"Queued {job['filename']} as job {job['job_id']}")
         except Exception as e:
             st.error(f"Error: {str(e)}")
+    
+    st.subheader("Ingest Jobs")
+    if hasattr(st, "fragment"):
+        # Only this panel reruns while jobs are loading
+        st.fragment(run_every=2)(ingest_jobs_panel)()
+    else:
+        st.button("Refresh")
+        ingest_jobs_panel()
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+def job_summary(job):
+    """One-line result of a finished ingest job"""
+    stats = job['stats']
+    clients = ', '.join(stats.get('clients', []))
+    if job['mode'] == "append":
+        return f"✅ Successfully added {stats['rows']} records for clients: {clients}"
+    return (
+        f"✅ Processed {stats['rows']} records for clients: {clients} — "
+        f"{stats['inserted']} inserted, {stats['updated']} updated, "
+        f"{stats['unchanged']} unchanged"
+        + (f", {stats['skipped']} skipped (no incident_id)" if stats['skipped'] else "")
+    )
+
+def ingest_jobs_panel():
+    """Progress of recent ingest jobs, with cancel and resume"""
+    service = get_service()
+    user = st.session_state.user
+    jobs = service.ingest_job_list(user, limit=10)
+    if not jobs:
+        st.caption("No ingest jobs yet.")
+        return
+    
+    for job in jobs:
+        with st.container(border=True):
+            st.markdown(f"**{job['filename']}** · {job['mode']} · `{job['job_id']}` · {job['status']}")
+            total = job['rows_total']
+            rows = f"{job['rows_done']:,} / {total:,} rows" if total else f"{job['rows_done']:,} rows"
+            details = [rows]
+            if job['rows_per_sec']:
+                details.append(f"{job['rows_per_sec']:,.0f} rows/s")
+            if job['eta_s'] is not None:
+                details.append(f"ETA {format_duration(job['eta_s'])}")
+            if job['percent'] is not None:
+                st.progress(job['percent'] / 100, text=" · ".join(details))
+            else:
+                st.caption(" · ".join(details))
+            
+            if job['status'] == "done":
+                st.caption(job_summary(job))
+            elif job['status'] == "failed":
+                st.error(job['error'])
+            
+            if job['status'] in ("queued", "running"):
+                if job['cancel_requested']:
+                    st.caption("Cancelling after the current chunk...")
+                elif st.button("Cancel", key=f"cancel_{job['job_id']}"):
+                    service.cancel_ingest(user, job['job_id'])
+                    st.rerun()
+            elif job['status'] in ("failed", "cancelled"):
+                if st.button("Resume", key=f"resume_{job['job_id']}",
+                             help="Continue after the last committed chunk"):
+                    service.resume_ingest(user, job['job_id'])
+                    st.rerun()
+
+def forget_result():
+    get_service().forget(st.session_state.user, st.session_state.get("session_id"))
+    st.session_state.result_handle = None
+
+def clear_cached_tables():
+    """Drop the session's tables from the on-disk frame cache"""
+    if st.session_state.get("session_id"):
+        from frame_cache import frame_cache
+        frame_cache.drop_session(st.session_state.session_id)
+
+def show_answer(answer, prompt):
+    """Turn a service answer into chat messages, conversation memory and sidebar state"""
+    if answer.sql:
+        # Show the generated SQL query in the sidebar for debugging
+        st.sidebar.subheader("Follow-up SQL (previous result)" if answer.followup else "Generated SQL Query")
+        st.sidebar.code(answer.sql, language="sql")
+    if answer.status == "confirm":
+        # Expensive but allowed - wait for the user to confirm from the sidebar
+        st.session_state.pending_query = {
+            "prompt": prompt, "sql": answer.sql, "confirmation_id": answer.extra["confirmation_id"]
+        }
+    if answer.status == "error":
+        st.error(f"Error processing query: {answer.extra.get('error')}")
+    
+    if answer.memory is not None:
+        st.session_state.conversation_memory = answer.memory
+    if answer.status == "ok" and (answer.sql or answer.followup):
+        # The service replaced (or dropped) the session's result handle
+        st.session_state.result_handle = answer.handle
+    if "template" in answer.extra:
+        st.sidebar.caption(f"⚡ Answered from verified template '{answer.extra['template']}'")
+    if "repaired" in answer.extra:
+        st.sidebar.caption(f"🔧 Generated query was repaired ({answer.extra['repaired']})")
+    # Generated queries that returned rows can be promoted to the template library by admins
+    if answer.status == "ok" and answer.sql and not answer.followup and "template" not in answer.extra and answer.handle:
+        st.session_state.promotable = {"prompt": prompt, "sql": answer.sql}
+    else:
+        st.session_state.promotable = None
+    
+    st.session_state.messages.append({"role": "assistant", "content": answer.text})
+    if answer.table is not None:
+        # The table itself goes to the on-disk frame cache; the message keeps a preview
+        from frame_cache import dataframe_message
+        st.session_state.messages.append(dataframe_message(answer.table, st.session_state.session_id))
+
+def render_message(message, expand=False):
+    """Render a chat message; cached tables are only loaded when shown in full"""
+    if message.get("type") != "dataframe":
+        st.markdown(message["content"])
+        return
+    if "frame_id" not in message:
+        st.dataframe(message["content"], use_container_width=True)
+        return
+    from frame_cache import PREVIEW_ROWS, frame_cache
+    
+    if message["rows"] > PREVIEW_ROWS and (
+        expand or st.toggle(f"Show all {message['rows']} rows", key=f"show_{message['frame_id']}")
+    ):
+        df = frame_cache.get(message["frame_id"])
+        if df is not None:
+            st.dataframe(df, use_container_width=True)
+            return
+        st.caption("This table is no longer cached; showing the first rows only.")
+    st.dataframe(message["preview"], use_container_width=True)
 
 def chat_interface():
     """Main chat interface"""
@@ -282,13 +282,12 @@ def chat_interface():
     st.title(f"NOC Assistant - {st.session_state.client}")
     st.write(f"Welcome, {st.session_state.username}!")
     
-    # Display chat messages
-    for message in st.session_state.messages:
+    # Display chat messages; only the latest table is loaded in full
+    tables = [i for i, message in enumerate(st.session_state.messages) if message.get("type") == "dataframe"]
+    latest_table = tables[-1] if tables else None
+    for i, message in enumerate(st.session_state.messages):
         with st.chat_message(message["role"]):
-            if message.get("type") == "dataframe":
-                st.dataframe(message["content"], use_container_width=True)
-            else:
-                st.markdown(message["content"])
+            render_message(message, expand=i == latest_table)
     
     # Chat input
     if prompt := st.chat_input("Ask about incidents..."):
@@ -297,68 +296,63 @@ def chat_interface():
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        try:
-            with st.spinner("Processing your query..."):
-                # Generate SQL query
-                sql_query = call_sql_llm(st.session_state.client, prompt)
-                # Show the generated SQL query in the sidebar for debugging
-                st.sidebar.subheader("Generated SQL Query")
-                st.sidebar.code(sql_query, language="sql")
-
-                
-                if sql_query:
-                    # Execute query
-                    query_result = execute_sql_query(sql_query, st.session_state.client)
-                    
-                    if len(query_result) == 0:
-                        response = "No incidents found matching your query."
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                    
-                    elif is_single_incident_query(query_result):
-                        # Single incident - store in conversation memory and use chat LLM
-                        incident_data = query_result.iloc[0].to_dict()
-                        st.session_state.conversation_memory = incident_data
-                        
-                        response = call_chat_llm(st.session_state.client, prompt, incident_data)
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                    
-                    else:
-                        # Multiple incidents - show table and store summary in memory
-                        display_df = prepare_data_for_display(query_result)
-                        summary_data = prepare_summary_for_memory(query_result)
-                        st.session_state.conversation_memory = summary_data
-                        
-                        response = f"Found {len(query_result)} incidents matching your query:"
-                        st.session_state.messages.append({"role": "assistant", "content": response})
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": display_df, 
-                            "type": "dataframe"
-                        })
-                else:
-                    response = "I couldn't understand your query. Please try rephrasing your question."
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-        
-        except Exception as e:
-            st.error(f"Error processing query: {str(e)}")
-            response = "I encountered an error processing your request. Please try a different question."
-            st.session_state.messages.append({"role": "assistant", "content": response})
+        with st.spinner("Processing your query..."):
+            # Follow-ups about the previous result are answered from its handle
+            answer = get_service().ask(st.session_state.user, st.session_state.session_id, prompt)
+        show_answer(answer, prompt)
         
         # Display new messages
         for message in st.session_state.messages[-2:]:  # Show last 2 messages (user + assistant)
             if message["role"] == "assistant":
                 with st.chat_message("assistant"):
-                    if message.get("type") == "dataframe":
-                        st.dataframe(message["content"], use_container_width=True)
-                    else:
-                        st.markdown(message["content"])
+                    render_message(message, expand=True)
     
     # Sidebar controls
     with st.sidebar:
         st.title("Options")
         
+        # Expensive query waiting for confirmation
+        pending = st.session_state.get("pending_query")
+        if pending:
+            st.header("Confirm Query")
+            st.code(pending["sql"], language="sql")
+            if st.button("Run anyway"):
+                st.session_state.pending_query = None
+                with st.spinner("Running query..."):
+                    answer = get_service().ask(
+                        st.session_state.user, st.session_state.session_id, pending["prompt"],
+                        confirmation_id=pending["confirmation_id"]
+                    )
+                show_answer(answer, pending["prompt"])
+                st.rerun()
+            if st.button("Cancel query"):
+                st.session_state.pending_query = None
+                st.rerun()
+        
+        # Verified SQL library
+        promotable = st.session_state.get("promotable")
+        if promotable and st.session_state.role == "admin":
+            st.header("SQL Library")
+            st.caption(f"Last question: {promotable['prompt']}")
+            if st.button("Promote query to library"):
+                try:
+                    template_id, _ = get_service().promote_template(
+                        st.session_state.user, promotable["prompt"], promotable["sql"]
+                    )
+                    st.session_state.promotable = None
+                    st.success(f"Saved as template #{template_id}")
+                except Exception as e:
+                    st.error(f"Could not promote query: {str(e)}")
+        
         # Memory status
-        if st.session_state.conversation_memory:
+        handle = st.session_state.get("result_handle")
+        if handle is not None:
+            st.header("Previous Result")
+            if handle.truncated:
+                st.info(f"📋 {handle.row_count} rows (truncated, follow-ups re-query the database)")
+            else:
+                st.info(f"📋 {handle.row_count} rows kept for follow-up questions")
+        elif st.session_state.conversation_memory:
             st.header("Conversation Context")
             if isinstance(st.session_state.conversation_memory, dict):
                 if "total_incidents" in st.session_state.conversation_memory:
@@ -373,9 +367,13 @@ def chat_interface():
         if st.button("Clear Chat"):
             st.session_state.messages = []
             st.session_state.conversation_memory = None
+            forget_result()
+            clear_cached_tables()
             st.rerun()
         
         if st.button("Logout"):
+            forget_result()
+            clear_cached_tables()
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.session_state.authenticated = False
@@ -385,16 +383,15 @@ def main():
     """Main application"""
     st.set_page_config(page_title="NOC Assistant", page_icon="📡", layout="wide")
     
-    # Check dependencies
-    try:
-        import requests
-        import pandas as pd
-        import sqlite3
-        from sqlalchemy import create_engine
-    except ImportError as e:
-        st.error(f"Missing required dependency: {e}")
+    # Check dependencies without importing them (they load on first use)
+    missing = [name for name in ("requests", "pandas", "sqlalchemy") if find_spec(name) is None]
+    if missing:
+        st.error(f"Missing required dependency: {', '.join(missing)}")
         return
     
+    # Prometheus-style /metrics endpoint, if METRICS_PORT is set
+    start_metrics_server()
+    
     # Initialize session state
     if "authenticated" not in st.session_state:
         st.session_state.authenticated = False
@@ -405,6 +402,12 @@ def main():
     if "conversation_memory" not in st.session_state:
         st.session_state.conversation_memory = None
     
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = str(uuid.uuid4())
+    
+    if "result_handle" not in st.session_state:
+        st.session_state.result_handle = None
+    
     # Initialize database
     if st.session_state.authenticated:
         init_database()
@@ -414,6 +417,9 @@ def main():
         chat_interface()
     else:
         login_page()
+    
+    # Preload in the background once the page is on screen
+    warm_up()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,779 @@
+"""Headless service layer for the NOC assistant.
+
+Everything the assistant does -- login, SQL generation, guarded execution,
+follow-ups on the previous result, incident chat and ingest -- lives here,
+independent of Streamlit. ``main.py`` (the Streamlit UI) and ``api.py`` (the
+HTTP API) are both thin clients of ``NocService``.
+
+Client isolation is enforced here: every call takes an authenticated ``User``
+and queries always run on a connection restricted to ``user.client`` (see
+tenant_db), whatever the caller asks for. Ingest and database statistics are
+admin-only.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+import requests
+
+from db_stats import load_stats, recompute_stats
+from fts_index import fts_available, rewrite_like_to_fts
+from incident_ingest import append_incidents, read_incident_file, upsert_incidents
+from ingest_jobs import IngestQueue
+from ollama_client import EMBED_MODEL, OLLAMA_URL, message_content, post_chat, preload
+from query_guard import MAX_RESULT_ROWS, QueryNeedsConfirmation, QueryRejected, guard_query, log_execution
+from result_handles import answer_directly, describe_handle, is_followup, query_handle, result_store
+from schema_catalog import format_schema, select_columns
+from sql_repair import execute_with_repair, repair_prompt, summarize_repairs
+from sql_templates import TemplateLibrary, extract_params, format_examples, parameterize, render
+from tenant_db import ALL_CLIENTS, open_client_connection
+from tracing import llm_tokens, read_traces, request_context, span, summarize_traces
+
+# Enhanced user credentials with admin user
+USER_DB = {
+    "gp_user": {"password": "gp123", "client": "GP", "role": "user"},
+    "bl_user": {"password": "bl123", "client": "Banglalink", "role": "user"},
+    "admin": {"password": "admin123", "client": "ALL", "role": "admin"},
+}
+
+# Database configuration
+DATABASE_PATH = os.getenv("DATABASE_PATH", "noc_incidents.db")
+
+# Idle read-only connections kept per client
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+TOKEN_TTL_S = int(os.getenv("API_TOKEN_TTL", str(12 * 60 * 60)))
+# Seconds a query waiting for cost confirmation stays confirmable
+CONFIRM_TTL_S = int(os.getenv("QUERY_CONFIRM_TTL", str(15 * 60)))
+
+# System prompts
+# The SQL system prompts are static so Ollama can reuse their cached prefill across
+# questions; everything that changes per request goes into SQL_GENERATION_PROMPT.
+# There is one variant for databases with the incidents_fts index and one without.
+_SQL_PROMPT_HEAD = """
+You are an AI assistant that converts natural language questions into SQL queries for an SQLite database.
+Analyze the database schema and generate a valid SQL query.
+Return ONLY the SQL query. DO NOT RETURN ANYTHING ELSE! Do not include any explanation or formatting, just the raw SQL.
+
+The table is named incidents. Only use the columns listed under "Relevant columns" in the
+request; they are the part of its schema that matters for the question.
+"""
+
+_SQL_PROMPT_TAIL = """
+STRICT OUTPUT RULES:
+- DO NOT include explanations, formatting, or prefixes
+- DO NOT wrap the query inside ```sql``` blocks
+- The output must start directly with SELECT
+- The incidents table is already restricted to the current client's data; do not add a client_name filter for isolation
+"""
+
+SQL_SYSTEM_PROMPT = _SQL_PROMPT_HEAD + """
+FREE-TEXT SEARCH:
+- The columns reason, remarks, task_comments, client_comments and task_resolutions are full-text indexed in incidents_fts.
+- To search them, do not use LIKE '%keyword%'. Use:
+  incident_id IN (SELECT incident_id FROM incidents_fts WHERE incidents_fts MATCH '{reason} : ("fire"* OR "burn"* OR "smoke"*)')
+- Automatically expand the user's topic into related keywords, e.g. fire -> fire, burn, smoke, flames;
+  cable cut -> "cable cut", "fiber cut", "line break"; power failure -> "power outage", "voltage drop", "electric failure".
+- Use {reason remarks task_comments} : (...) to search several text columns at once.
+""" + _SQL_PROMPT_TAIL
+
+# Used while the database has no incidents_fts index (no upload yet, or a CSV without the text columns)
+SQL_SYSTEM_PROMPT_LIKE = _SQL_PROMPT_HEAD + """
+FREE-TEXT SEARCH:
+- To search the free-text columns (reason, remarks, task_comments, client_comments, task_resolutions),
+  use LOWER(column) LIKE '%keyword%', e.g. (LOWER(reason) LIKE '%fire%' OR LOWER(reason) LIKE '%burn%').
+- Automatically expand the user's topic into related keywords, e.g. fire -> fire, burn, smoke, flames;
+  cable cut -> cable cut, fiber cut, line break; power failure -> power outage, voltage drop, electric failure.
+""" + _SQL_PROMPT_TAIL
+
+SQL_GENERATION_PROMPT = """Relevant columns:
+{schema}
+
+{examples}Current client: {client}
+Question: {question}
+"""
+
+# Follow-up questions are answered from the previous result set (see result_handles)
+FOLLOWUP_SQL_SYSTEM_PROMPT = """
+You are an AI assistant that answers follow-up questions about a previous query result.
+The result is stored in an SQLite table named result. Write one SQL query over the table result
+that answers the question. Return ONLY the SQL query, starting with SELECT, without explanations
+or ```sql``` blocks. Do not reference any other table.
+"""
+
+FOLLOWUP_SQL_PROMPT = """Columns of result ({row_count} rows):
+{schema}
+
+Previous question: {previous_question}
+Follow-up question: {question}
+"""
+
+CONVERSATION_PROMPT = """You are a helpful NOC assistant answering network incident queries.
+Current date: {current_date}
+Client: {client}
+
+You have access to specific incident data in your conversation memory:
+{incident_data}
+
+User question: {question}
+
+Provide a clear, concise answer based on the incident data in your memory. 
+Focus on the specific incident details, timeline, resolution steps, and any relevant technical information.
+If the user asks about information not available in the current incident data, 
+respond with "I don't have that specific information for this incident."
+"""
+
+# Define API endpoint and models
+SQL_MODEL = os.getenv("SQL_MODEL", "qwen2.5-coder:7b")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "llama3.2")
+
+# Rewrite generated LIKE '%x%' text searches into FTS5 MATCH lookups
+FTS_REWRITE = os.getenv("FTS_REWRITE", "1") == "1"
+
+
+class AuthenticationError(Exception):
+    """Unknown user, wrong password or an invalid / expired token"""
+
+
+class PermissionDenied(Exception):
+    """The user's role does not allow the operation"""
+
+
+@dataclass(frozen=True)
+class User:
+    username: str
+    client: str
+    role: str
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+
+def authenticate(username, password):
+    """Check credentials against USER_DB and return the User"""
+    record = USER_DB.get(username)
+    if record is None or not hmac.compare_digest(record["password"], password or ""):
+        raise AuthenticationError("Invalid username or password")
+    return User(username=username, client=record["client"], role=record["role"])
+
+
+def _token_secret():
+    # api.py sets NOC_API_SECRET before starting workers so all of them share it
+    secret = os.getenv("NOC_API_SECRET")
+    if not secret:
+        secret = os.environ.setdefault("NOC_API_SECRET", secrets.token_hex(32))
+    return secret.encode()
+
+
+def _sign(payload):
+    return hmac.new(_token_secret(), payload, hashlib.sha256).hexdigest()
+
+
+def issue_token(user, ttl_s=TOKEN_TTL_S):
+    """Signed bearer token naming the user; client and role are re-read from USER_DB on use"""
+    payload = base64.urlsafe_b64encode(
+        json.dumps({"u": user.username, "exp": int(time.time()) + ttl_s}).encode()
+    )
+    return f"{payload.decode()}.{_sign(payload)}"
+
+
+def user_from_token(token):
+    try:
+        payload, signature = token.rsplit(".", 1)
+    except (AttributeError, ValueError):
+        raise AuthenticationError("Malformed token")
+    if not hmac.compare_digest(_sign(payload.encode()), signature):
+        raise AuthenticationError("Invalid token")
+    claims = json.loads(base64.urlsafe_b64decode(payload))
+    if claims["exp"] < time.time():
+        raise AuthenticationError("Token expired")
+    record = USER_DB.get(claims["u"])
+    if record is None:
+        raise AuthenticationError("Unknown user")
+    return User(username=claims["u"], client=record["client"], role=record["role"])
+
+
+def _schema_version(conn):
+    return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+class ConnectionPool:
+    """Reusable client-isolated read-only connections, one idle queue per client.
+
+    A connection is reopened when the database schema changed since it was
+    opened (e.g. the FTS index was created by the first upload).
+    """
+
+    def __init__(self, database_path, size=POOL_SIZE):
+        self.database_path = database_path
+        self.size = size
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, client):
+        with self._lock:
+            return self._idle.setdefault(client, queue.LifoQueue(maxsize=self.size))
+
+    @contextmanager
+    def connection(self, client):
+        """Yield ``(conn, authorizer)`` restricted to the client"""
+        idle = self._queue(client)
+        entry = None
+        while entry is None:
+            try:
+                candidate = idle.get_nowait()
+            except queue.Empty:
+                conn, authorizer = open_client_connection(self.database_path, client, check_same_thread=False)
+                entry = (conn, authorizer, _schema_version(conn))
+            else:
+                if _schema_version(candidate[0]) == candidate[2]:
+                    entry = candidate
+                else:
+                    candidate[0].close()
+        conn, authorizer, _ = entry
+        try:
+            yield conn, authorizer
+        except Exception:
+            conn.close()  # Do not return a connection in an unknown state
+            raise
+        else:
+            authorizer.disarm()
+            try:
+                idle.put_nowait(entry)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        with self._lock:
+            queues, self._idle = list(self._idle.values()), {}
+        for idle in queues:
+            while not idle.empty():
+                idle.get_nowait()[0].close()
+
+
+class PendingQueries:
+    """Queries waiting for the user's cost confirmation, kept server-side.
+
+    The client only receives an opaque confirmation id, valid for the user and
+    session the query was generated for; confirming runs the stored SQL, never
+    SQL text sent by the client.
+    """
+
+    def __init__(self, ttl_s=CONFIRM_TTL_S, max_entries=1024):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._pending = OrderedDict()  # confirmation id -> (owner, question, sql, created_at)
+        self._lock = threading.Lock()
+
+    def put(self, owner, question, sql):
+        confirmation_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._pending[confirmation_id] = (owner, question, sql, time.time())
+            while len(self._pending) > self.max_entries:
+                self._pending.popitem(last=False)
+        return confirmation_id
+
+    def pop(self, owner, confirmation_id):
+        """``(question, sql)`` of the owner's pending query, or None if unknown, expired or not theirs"""
+        with self._lock:
+            entry = self._pending.get(confirmation_id)
+            if entry is None or entry[0] != owner:
+                return None
+            del self._pending[confirmation_id]
+        if time.time() - entry[3] > self.ttl_s:
+            return None
+        return entry[1], entry[2]
+
+
+@dataclass
+class Answer:
+    """The assistant's reply to one question"""
+    status: str  # "ok", "confirm" (needs confirmation), "rejected" or "error"
+    text: str
+    table: Optional[pd.DataFrame] = None  # Rows to display, already trimmed to key columns
+    sql: Optional[str] = None
+    followup: bool = False  # Answered from the previous result set
+    memory: Optional[dict] = None  # Incident or summary for the conversation memory
+    handle: Optional[object] = None  # ResultHandle of the session's current result
+    request_id: Optional[str] = None
+    extra: dict = field(default_factory=dict)
+
+    def to_dict(self, max_rows=MAX_RESULT_ROWS):
+        data = {
+            "status": self.status,
+            "text": self.text,
+            "sql": self.sql,
+            "followup": self.followup,
+            "request_id": self.request_id,
+            **self.extra,
+        }
+        if self.table is not None:
+            data["columns"] = list(self.table.columns)
+            data["rows"] = json.loads(self.table.head(max_rows).to_json(orient="records"))
+            data["row_count"] = len(self.table)
+        if self.handle is not None:
+            data["handle"] = {"id": self.handle.handle_id, "rows": self.handle.row_count, "truncated": self.handle.truncated}
+        return data
+
+
+def is_single_incident_query(query_result):
+    """Determine if query result is a single incident"""
+    return len(query_result) == 1
+
+
+def prepare_summary_for_memory(df):
+    """Prepare a summary of multiple incidents for conversational memory"""
+    if len(df) == 0:
+        return "No incidents found."
+
+    summary_data = {
+        "total_incidents": len(df),
+        "clients": df.get('client_name', pd.Series()).unique().tolist(),
+        "incident_ids": df.get('incident_id', pd.Series()).head(10).tolist(),  # First 10 IDs
+        "ticket_ids": df.get('ticket_id', pd.Series()).head(10).tolist(),
+        "link_names": df.get('link_name_nttn', pd.Series()).dropna().head(10).tolist(),
+        "recent_events": df.get('event_time', pd.Series()).head(5).tolist()
+    }
+
+    return summary_data
+
+
+def prepare_data_for_display(df):
+    """Optimize data for display in dataframe"""
+    if len(df.columns) <= 10:
+        return df
+
+    # Key columns for display
+    key_columns = [
+        'incident_id', 'ticket_id', 'client_name', 'link_name_nttn',
+        'issue_type', 'problem_category', 'fault_status', 'event_time',
+        'clear_time', 'duration', 'region', 'district'
+    ]
+
+    # Keep only existing key columns
+    columns_to_show = [col for col in key_columns if col in df.columns]
+
+    # If no key columns exist, show first 10 columns
+    if not columns_to_show:
+        columns_to_show = df.columns[:10].tolist()
+
+    return df[columns_to_show]
+
+
+def build_sql_prompt(client, question, examples=None):
+    """Build the per-question SQL prompt with a schema pruned to the relevant columns.
+
+    ``examples`` are (question, SQL) pairs from the template library; they go in
+    the user message so the system prompt prefix stays cacheable.
+    """
+    with span("schema.select"):
+        schema = format_schema(select_columns(question))
+    return SQL_GENERATION_PROMPT.format(
+        schema=schema, examples=format_examples(examples), client=client, question=question
+    )
+
+
+def sql_system_prompt(fts):
+    """The static SQL system prompt matching whether the FTS index exists"""
+    return SQL_SYSTEM_PROMPT if fts else SQL_SYSTEM_PROMPT_LIKE
+
+
+def call_sql_llm(client, question, examples=None, fts=True):
+    """Call LLM for SQL generation; None if the model did not answer"""
+    response = post_chat(
+        OLLAMA_URL,
+        SQL_MODEL,
+        sql_system_prompt(fts),
+        build_sql_prompt(client, question, examples),
+        stage="llm.sql",
+    )
+    if response.status_code == 200:
+        return message_content(response.json()).strip() or None
+    return None
+
+
+def call_repair_llm(client, question, sql, error, timeout=None, fts=True):
+    """Ask the model to correct a failing query; None if it did not answer"""
+    response = post_chat(
+        OLLAMA_URL,
+        SQL_MODEL,
+        sql_system_prompt(fts),
+        build_sql_prompt(client, question) + "\n" + repair_prompt(question, sql, error),
+        timeout=timeout,
+        stage="llm.repair",
+    )
+    if response.status_code == 200:
+        return message_content(response.json()).strip() or None
+    return None
+
+
+def call_followup_sql_llm(question, handle, df):
+    """Call LLM for SQL over the previous result set"""
+    response = post_chat(
+        OLLAMA_URL,
+        SQL_MODEL,
+        FOLLOWUP_SQL_SYSTEM_PROMPT,
+        FOLLOWUP_SQL_PROMPT.format(
+            row_count=len(df),
+            schema=describe_handle(df),
+            previous_question=handle.question,
+            question=question,
+        ),
+        stage="llm.followup_sql",
+    )
+    if response.status_code == 200:
+        return message_content(response.json()).strip() or None
+    return None
+
+
+def call_chat_llm(client, question, incident_data):
+    """Call LLM for conversational responses"""
+    if isinstance(incident_data, dict):
+        data_str = json.dumps(incident_data, indent=2, default=str)
+    else:
+        data_str = str(incident_data)
+
+    payload = {
+        "model": CHAT_MODEL,
+        "prompt": CONVERSATION_PROMPT.format(
+            client=client,
+            question=question,
+            current_date=datetime.now().strftime("%Y-%m-%d"),
+            incident_data=data_str
+        ),
+        "stream": False
+    }
+
+    try:
+        with span("llm.chat", model=CHAT_MODEL) as s:
+            response = requests.post(OLLAMA_URL, json=payload)
+            if response.status_code == 200:
+                s.set(tokens=llm_tokens(response.json()))
+        if response.status_code == 200:
+            return response.json().get("response", "I couldn't process your request.")
+        else:
+            return "I'm having trouble accessing my knowledge base right now."
+    except Exception:
+        return "I'm currently unable to process your request due to a connection issue."
+
+
+class NocService:
+    """The NOC assistant pipeline, shared by the Streamlit UI and the HTTP API"""
+
+    def __init__(self, database_path=DATABASE_PATH, pool_size=POOL_SIZE):
+        self.database_path = database_path
+        self.pool = ConnectionPool(database_path, pool_size)
+        self.templates = TemplateLibrary(database_path)
+        self.pending = PendingQueries()
+        self.ingest_jobs = IngestQueue(database_path)
+
+    def warm_up(self, models=True):
+        """Open a pooled connection per client, embed the SQL templates and load the models"""
+        if os.path.exists(self.database_path):
+            for client in sorted({record["client"] for record in USER_DB.values()}):
+                with self.pool.connection(client):
+                    pass
+            self.templates.warm_up()
+        if models:
+            for model in dict.fromkeys((SQL_MODEL, CHAT_MODEL)):
+                preload(model, OLLAMA_URL)
+            preload(EMBED_MODEL, OLLAMA_URL, embedding=True)
+
+    # Authentication
+
+    def login(self, username, password):
+        return authenticate(username, password)
+
+    # Querying
+
+    def fts_available(self, user):
+        """Whether generated SQL may use the incidents_fts index"""
+        with self.pool.connection(user.client) as (conn, _):
+            return fts_available(conn)
+
+    def execute_sql(self, user, query, confirmed=False):
+        """Run SQL against the user's isolated view of the data"""
+        with self.pool.connection(user.client) as (conn, authorizer):
+            if FTS_REWRITE and fts_available(conn):
+                query = rewrite_like_to_fts(query)
+
+            # Explain, cost-check and LIMIT the query before running it
+            with span("sql.guard"):
+                guarded = guard_query(conn, query, confirmed=confirmed, authorizer=authorizer)
+            start = time.perf_counter()
+            with span("sql.execute", plan=",".join(guarded.classes)) as s:
+                authorizer.arm()
+                result = pd.read_sql_query(guarded.sql, conn)
+                s.set(rows=len(result))
+            log_execution(guarded, time.perf_counter() - start, len(result), client=user.client)
+        return result
+
+    def ask(self, user, session_id, question, confirmation_id=None):
+        """Answer a question: from the previous result if it refers back to it, else with new SQL.
+
+        ``confirmation_id`` (from a "confirm" answer of the same user and session)
+        runs the query that was waiting for confirmation.
+        """
+        with request_context(session=session_id, client=user.client) as request_id:
+            try:
+                answer = None
+                if confirmation_id is not None:
+                    pending = self.pending.pop((user.username, session_id), confirmation_id)
+                    if pending is None:
+                        answer = Answer("rejected", "This confirmation has expired. Please ask the question again.")
+                    else:
+                        question, sql = pending
+                        answer = self._answer_with_sql(user, session_id, question, sql)
+                else:
+                    answer = self._answer_followup(user, session_id, question)
+                    if answer is None:
+                        answer = self._answer_with_sql(user, session_id, question)
+            except QueryNeedsConfirmation as e:
+                # Expensive but allowed - the caller must confirm first
+                confirmation_id = self.pending.put((user.username, session_id), question, e.guarded.original_sql)
+                answer = Answer(
+                    "confirm", f"⚠️ {str(e)} Confirm to run it anyway.", sql=e.guarded.original_sql,
+                    extra={"estimated_cost": e.guarded.estimated_cost, "confirmation_id": confirmation_id},
+                )
+            except QueryRejected as e:
+                answer = Answer("rejected", f"I can't run that query: {str(e)} Please try a more specific question.")
+            except Exception as e:
+                answer = Answer(
+                    "error", "I encountered an error processing your request. Please try a different question.",
+                    extra={"error": str(e)},
+                )
+            answer.request_id = request_id
+            return answer
+
+    def _answer_with_sql(self, user, session_id, question, sql=None):
+        confirmed = sql is not None
+        template = None
+        fts = self.fts_available(user)
+        if sql is None:
+            sql, template, examples = self._template_sql(user, question)
+            if sql is None:
+                sql = call_sql_llm(user.client, question, examples, fts=fts)
+        if not sql:
+            return Answer("ok", "I couldn't understand your query. Please try rephrasing your question.")
+        if confirmed:
+            query_result, repair = self.execute_sql(user, sql, confirmed=True), None
+        else:
+            # Broken generated SQL is fixed deterministically or by re-prompting the model
+            query_result, sql, repair = execute_with_repair(
+                sql,
+                lambda candidate: self.execute_sql(user, candidate),
+                lambda failing, error, timeout: call_repair_llm(
+                    user.client, question, failing, error, timeout, fts=fts
+                ),
+            )
+        answer = self._result_answer(user, session_id, question, query_result, sql)
+        if template is not None:
+            answer.extra["template"] = template.name
+        if repair is not None:
+            answer.extra["repaired"] = repair
+        return answer
+
+    def _template_sql(self, user, question):
+        """``(sql, template, None)`` from a verified template, else ``(None, None, few-shot examples)``"""
+        try:
+            with span("template.match") as s:
+                matches = self.templates.search(question, client=user.client)
+                s.set(hit=bool(matches and matches[0].sql))
+        except Exception:
+            return None, None, None  # Library unavailable; the LLM still answers
+        if matches and matches[0].sql:
+            return matches[0].sql, matches[0].template, None
+        return None, None, self.templates.examples(matches)
+
+    def _result_answer(self, user, session_id, question, query_result, sql, followup=False):
+        """Turn a query result into an answer and make it the session's result handle"""
+        if len(query_result) == 0:
+            result_store.drop((user.username, session_id))
+            return Answer("ok", "No incidents found matching your query.", sql=sql, followup=followup)
+
+        handle = result_store.put(
+            (user.username, session_id), query_result, question, sql, truncated=len(query_result) >= MAX_RESULT_ROWS
+        )
+        if is_single_incident_query(query_result):
+            # Single incident - keep it as conversation memory and use chat LLM
+            incident_data = query_result.iloc[0].to_dict()
+            response = call_chat_llm(user.client, question, incident_data)
+            return Answer("ok", response, sql=sql, followup=followup, memory=incident_data, handle=handle)
+
+        # Multiple incidents - table plus a summary for memory
+        with span("df.prepare") as s:
+            display_df = prepare_data_for_display(query_result)
+            summary_data = prepare_summary_for_memory(query_result)
+            s.set(rows=len(display_df))
+        return Answer(
+            "ok", f"Found {len(query_result)} incidents matching your query:", table=display_df,
+            sql=sql, followup=followup, memory=summary_data, handle=handle,
+        )
+
+    def _answer_followup(self, user, session_id, question):
+        """Answer from the previous result set; None to fall back to a full query"""
+        if not is_followup(question):
+            return None
+        entry = result_store.get_handle((user.username, session_id))
+        if entry is None or entry[0].truncated:
+            return None
+        handle, previous = entry
+
+        if len(previous) == 1:
+            incident_data = previous.iloc[0].to_dict()
+            response = call_chat_llm(user.client, question, incident_data)
+            return Answer("ok", response, followup=True, memory=incident_data, handle=handle)
+
+        response = answer_directly(question, previous)
+        if response:
+            return Answer("ok", response, followup=True, handle=handle)
+
+        sql = call_followup_sql_llm(question, handle, previous)
+        if not sql:
+            return None
+        try:
+            with span("followup.query") as s:
+                query_result, aggregate = query_handle(previous, sql)
+                s.set(rows=len(query_result))
+        except Exception:
+            return None  # Not answerable from the handle; regenerate over the full table
+
+        if aggregate:
+            # Counts and breakdowns describe the handle; keep it for further follow-ups
+            if query_result.shape == (1, 1):
+                text = f"{query_result.columns[0]}: {query_result.iat[0, 0]}"
+                return Answer("ok", text, sql=sql, followup=True, handle=handle)
+            return Answer("ok", "From the previous result:", table=query_result, sql=sql, followup=True, handle=handle)
+        if len(query_result) == 0:
+            return Answer("ok", "None of the incidents in the previous result match.", sql=sql, followup=True, handle=handle)
+        # A narrowed list becomes the new handle
+        return self._result_answer(user, session_id, question, query_result, sql, followup=True)
+
+    def chat(self, user, session_id, question, incident_id=None):
+        """Conversational answer about one incident: ``incident_id`` or the session's single-incident result"""
+        with request_context(session=session_id, client=user.client) as request_id:
+            incident_data = None
+            if incident_id is not None:
+                # Looked up through the client's isolated view like any other query
+                with self.pool.connection(user.client) as (conn, _):
+                    found = pd.read_sql_query(
+                        "SELECT * FROM incidents WHERE incident_id = ? LIMIT 1", conn, params=(str(incident_id),)
+                    )
+                if len(found):
+                    incident_data = found.iloc[0].to_dict()
+            else:
+                entry = result_store.get_handle((user.username, session_id))
+                if entry is not None and len(entry[1]) == 1:
+                    incident_data = entry[1].iloc[0].to_dict()
+            if incident_data is None:
+                return Answer("ok", "I don't have an incident in context. Ask about a specific incident first.",
+                              request_id=request_id)
+            response = call_chat_llm(user.client, question, incident_data)
+            return Answer("ok", response, memory=incident_data, request_id=request_id)
+
+    def forget(self, user, session_id):
+        """Drop the session's result handle"""
+        result_store.drop((user.username, session_id))
+
+    # Administration
+
+    def _require_admin(self, user):
+        if not user.is_admin:
+            raise PermissionDenied("Admin role required")
+
+    def ingest(self, user, file, mode="upsert", filename=None):
+        """Load a CSV/Excel export. ``upsert`` merges rows on incident_id so re-uploads never
+        duplicate incidents; ``append`` is the legacy plain insert. Returns the ingest stats.
+        """
+        self._require_admin(user)
+        filename = filename or getattr(file, "name", "upload.csv")
+        with request_context(client=user.client):
+            if mode == "upsert":
+                with span("ingest.upsert") as s:
+                    result = upsert_incidents(self.database_path, read_incident_file(file, name=filename), source=filename)
+                    s.set(rows=result["rows"])
+                return result
+
+            with span("ingest.append") as s:
+                result = append_incidents(self.database_path, read_incident_file(file, name=filename), source=filename)
+                s.set(rows=result["rows"])
+            return result
+
+    def submit_ingest(self, user, file, mode="upsert", filename=None):
+        """Queue a CSV/Excel export for background loading (see ingest_jobs); returns the job
+        right away. ``mode`` is the same as for ``ingest``.
+        """
+        self._require_admin(user)
+        if mode not in ("upsert", "append"):
+            raise ValueError("mode must be 'upsert' or 'append'")  # raw loads would bypass client isolation
+        return self.ingest_jobs.submit(file, filename, mode, user.username)
+
+    def ingest_job(self, user, job_id):
+        """The job with its progress: rows_done, rows_total, percent, rows_per_sec, eta_s"""
+        self._require_admin(user)
+        return self.ingest_jobs.job(job_id)
+
+    def ingest_job_list(self, user, limit=20):
+        self._require_admin(user)
+        return self.ingest_jobs.jobs(limit)
+
+    def cancel_ingest(self, user, job_id):
+        self._require_admin(user)
+        return self.ingest_jobs.cancel(job_id)
+
+    def resume_ingest(self, user, job_id):
+        self._require_admin(user)
+        return self.ingest_jobs.resume(job_id)
+
+    def database_stats(self, user):
+        """Stats catalog contents (see db_stats.load_stats), or None before the first load"""
+        self._require_admin(user)
+        try:
+            return load_stats(self.database_path)
+        except Exception:
+            return None
+
+    def recompute_stats(self, user):
+        self._require_admin(user)
+        recompute_stats(self.database_path)
+
+    def promote_template(self, user, question, sql):
+        """Add a query that answered ``question`` correctly to the verified template library.
+
+        The parameterized SQL must pass the query guard on the full table before
+        it is stored. Returns ``(template_id, template_sql)``.
+        """
+        self._require_admin(user)
+        template_sql, defaults = parameterize(question, sql)
+        params, _ = extract_params(question)
+        rendered = render(template_sql, {**defaults, **params, "client": user.client})
+        if rendered is None:
+            raise ValueError("The query has parameters that the question does not supply.")
+        with self.pool.connection(ALL_CLIENTS) as (conn, authorizer):
+            try:
+                guard_query(conn, rendered, confirmed=True, authorizer=authorizer)
+            except QueryRejected as e:
+                raise ValueError(f"Query cannot be promoted: {e}")
+        return self.templates.promote(question, sql, user.username)
+
+    def pipeline_summary(self, user):
+        """p50/p95 per pipeline stage from the trace log"""
+        self._require_admin(user)
+        return summarize_traces(read_traces())
+
+    def repair_summary(self, user):
+        """Success rate and added latency per SQL repair level from the trace log"""
+        self._require_admin(user)
+        return summarize_repairs(read_traces())
@@ -0,0 +1,124 @@
+"""Shared helpers for calling the Ollama HTTP API.
+
+The SQL generators send a long, fixed block of instructions and schema on every
+request. Ollama keeps the KV cache of the last prompt evaluated by a loaded model
+and only prefills the tokens after the longest common prefix, so the fixed part
+is sent as an unchanging system message and the per-question part as the user
+message. Repeated calls then only process the new suffix.
+"""
+import os
+import time
+
+import requests
+
+from tracing import llm_tokens, span
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://192.168.5.201:11434/api/generate")
+
+# Keep the model (and its prompt cache) resident between questions
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text:latest")
+
+# Embeddings used to rank schema columns and SQL templates are optional: give up
+# quickly and, after a failure, skip them for EMBED_RETRY_S instead of waiting
+# for a timeout on every question
+EMBED_TIMEOUT_S = float(os.getenv("EMBED_TIMEOUT", "2"))
+EMBED_RETRY_S = float(os.getenv("EMBED_RETRY_S", "60"))
+
+_embed_down_until = 0.0
+
+
+def chat_url(url):
+    """Derive the /api/chat endpoint from a configured Ollama URL"""
+    base = url.rstrip("/")
+    for suffix in ("/api/generate", "/api/chat", "/api/embeddings"):
+        if base.endswith(suffix):
+            base = base[: -len(suffix)]
+            break
+    return f"{base}/api/chat"
+
+
+def post_chat(url, model, system_prompt, user_prompt, options=None, timeout=None, stage="llm.chat"):
+    """POST a non-streaming chat request with a stable system message, traced as ``stage``"""
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "stream": False,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+    }
+    if options:
+        payload["options"] = options
+    with span(stage, model=model) as s:
+        response = requests.post(chat_url(url), json=payload, timeout=timeout)
+        if response.status_code == 200:
+            s.set(tokens=llm_tokens(response.json()))
+        else:
+            s.set(status=response.status_code)
+    return response
+
+
+def message_content(data, default=""):
+    """Extract the assistant text from an /api/chat (or /api/generate) response body"""
+    if "message" in data:
+        return data["message"].get("content", default)
+    return data.get("response", default)
+
+
+def prefill_stats(data):
+    """Summarise prompt-evaluation timings reported by Ollama.
+
+    ``prompt_eval_count`` only counts tokens that were actually prefilled, so a
+    cache hit on the system prompt shows up as a much smaller count and duration.
+    """
+    return {
+        "prompt_tokens": data.get("prompt_eval_count", 0),
+        "prefill_ms": data.get("prompt_eval_duration", 0) / 1e6,
+        "output_tokens": data.get("eval_count", 0),
+        "generation_ms": data.get("eval_duration", 0) / 1e6,
+        "total_ms": data.get("total_duration", 0) / 1e6,
+    }
+
+
+def embeddings_url(url):
+    """Derive the /api/embeddings endpoint from a configured Ollama URL"""
+    return chat_url(url)[: -len("/api/chat")] + "/api/embeddings"
+
+
+def preload(model, url=OLLAMA_URL, embedding=False, timeout=None):
+    """Load a model into memory (for OLLAMA_KEEP_ALIVE) without generating anything"""
+    base = chat_url(url)[: -len("/api/chat")]
+    if embedding:
+        request = (f"{base}/api/embeddings", {"model": model, "prompt": "", "keep_alive": OLLAMA_KEEP_ALIVE})
+    else:
+        # A generate request without a prompt only loads the model
+        request = (f"{base}/api/generate", {"model": model, "keep_alive": OLLAMA_KEEP_ALIVE})
+    response = requests.post(request[0], json=request[1], timeout=timeout)
+    response.raise_for_status()
+
+
+def embed(text, url=OLLAMA_URL, model=EMBED_MODEL, timeout=None):
+    """Return the embedding vector for a piece of text"""
+    with span("embedding", model=model):
+        response = requests.post(embeddings_url(url), json={"model": model, "prompt": text}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["embedding"]
+
+
+class EmbeddingUnavailable(Exception):
+    """The embedding model failed recently; callers fall back to keyword ranking"""
+
+
+def embed_optional(text, timeout=EMBED_TIMEOUT_S):
+    """``embed`` with a short timeout that fails fast for EMBED_RETRY_S after an error"""
+    global _embed_down_until
+    if time.monotonic() < _embed_down_until:
+        raise EmbeddingUnavailable("embedding model unavailable, retrying later")
+    try:
+        return embed(text, timeout=timeout)
+    except Exception as e:
+        _embed_down_until = time.monotonic() + EMBED_RETRY_S
+        raise EmbeddingUnavailable(str(e)) from e
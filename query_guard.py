@@ -0,0 +1,359 @@
+"""Pre-execution checks for LLM-generated SQL.
+
+``guard_query`` makes sure the text is a single read-only SELECT, runs
+``EXPLAIN QUERY PLAN`` on it, classifies the plan (indexed lookup, full scan,
+temp B-tree, cartesian join), estimates how many rows it will touch and caps
+non-aggregate queries with a LIMIT. Queries above the cost thresholds raise
+``QueryNeedsConfirmation`` or ``QueryRejected`` instead of running.
+``log_execution`` records the plan next to the actual runtime so slow plans
+and missing indexes show up in ``query_plans.jsonl``.
+"""
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "1000"))
+# Estimated rows examined above which the user must confirm / the query is refused
+CONFIRM_COST = int(os.getenv("QUERY_CONFIRM_COST", "5000000"))
+REJECT_COST = int(os.getenv("QUERY_REJECT_COST", "100000000"))
+QUERY_PLAN_LOG = os.getenv("QUERY_PLAN_LOG", "query_plans.jsonl")
+
+AGGREGATE_FUNCTIONS = {"count", "sum", "avg", "min", "max", "total", "group_concat"}
+
+
+class QueryRejected(Exception):
+    """The query is not allowed to run"""
+
+    def __init__(self, message, guarded=None):
+        super().__init__(message)
+        self.guarded = guarded
+
+
+class QueryNeedsConfirmation(QueryRejected):
+    """The query is allowed, but only after the user confirms its cost"""
+
+
+@dataclass
+class GuardedQuery:
+    sql: str
+    original_sql: str
+    plan: list = field(default_factory=list)
+    classes: list = field(default_factory=list)
+    estimated_cost: int = 0
+    limit_added: bool = False
+
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')
+    | (?P<ident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    | (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<open>\()
+    | (?P<close>\))
+    | (?P<semi>;)
+    | (?P<other>\S)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def _top_level_words(sql):
+    """Keywords and identifiers outside parentheses, strings and comments, lower-cased"""
+    depth = 0
+    words = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+        elif kind == "word" and depth == 0:
+            words.append(match.group().lower())
+    return words
+
+
+def normalize_statement(sql):
+    """Strip trailing semicolons and comments; reject anything but one SELECT statement"""
+    sql = sql.strip().rstrip(";").strip()
+    tokens = [m for m in _TOKEN_RE.finditer(sql) if m.lastgroup != "comment"]
+    if not tokens:
+        raise QueryRejected("Empty query.")
+    if any(m.lastgroup == "semi" for m in tokens):
+        raise QueryRejected("Only a single SQL statement is allowed.")
+    first = tokens[0].group().lower()
+    if first not in ("select", "with"):
+        raise QueryRejected("Only SELECT queries are allowed.")
+    return sql
+
+
+def _identifier(token):
+    """Unquoted, lower-cased name of a word or quoted identifier token"""
+    text = token.group()
+    if token.lastgroup == "ident":
+        text = text[1:-1].replace(text[0] * 2, text[0]) if text[0] in "\"`" else text[1:-1]
+    return text.lower()
+
+
+def cte_names(sql):
+    """Names defined by ``name [(columns)] AS [NOT] [MATERIALIZED] (`` anywhere in the query"""
+    tokens = [m for m in _TOKEN_RE.finditer(sql) if m.lastgroup != "comment"]
+    names = set()
+    for i, token in enumerate(tokens):
+        if token.lastgroup != "word" or token.group().lower() != "as":
+            continue
+        j = i + 1
+        while j < len(tokens) and tokens[j].group().lower() in ("not", "materialized"):
+            j += 1
+        if j >= len(tokens) or tokens[j].lastgroup != "open":
+            continue
+        k = i - 1
+        if k >= 0 and tokens[k].lastgroup == "close":
+            depth = 0
+            while k >= 0:  # Skip the column list
+                depth += {"close": 1, "open": -1}.get(tokens[k].lastgroup, 0)
+                k -= 1
+                if depth == 0:
+                    break
+        if k >= 0 and tokens[k].lastgroup in ("word", "ident"):
+            names.add(_identifier(tokens[k]))
+    return names
+
+
+def _skip_group(tokens, i):
+    """Index just past the parenthesized group opening at ``tokens[i]``"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].lastgroup == "open":
+            depth += 1
+        elif tokens[j].lastgroup == "close":
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return len(tokens)
+
+
+def _is_word(tokens, i, *words):
+    return i < len(tokens) and tokens[i].lastgroup == "word" and tokens[i].group().lower() in words
+
+
+def is_aggregate_query(sql):
+    """True for queries whose result is grouped or reduced by an aggregate.
+
+    Aggregates used as window functions (``count(*) OVER ()``) keep one row per
+    input row, and aggregates inside a scalar subquery reduce only the subquery,
+    so neither counts.
+    """
+    if "group" in _top_level_words(sql):
+        return True
+    tokens = [m for m in _TOKEN_RE.finditer(sql) if m.lastgroup != "comment"]
+    depth = 0
+    subquery_depth = None  # Depth of the scalar subquery being skipped
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        kind = token.lastgroup
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth -= 1
+            if subquery_depth is not None and depth < subquery_depth:
+                subquery_depth = None
+        elif kind == "word" and subquery_depth is None:
+            word = token.group().lower()
+            if word == "from" and depth == 0:
+                break
+            if word == "select" and depth > 0:
+                subquery_depth = depth
+            elif word in AGGREGATE_FUNCTIONS and i + 1 < len(tokens) and tokens[i + 1].lastgroup == "open":
+                end = _skip_group(tokens, i + 1)
+                if _is_word(tokens, end, "filter") and end + 1 < len(tokens):
+                    end = _skip_group(tokens, end + 1)
+                if not _is_word(tokens, end, "over"):
+                    return True
+                i = end
+                continue
+        i += 1
+    return False
+
+
+def has_limit(sql):
+    return "limit" in _top_level_words(sql)
+
+
+def explain_plan(conn, sql):
+    """Return EXPLAIN QUERY PLAN rows as (id, parent, detail) tuples"""
+    return [(row[0], row[1], row[-1]) for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def _table_rows(conn, table, cache):
+    table = table.split(".")[-1]  # Views are flattened into e.g. "main.incidents"
+    if table not in cache:
+        try:
+            # MAX(rowid) is an O(log n) upper bound, unlike COUNT(*)
+            cache[table] = conn.execute(f'SELECT MAX(rowid) FROM main."{table}"').fetchone()[0] or 0
+        except Exception:
+            cache[table] = 0  # CTEs, subqueries and unknown names
+    return cache[table]
+
+
+_FROM_RE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)(?:\s+(?:AS\s+)?([A-Za-z_]\w*))?|,\s*([A-Za-z_]\w*)\s+(?:AS\s+)?([A-Za-z_]\w*)", re.IGNORECASE)
+_NOT_ALIASES = {"where", "group", "order", "limit", "join", "left", "inner", "cross", "on", "using", "natural", "union", "having", "window"}
+
+
+def _alias_map(sql):
+    """Map table aliases back to table names; plan details only show the alias"""
+    aliases = {}
+    for table, alias, list_table, list_alias in _FROM_RE.findall(sql):
+        table, alias = table or list_table, alias or list_alias
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+
+def _rows_per_key(conn, index):
+    """Average rows per index key from sqlite_stat1 (populated by ANALYZE), if available"""
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE idx = ?", (index,)).fetchone()
+    except Exception:
+        return None
+    if not row:
+        return None
+    parts = row[0].split()
+    return int(parts[1]) if len(parts) > 1 else None
+
+
+_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS \S+)?(?P<rest>.*)$")
+_SEARCH_RE = re.compile(
+    r"^SEARCH (?:TABLE )?(\S+)(?: AS \S+)? USING "
+    r"(?:(?:AUTOMATIC )?(?:PARTIAL )?(?:COVERING )?INDEX(?: ([^\s(]\S*))?|INTEGER PRIMARY KEY|PRIMARY KEY)"
+)
+
+
+def classify_plan(conn, plan, sql=""):
+    """Classify plan steps and estimate rows examined.
+
+    Loops that share a parent are nested joins, so their costs multiply; two
+    full scans of real tables under one parent are a cartesian join.
+    """
+    row_cache = {}
+    aliases = _alias_map(sql)
+    classes = set()
+    loop_costs = {}  # parent id -> list of per-loop row estimates
+    sorts = False
+    build_cost = 0
+    scans_by_parent = {}
+
+    for node_id, parent, detail in plan:
+        scan = _SCAN_RE.match(detail)
+        search = _SEARCH_RE.match(detail)
+        if search:
+            table, index = aliases.get(search.group(1), search.group(1)), search.group(2)
+            classes.add("indexed")
+            rows = _table_rows(conn, table, row_cache)
+            if "AUTOMATIC" in detail:
+                # SQLite builds a throwaway index per query: a permanent one is missing
+                classes.add("automatic_index")
+                build_cost += rows
+                loop_costs.setdefault(parent, []).append(1)
+                continue
+            per_key = _rows_per_key(conn, index) if index else 1
+            estimate = per_key if per_key is not None else max(1, rows // 10)
+            loop_costs.setdefault(parent, []).append(estimate)
+        elif scan and "VIRTUAL TABLE" in detail:
+            classes.add("indexed")  # FTS MATCH lookups
+            loop_costs.setdefault(parent, []).append(1)
+        elif scan and not scan.group(1).startswith(("(", "CONSTANT")):
+            table = aliases.get(scan.group(1), scan.group(1))
+            rows = _table_rows(conn, table, row_cache)
+            classes.add("covering_scan" if "COVERING INDEX" in detail else "scan")
+            loop_costs.setdefault(parent, []).append(max(rows, 1))
+            if rows:
+                scans_by_parent.setdefault(parent, []).append(scan.group(1))
+        elif "USE TEMP B-TREE" in detail:
+            classes.add("temp_btree")
+            sorts = True
+
+    if any(len(tables) > 1 for tables in scans_by_parent.values()):
+        classes.add("cartesian")
+
+    cost = build_cost
+    for costs in loop_costs.values():
+        product = 1
+        for estimate in costs:
+            product *= estimate
+        cost += product
+    if sorts:
+        cost *= 2  # Rough allowance for sorting / grouping in a temp B-tree
+    return sorted(classes), cost
+
+
+def guard_query(conn, sql, max_rows=MAX_RESULT_ROWS, confirmed=False, authorizer=None):
+    """Validate, explain, classify and cap a generated query before it runs.
+
+    ``authorizer`` (see tenant_db) is armed only while the untrusted SQL is
+    compiled for EXPLAIN, so the guard's own catalog lookups are not restricted.
+    """
+    original = sql
+    sql = normalize_statement(sql)
+    if authorizer is not None:
+        # A CTE named like a tenant view would be read as that view (see tenant_db)
+        shadowed = cte_names(sql) & authorizer.views
+        if shadowed:
+            raise QueryRejected(f"Query rejected: a WITH clause may not redefine {', '.join(sorted(shadowed))}.")
+    limit_added = False
+    if max_rows and not is_aggregate_query(sql) and not has_limit(sql):
+        sql = f"{sql}\nLIMIT {int(max_rows)}"
+        limit_added = True
+
+    try:
+        if authorizer is not None:
+            authorizer.arm()
+        plan = explain_plan(conn, sql)
+    except Exception as e:
+        raise QueryRejected(f"Query does not compile: {e}") from e
+    finally:
+        if authorizer is not None:
+            authorizer.disarm()
+
+    classes, cost = classify_plan(conn, plan, sql)
+    guarded = GuardedQuery(
+        sql=sql, original_sql=original, plan=plan, classes=classes,
+        estimated_cost=cost, limit_added=limit_added,
+    )
+    if cost > REJECT_COST or ("cartesian" in classes and cost > CONFIRM_COST):
+        raise QueryRejected(
+            f"Query rejected: estimated {cost:,} rows examined ({', '.join(classes)}).", guarded
+        )
+    if cost > CONFIRM_COST and not confirmed:
+        raise QueryNeedsConfirmation(
+            f"This query will examine about {cost:,} rows ({', '.join(classes)}).", guarded
+        )
+    return guarded
+
+
+def log_execution(guarded, runtime_s, row_count, **labels):
+    """Log the plan with the measured runtime; slow full scans point at missing indexes"""
+    record = {
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sql": guarded.sql,
+        "classes": guarded.classes,
+        "estimated_cost": guarded.estimated_cost,
+        "limit_added": guarded.limit_added,
+        "runtime_ms": round(runtime_s * 1000, 2),
+        "rows": row_count,
+        "plan": [detail for _, _, detail in guarded.plan],
+        **labels,
+    }
+    logger.info("query %.1fms rows=%d plan=%s", record["runtime_ms"], row_count, "; ".join(record["plan"]))
+    if QUERY_PLAN_LOG:
+        try:
+            with open(QUERY_PLAN_LOG, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError:
+            logger.warning("Could not write query plan log %s", QUERY_PLAN_LOG)
@@ -0,0 +1,161 @@
+"""Cross-encoder reranking for the RAG demo, on PyTorch or quantized ONNX.
+
+``RERANK_BACKEND=torch`` (default) runs ``sentence_transformers.CrossEncoder``
+as before. ``RERANK_BACKEND=onnx`` runs the same model on onnxruntime:
+
+- the model is exported to ONNX once and quantized to int8 weights with
+  dynamic (per-batch) activation quantization; the files and the tokenizer are
+  kept in ``RERANK_ONNX_DIR``, so later runs need only ``onnxruntime`` and
+  ``tokenizers`` (the export itself needs ``torch`` and ``transformers``);
+- the session uses ``RERANK_THREADS`` intra-op threads with spinning disabled,
+  so idle worker threads do not compete with Ollama for the CPU;
+- pairs are tokenized without padding, sorted by length and batched, and each
+  batch is padded only to its longest pair rounded up to ``PAD_MULTIPLE``
+  (length buckets), instead of every pair to the longest chunk.
+
+Both backends return ``CrossEncoder.rank``-style results
+(``[{"corpus_id", "score"}]``, best first) with sigmoid scores, so the ONNX
+path is a drop-in replacement; benchmarks/bench_reranker.py measures latency
+and ranking agreement between the two.
+"""
+import os
+import threading
+
+import numpy as np
+
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "torch")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_ONNX_DIR = os.getenv("RERANK_ONNX_DIR", os.path.join("models", RERANK_MODEL.split("/")[-1] + "-onnx"))
+# MiniLM-L6 batches of 10-50 pairs stop scaling at about 4 threads
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", str(min(4, os.cpu_count() or 1))))
+RERANK_BATCH = int(os.getenv("RERANK_BATCH", "16"))
+MAX_LENGTH = 512
+PAD_MULTIPLE = 16
+
+_rerankers = {}
+_rerankers_lock = threading.Lock()
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _ranked(scores, top_k=None):
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [{"corpus_id": int(i), "score": float(scores[i])} for i in order]
+
+
+def export_onnx(model_name=RERANK_MODEL, directory=RERANK_ONNX_DIR):
+    """Export ``model_name`` to ``directory``/model.onnx and quantize it to model.int8.onnx"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(directory, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(directory)  # Writes tokenizer.json for the tokenizers library
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+    sample = dict(tokenizer(["query"], ["passage"], return_tensors="pt"))
+    names = list(sample)
+    float_path = os.path.join(directory, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample,),  # A trailing dict is passed as keyword arguments
+            float_path,
+            input_names=names,
+            output_names=["logits"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in names}, "logits": {0: "batch"}},
+            opset_version=14,
+        )
+    quantized_path = os.path.join(directory, "model.int8.onnx")
+    quantize_dynamic(float_path, quantized_path, weight_type=QuantType.QInt8)
+    return quantized_path
+
+
+class TorchReranker:
+    backend = "torch"
+
+    def __init__(self, model_name=RERANK_MODEL):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, max_length=MAX_LENGTH)
+
+    def scores(self, query, documents):
+        return np.asarray(self.model.predict([(query, document) for document in documents]), dtype=np.float32)
+
+    def rank(self, query, documents, top_k=None):
+        return _ranked(self.scores(query, documents), top_k)
+
+
+class OnnxReranker:
+    backend = "onnx"
+
+    def __init__(self, model_name=RERANK_MODEL, directory=RERANK_ONNX_DIR, threads=RERANK_THREADS,
+                 batch_size=RERANK_BATCH, quantized=True):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(directory, "model.int8.onnx" if quantized else "model.onnx")
+        if not os.path.exists(model_path):
+            export_onnx(model_name, directory)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=MAX_LENGTH)
+        self.pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.batch_size = batch_size
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+
+    def _batch(self, encodings):
+        """Pad one batch to its longest pair, rounded up to PAD_MULTIPLE"""
+        length = max(len(encoding.ids) for encoding in encodings)
+        length = min(MAX_LENGTH, -(-length // PAD_MULTIPLE) * PAD_MULTIPLE)
+        input_ids = np.full((len(encodings), length), self.pad_id, dtype=np.int64)
+        token_type_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+        for i, encoding in enumerate(encodings):
+            n = len(encoding.ids)
+            input_ids[i, :n] = encoding.ids
+            token_type_ids[i, :n] = encoding.type_ids
+            attention_mask[i, :n] = 1
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        return {name: value for name, value in inputs.items() if name in self.input_names}
+
+    def scores(self, query, documents):
+        if not documents:
+            return np.empty(0, dtype=np.float32)
+        encodings = self.tokenizer.encode_batch([(query, document) for document in documents])
+        order = np.argsort([len(encoding.ids) for encoding in encodings], kind="stable")
+        logits = np.empty(len(documents), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            output = self.session.run(["logits"], self._batch([encodings[i] for i in rows]))[0]
+            logits[rows] = output[:, 0]
+        # CrossEncoder applies a sigmoid to single-label models
+        return _sigmoid(logits)
+
+    def rank(self, query, documents, top_k=None):
+        return _ranked(self.scores(query, documents), top_k)
+
+
+BACKENDS = {"torch": TorchReranker, "onnx": OnnxReranker}
+
+
+def get_reranker(backend=RERANK_BACKEND):
+    """Load the reranker for ``backend`` once per process"""
+    if backend not in BACKENDS:
+        raise ValueError(f"RERANK_BACKEND must be one of {', '.join(BACKENDS)}")
+    with _rerankers_lock:
+        if backend not in _rerankers:
+            _rerankers[backend] = BACKENDS[backend]()
+        return _rerankers[backend]
@@ -0,0 +1,135 @@
+"""Server-side handles on the last result set of a chat session.
+
+After a multi-row answer the DataFrame stays in the process (keyed by the
+user name and the session id, so a session id alone never reaches another
+user's result) and only a small ``ResultHandle`` lives in the session state.
+Follow-up questions such as "which of those are still open?" are then
+answered from the handle instead of generating SQL over the whole incidents
+table: trivial ones ("how many of those?") directly in pandas, the rest with
+SQL against an in-memory copy of the handle (table ``result``) generated from a
+prompt that only describes the handle's columns.
+
+Handles of truncated results (the query guard's LIMIT was hit) are not used
+for follow-ups, since the answer could be missing rows.
+"""
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from query_guard import is_aggregate_query, normalize_statement
+
+HANDLE_TABLE = "result"
+MAX_SESSIONS = 64
+HANDLE_TTL_S = 60 * 60
+
+
+@dataclass
+class ResultHandle:
+    handle_id: str
+    question: str
+    sql: str
+    columns: list
+    row_count: int
+    truncated: bool = False
+    created_at: float = field(default_factory=time.time)
+
+
+class ResultStore:
+    """In-process store of the latest result DataFrame per ``(username, session id)`` key (LRU + TTL)"""
+
+    def __init__(self, max_sessions=MAX_SESSIONS, ttl_s=HANDLE_TTL_S):
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._frames = OrderedDict()  # (username, session id) -> (handle, DataFrame)
+        self._lock = threading.Lock()
+
+    def put(self, key, df, question, sql="", truncated=False):
+        handle = ResultHandle(
+            handle_id=uuid.uuid4().hex, question=question, sql=sql,
+            columns=list(df.columns), row_count=len(df), truncated=truncated,
+        )
+        with self._lock:
+            self._frames[key] = (handle, df)
+            self._frames.move_to_end(key)
+            while len(self._frames) > self.max_sessions:
+                self._frames.popitem(last=False)
+        return handle
+
+    def get(self, key, handle_id=None):
+        """Return the key's DataFrame, or None if expired or superseded"""
+        entry = self.get_handle(key)
+        if entry is None or (handle_id is not None and entry[0].handle_id != handle_id):
+            return None
+        return entry[1]
+
+    def get_handle(self, key):
+        """Return ``(handle, DataFrame)`` for the key, or None if there is none or it expired"""
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                return None
+            handle, df = entry
+            if time.time() - handle.created_at > self.ttl_s:
+                del self._frames[key]
+                return None
+            self._frames.move_to_end(key)
+            return entry
+
+    def drop(self, key):
+        with self._lock:
+            self._frames.pop(key, None)
+
+
+result_store = ResultStore()
+
+
+# Explicit references to the previous result only: a bare "them", "which of" or "the list"
+# also occurs in stand-alone questions ("... sort them in descending order")
+_FOLLOWUP_RE = re.compile(
+    r"\b(those|these|(?:of|among|from) them|the above|previous (?:results?|list|ones)|that list|"
+    r"of which|from that|the same ones?)\b",
+    re.IGNORECASE,
+)
+_COUNT_RE = re.compile(r"^\s*how many (?:of )?(?:those|these|them|are there)(?: are there)?\s*\??\s*$", re.IGNORECASE)
+
+
+def is_followup(question):
+    """Whether the question refers back to the previous result set"""
+    return bool(_FOLLOWUP_RE.search(question))
+
+
+def answer_directly(question, df):
+    """Answer trivial follow-ups in pandas; returns None when SQL is needed"""
+    if _COUNT_RE.match(question):
+        return f"There are {len(df)} incidents in the previous result."
+    return None
+
+
+def describe_handle(df, samples=2):
+    """Compact schema of the handle for the follow-up prompt: column names with sample values"""
+    lines = []
+    for column in df.columns:
+        values = df[column].dropna().astype(str).unique()[:samples]
+        example = ", ".join(v[:40] for v in values)
+        lines.append(f"- {column}" + (f" (e.g. {example})" if example else ""))
+    return "\n".join(lines)
+
+
+def query_handle(df, sql):
+    """Run a generated SELECT against an in-memory copy of the handle.
+
+    Returns ``(result, is_aggregate)``.
+    """
+    sql = normalize_statement(sql)
+    conn = sqlite3.connect(":memory:")
+    try:
+        df.to_sql(HANDLE_TABLE, conn, index=False)
+        return pd.read_sql_query(sql, conn), is_aggregate_query(sql)
+    finally:
+        conn.close()
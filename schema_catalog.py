@@ -0,0 +1,183 @@
+"""Incident table schema catalog and per-question column selection.
+
+Every column of the ``incidents`` table carries a short description and a sample
+value. ``select_columns`` ranks the columns against a question by keyword overlap
+and, when the embedding model is reachable, by embedding similarity, so only the
+relevant part of the schema is sent to the SQL model.
+"""
+import math
+import os
+import re
+
+from ollama_client import embed_optional
+
+SCHEMA_TOP_N = int(os.getenv("SCHEMA_TOP_N", "12"))
+
+# Columns that are always part of the pruned schema
+ALWAYS_INCLUDE = ["client_name"]
+
+# (column, description, sample value)
+INCIDENT_COLUMNS = [
+    ("incident_id", "unique incident number", "2288441"),
+    ("incident_title", "incident headline, usually which link is down", "Auto Ticket: MBKAM042HTR01_MBMKM1 to MBKAM049HTR01_MBADA3 is down"),
+    ("ticket_id", "trouble ticket number", "2288940"),
+    ("ticket_title", "trouble ticket headline", "Auto Ticket:[NEW_UNMS]-: MBKAM042HTR01_MBMKM1 to MBKAM049HTR01_MBADA3 is down"),
+    ("fault_id", "fault record number", "2393955"),
+    ("client_name", "client / customer / operator the incident belongs to", "GP"),
+    ("link_name_nttn", "NTTN link name affected", "MBKAM049HTR01_MBADA3 to MBKAM042HTR01_MBMKM1"),
+    ("link_name_gateway", "gateway link name affected", ""),
+    ("link_id", "link identifier", "NA"),
+    ("LH", "long haul link flag", ""),
+    ("capacity_nttn", "NTTN link capacity / bandwidth in Mbps", "10000"),
+    ("capacity_gateway", "gateway link capacity / bandwidth", "NA"),
+    ("uni_nni", "interface type UNI or NNI", "NNI"),
+    ("issue_type", "issue type such as NTTN or gateway", "NTTN"),
+    ("client_priority", "client priority level such as VVIP, VIP", "VVIP"),
+    ("link_type", "link medium such as OH (overhead) or UG (underground)", "OH"),
+    ("problem_category", "problem category such as Link Down or degradation", "Link Down"),
+    ("problem_source", "how the problem was detected, e.g. NMS", "NMS"),
+    ("reason", "root cause / reason text such as power outage, fiber cut, fire", "Others : Client end Power Outage/Ckt Breaker Trip/Others"),
+    ("event_time", "when the incident happened / started (YYYY-MM-DD HH:MM:SS)", "2024-07-01 00:01:00"),
+    ("escalation_time", "when the incident was escalated (YYYY-MM-DD HH:MM:SS)", "2024-07-01 00:05:34"),
+    ("clear_time", "when the incident was cleared / resolved (YYYY-MM-DD HH:MM:SS)", "2024-07-01 00:18:23"),
+    ("client_side_impact", "impact on the client side", "TBD"),
+    ("provider_side_impact", "impact on the provider side", "MBKAM042HTR01_MBMKM1 to MBKAM049HTR01_MBADA3"),
+    ("remarks", "free-text NOC remarks", "oss_bot(NOC)[2024-07-01 00:05:34] : ... is down"),
+    ("responsible_concern", "responsible party for the fault", "NA"),
+    ("responsible_field_team", "responsible field team id", "12"),
+    ("fault_status", "fault status such as open or closed (resolved / unresolved)", "closed"),
+    ("created_time", "when the ticket record was created", "2024-07-01 00:05:34"),
+    ("task_comments", "free-text task comment history", "[oss_bot][NOC][2024-07-01 00:05:34][escalated] : ... is down"),
+    ("client_comments", "free-text client comment history", "[oss_bot][10][2024-07-01 00:05:34]: ... is down"),
+    ("provider", "provider id", "258"),
+    ("task_resolutions", "resolution / fix applied", "Others: Client end Power outage/Ckt Breaker trip/Others->Others: Data Provided"),
+    ("subcenter", "NOC subcenter handling the incident", "Sylhet"),
+    ("region", "operations region", "Regional Implementation & Operations 2"),
+    ("district", "district / location of the incident", "Sylhet"),
+    ("vendor", "field vendor", "Green Surma"),
+    ("duration", "outage duration in hours (numeric text, CAST to REAL)", "0.2897"),
+    ("last_om_comment_id", "user who made the last O&M comment", "munshi.sarfaraj"),
+    ("last_om_end_time", "last O&M end time", "2024-07-01 00:18:23"),
+    ("last_om_end_time_db", "last O&M end time recorded in the database", "2024-07-01 00:18:12"),
+    ("ticket_initiator_id", "user who opened the ticket", "oss_bot"),
+    ("ticket_closer_id", "user who closed the ticket", "zahid.iqbal"),
+    ("fault_closer_id", "user who closed the fault", "zahid.iqbal"),
+    ("sms_time", "SMS notification time", "NO SMS"),
+    ("force_majeure", "force majeure flag true/false", "false"),
+    ("vlan_id", "VLAN id", "0"),
+    ("assigned_dept_names", "assigned departments", ""),
+    ("number_of_occurance", "number of repeated occurrences of the issue", "Cannot Provide"),
+]
+
+COLUMN_NAMES = [name for name, _, _ in INCIDENT_COLUMNS]
+
+# Extra trigger words for columns whose names do not match how people ask
+COLUMN_SYNONYMS = {
+    "client_name": ["client", "customer", "operator", "company"],
+    "event_time": ["when", "date", "day", "month", "year", "yesterday", "today", "week", "happened", "time", "recent", "latest", "last"],
+    "clear_time": ["resolve", "resolved", "fix", "fixed", "clear", "restored"],
+    "escalation_time": ["escalate", "escalated", "escalation"],
+    "duration": ["long", "longest", "duration", "downtime", "outage", "hours"],
+    "fault_status": ["open", "closed", "unresolved", "pending", "status", "still"],
+    "reason": ["cause", "why", "fire", "cut", "power", "theft", "fiber", "cable"],
+    "client_priority": ["vvip", "vip", "priority"],
+    "link_name_nttn": ["link", "links"],
+    "number_of_occurance": ["repeated", "repeat", "recurring"],
+    "incident_id": ["incident", "incidents", "count", "many"],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = {
+    "a", "all", "an", "and", "any", "are", "by", "e", "for", "from", "g", "had", "has", "have", "how",
+    "in", "is", "it", "me", "most", "of", "on", "or", "such", "the", "their", "them", "there", "these",
+    "those", "to", "was", "were", "what", "which", "who", "with",
+}
+
+# Cache of column embeddings, computed once per process
+_column_embeddings = None
+
+
+def _tokens(text):
+    tokens = set()
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.add(token)
+        if len(token) > 3 and token.endswith("s"):
+            tokens.add(token[:-1])
+    return tokens
+
+
+def _column_text(name, description):
+    return f"{name.replace('_', ' ')}: {description}"
+
+
+def _keyword_scores(question):
+    question_tokens = _tokens(question)
+    question_lower = question.lower()
+    scores = {}
+    for name, description, _ in INCIDENT_COLUMNS:
+        score = 0.0
+        if name.lower() in question_lower:
+            score += 3.0
+        name_tokens = _tokens(name.replace("_", " "))
+        score += 1.5 * len(question_tokens & name_tokens)
+        score += 0.5 * len(question_tokens & _tokens(description))
+        score += 1.0 * len(question_tokens & set(COLUMN_SYNONYMS.get(name, [])))
+        scores[name] = score
+    top = max(scores.values()) or 1.0
+    return {name: score / top for name, score in scores.items()}
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _embedding_scores(question):
+    """Cosine similarity between the question and every column description"""
+    global _column_embeddings
+    if _column_embeddings is None:
+        _column_embeddings = {
+            name: embed_optional(_column_text(name, description))
+            for name, description, _ in INCIDENT_COLUMNS
+        }
+    question_embedding = embed_optional(question)
+    return {name: _cosine(question_embedding, vector) for name, vector in _column_embeddings.items()}
+
+
+def select_columns(question, top_n=SCHEMA_TOP_N, use_embeddings=True):
+    """Return the top-N columns relevant to the question, in table order"""
+    scores = _keyword_scores(question)
+    if use_embeddings:
+        try:
+            similarities = _embedding_scores(question)
+            scores = {name: 0.5 * scores[name] + 0.5 * similarities[name] for name in scores}
+        except Exception:
+            pass  # Embedding model unavailable, keyword ranking only
+
+    ranked = sorted(COLUMN_NAMES, key=lambda name: scores[name], reverse=True)
+    selected = set(ALWAYS_INCLUDE)
+    for name in ranked:
+        if len(selected) >= max(top_n, len(ALWAYS_INCLUDE)) or scores[name] <= 0:
+            break
+        selected.add(name)
+    return [name for name in COLUMN_NAMES if name in selected]
+
+
+def format_schema(columns=None):
+    """Render columns as 'name -- description (e.g. sample)' lines for a prompt"""
+    columns = set(columns or COLUMN_NAMES)
+    lines = []
+    for name, description, sample in INCIDENT_COLUMNS:
+        if name in columns:
+            example = f" (e.g. {sample!r})" if sample else ""
+            lines.append(f"- {name} -- {description}{example}")
+    return "\n".join(lines)
+
+
+def estimate_tokens(text):
+    """Rough token count (words and punctuation) for prompt size reporting"""
+    return len(re.findall(r"\w+|[^\w\s]", text))
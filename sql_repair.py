@@ -0,0 +1,205 @@
+"""Bounded self-repair of generated SQL that fails to compile or run.
+
+Small models often wrap the query in ```sql``` fences, prefix it with "Here is
+the query:", add an explanation after it or misspell a column, even though
+the prompt forbids all of it. ``execute_with_repair`` runs the query and, if it
+fails with a repairable error, escalates through two levels:
+
+1. deterministic -- strip fences, prefixes and trailing commentary, then map
+   every unknown column / table SQLite reports to the closest schema name
+   (difflib), re-running after each fix;
+2. llm -- send the failing SQL and the SQLite error back to the model, at most
+   ``SQL_REPAIR_ATTEMPTS`` times and within ``SQL_REPAIR_BUDGET_S`` seconds in
+   total (measured from the first failure).
+
+Each level runs in a ``sql.repair.<level>`` tracing span; a level that does
+not fix the query ends its span with a ``RepairFailed`` error, so the trace log
+and the Prometheus metrics give the success rate and added latency per level
+(``summarize_repairs`` for the admin panel).
+"""
+import difflib
+import os
+import re
+import time
+
+from query_guard import QueryNeedsConfirmation, QueryRejected
+from schema_catalog import COLUMN_NAMES
+from tracing import span
+
+SQL_REPAIR_ATTEMPTS = int(os.getenv("SQL_REPAIR_ATTEMPTS", "2"))
+SQL_REPAIR_BUDGET_S = float(os.getenv("SQL_REPAIR_BUDGET_S", "20"))
+
+TABLE_NAMES = ["incidents", "incidents_fts"]
+# Unknown identifiers fixed per query before giving up on the deterministic level
+MAX_IDENTIFIER_FIXES = 3
+FUZZY_CUTOFF = 0.75
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*\s*(.*?)(?:```|$)", re.DOTALL)
+_START_RE = re.compile(r"\b(SELECT|WITH)\b", re.IGNORECASE)
+_UNKNOWN_RE = re.compile(r"no such (column|table): ([\w.]+)", re.IGNORECASE)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_ALIAS_RE = re.compile(r"\bAS\s+(\w+)", re.IGNORECASE)
+_PROSE_RE = re.compile(
+    r"^\s*(note|this|the|here|explanation|it|these|please|also|above|below|i)\b|[.:]\s*$", re.IGNORECASE
+)
+
+REPAIR_PROMPT = """The SQL query below failed. Return a corrected query for the same question.
+
+Question: {question}
+Failing SQL: {sql}
+SQLite error: {error}
+"""
+
+
+class RepairFailed(Exception):
+    """A repair level did not produce a working query"""
+
+
+def is_repairable(error):
+    """True for errors a corrected query could avoid (not cost limits or access rules)"""
+    if isinstance(error, QueryNeedsConfirmation):
+        return False
+    if isinstance(error, QueryRejected) and error.guarded is not None:
+        return False  # Compiled fine but too expensive
+    message = str(error).lower()
+    return "not authorized" not in message and "prohibited" not in message
+
+
+def strip_wrapping(sql):
+    """Remove markdown fences, leading prose and trailing commentary"""
+    fenced = _FENCE_RE.search(sql)
+    if fenced:
+        sql = fenced.group(1)
+    start = _START_RE.search(sql)
+    if start:
+        sql = sql[start.start():]
+    # Everything after the first statement terminator is commentary
+    sql = _STRING_RE.sub(lambda m: m.group().replace(";", "\0"), sql).split(";", 1)[0].replace("\0", ";")
+    lines = []
+    for i, line in enumerate(sql.strip().splitlines()):
+        if i and not line.strip():
+            break  # A blank line ends the query; prose usually follows it
+        if i and _PROSE_RE.search(line) and "'" not in line:
+            break
+        lines.append(line)
+    return "\n".join(lines).strip()
+
+
+def _replace_identifier(sql, old, new):
+    """Replace ``old`` as a whole word outside string literals"""
+    parts, last = [], 0
+    for literal in _STRING_RE.finditer(sql):
+        parts.append(re.sub(rf"\b{re.escape(old)}\b", new, sql[last:literal.start()]))
+        parts.append(literal.group())
+        last = literal.end()
+    parts.append(re.sub(rf"\b{re.escape(old)}\b", new, sql[last:]))
+    return "".join(parts)
+
+
+def fix_unknown_identifier(sql, error, columns=COLUMN_NAMES):
+    """Rewrite the column / table named in a 'no such ...' error to its closest match, or None"""
+    found = _UNKNOWN_RE.search(str(error))
+    if not found:
+        return None
+    kind, name = found.group(1).lower(), found.group(2).split(".")[-1]
+    if kind == "table":
+        candidates = TABLE_NAMES
+    else:
+        candidates = list(columns) + _ALIAS_RE.findall(sql)
+    by_lower = {candidate.lower(): candidate for candidate in candidates}
+    match = difflib.get_close_matches(name.lower(), list(by_lower), n=1, cutoff=FUZZY_CUTOFF)
+    if not match or by_lower[match[0]] == name:
+        return None
+    return _replace_identifier(sql, name, by_lower[match[0]])
+
+
+def execute_with_repair(sql, run, regenerate=None, attempts=SQL_REPAIR_ATTEMPTS, budget_s=SQL_REPAIR_BUDGET_S):
+    """Run ``sql`` with ``run(sql)``, repairing it on failure.
+
+    ``regenerate(sql, error, timeout)`` asks the model for a corrected query.
+    Returns ``(result, final_sql, level)`` with level ``None`` (no repair
+    needed), ``"deterministic"`` or ``"llm"``; re-raises the last error when
+    the query cannot be repaired.
+    """
+    try:
+        return run(sql), sql, None
+    except Exception as e:
+        if not is_repairable(e):
+            raise
+        error = e
+    deadline = time.monotonic() + budget_s
+    tried = {sql}
+
+    try:
+        with span("sql.repair.deterministic") as s:
+            candidate = strip_wrapping(sql)
+            for _ in range(MAX_IDENTIFIER_FIXES + 1):
+                if candidate and candidate not in tried:
+                    tried.add(candidate)
+                    try:
+                        result = run(candidate)
+                        s.set(rows=len(result))
+                        return result, candidate, "deterministic"
+                    except Exception as e:
+                        if not is_repairable(e):
+                            raise
+                        error, sql = e, candidate
+                candidate = fix_unknown_identifier(sql, error)
+                if candidate is None:
+                    break
+            raise RepairFailed(str(error))
+    except RepairFailed:
+        pass
+
+    if regenerate is None:
+        raise error
+    for attempt in range(1, attempts + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            with span("sql.repair.llm", attempt=attempt) as s:
+                candidate = regenerate(sql, error, remaining)
+                candidate = strip_wrapping(candidate) if candidate else None
+                if not candidate or candidate in tried:
+                    raise RepairFailed("No new query")
+                tried.add(candidate)
+                try:
+                    result = run(candidate)
+                except Exception as e:
+                    if not is_repairable(e):
+                        raise
+                    error, sql = e, candidate
+                    raise RepairFailed(str(e))
+                s.set(rows=len(result))
+                return result, candidate, "llm"
+        except RepairFailed:
+            continue
+    raise error
+
+
+def repair_prompt(question, sql, error):
+    return REPAIR_PROMPT.format(question=question, sql=sql, error=str(error)[:500])
+
+
+def summarize_repairs(records):
+    """Attempts, successes and mean added latency per repair level from trace records"""
+    levels = {}
+    for record in records:
+        stage = record.get("stage", "")
+        if not stage.startswith("sql.repair."):
+            continue
+        level = levels.setdefault(stage[len("sql.repair."):], {"attempts": 0, "fixed": 0, "ms": 0.0})
+        level["attempts"] += 1
+        level["fixed"] += "error" not in record
+        level["ms"] += record["ms"]
+    return [
+        {
+            "level": name,
+            "attempts": level["attempts"],
+            "fixed": level["fixed"],
+            "success_rate": round(level["fixed"] / level["attempts"], 3),
+            "avg_added_ms": round(level["ms"] / level["attempts"], 1),
+        }
+        for name, level in sorted(levels.items())
+    ]
@@ -0,0 +1,524 @@
+"""Library of verified, parameterized question-to-SQL templates.
+
+The same operational questions are asked every day, so instead of generating
+their SQL each time the assistant keeps verified templates such as
+
+    SELECT client_name, COUNT(*) AS incident_count FROM incidents
+    GROUP BY client_name ORDER BY incident_count DESC LIMIT {limit}
+
+with a few example phrasings each. An incoming question is normalized (dates
+and numbers masked, so "july 2024" and "march 2023" look alike), embedded and
+compared with the phrasings; keyword overlap is used when the embedding model
+is unreachable. If the best template scores above ``TEMPLATE_THRESHOLD``, its
+closest phrasing asks for the same kind of answer ("how many" or not) and it
+has a placeholder for every parameter found in the question, its SQL is filled
+in and run without calling the LLM. Otherwise the closest templates are added
+to the SQL prompt as few-shot examples.
+
+Templates live in the ``sql_templates`` table of the incidents database, seeded
+from SEED_TEMPLATES at start-up and on ingest, so queries promoted by an admin
+are picked up by every process. The question path only reads the table. Parameters are only ever filled with values parsed and validated here
+(integers, ISO dates, digit-only ids), never with raw question text.
+"""
+import calendar
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from ollama_client import embed_optional
+
+TEMPLATES_TABLE = "sql_templates"
+
+# Fast path: minimum similarity to run a template without the LLM (0 disables it)
+TEMPLATE_THRESHOLD = float(os.getenv("SQL_TEMPLATE_THRESHOLD", "0.9"))
+# Few-shot: number of closest templates added to the prompt, and their minimum similarity
+TEMPLATE_EXAMPLES = int(os.getenv("SQL_TEMPLATE_EXAMPLES", "2"))
+TEMPLATE_EXAMPLE_MIN = float(os.getenv("SQL_TEMPLATE_EXAMPLE_MIN", "0.5"))
+
+MAX_LIMIT = 1000
+
+# (name, example questions, SQL, default parameters)
+SEED_TEMPLATES = [
+    (
+        "top_clients_by_incidents",
+        ["Top 5 clients with most incidents and their count.", "Which clients have the most incidents?",
+         "Top 10 clients by number of incidents"],
+        "SELECT client_name, COUNT(*) AS incident_count FROM incidents "
+        "GROUP BY client_name ORDER BY incident_count DESC LIMIT {limit}",
+        {"limit": 5},
+    ),
+    (
+        "incidents_per_link",
+        ["List all the different link_name_nttn and their incident counts.", "Incident count per link",
+         "Which links have the most incidents?"],
+        "SELECT link_name_nttn, COUNT(*) AS incident_count FROM incidents "
+        "GROUP BY link_name_nttn ORDER BY incident_count DESC",
+        {},
+    ),
+    (
+        "incidents_in_period",
+        ["Find all the incident that happened in july 2024.", "Show incidents from march 2024",
+         "List incidents in the last 7 days", "What incidents happened yesterday?"],
+        "SELECT * FROM incidents WHERE event_time >= '{start}' AND event_time < '{end}' ORDER BY event_time",
+        {"start": None, "end": None},
+    ),
+    (
+        "incident_count_in_period",
+        ["How many incidents happened in july 2024?", "Number of incidents in the last 30 days",
+         "Count the incidents from this month"],
+        "SELECT COUNT(*) AS incident_count FROM incidents WHERE event_time >= '{start}' AND event_time < '{end}'",
+        {"start": None, "end": None},
+    ),
+    (
+        "top_clients_by_vvip",
+        ["Which 5 clients had the most VVIP priority and how many?", "Clients with the most VVIP incidents"],
+        "SELECT client_name, COUNT(*) AS vvip_incidents FROM incidents WHERE client_priority = 'VVIP' "
+        "GROUP BY client_name ORDER BY vvip_incidents DESC LIMIT {limit}",
+        {"limit": 5},
+    ),
+    (
+        "average_clear_time",
+        ["What is the average clear time taken to resolve an incident?", "Average time to resolve incidents",
+         "Mean resolution time in hours"],
+        "SELECT ROUND(AVG((julianday(clear_time) - julianday(event_time)) * 24), 2) AS avg_clear_hours "
+        "FROM incidents WHERE clear_time IS NOT NULL AND clear_time != ''",
+        {},
+    ),
+    (
+        "incidents_per_district",
+        ["Which districts have the most incidents and how many? sort them in descending order",
+         "Incident count by district"],
+        "SELECT district, COUNT(*) AS incident_count FROM incidents "
+        "GROUP BY district ORDER BY incident_count DESC",
+        {},
+    ),
+    (
+        "top_clients_by_repeated_issues",
+        ["Which 10 clients face the most repeated issues?", "Clients with the most recurring link failures"],
+        "SELECT client_name, SUM(occurrences) AS repeated_incidents FROM ("
+        "SELECT client_name, link_name_nttn, COUNT(*) AS occurrences FROM incidents "
+        "GROUP BY client_name, link_name_nttn HAVING COUNT(*) > 1) "
+        "GROUP BY client_name ORDER BY repeated_incidents DESC LIMIT {limit}",
+        {"limit": 10},
+    ),
+    (
+        "unresolved_incidents",
+        ["Are there any unresolved incidents?", "Show open incidents", "Which incidents are still not cleared?"],
+        "SELECT * FROM incidents WHERE LOWER(fault_status) != 'closed' OR clear_time IS NULL OR clear_time = '' "
+        "ORDER BY event_time DESC",
+        {},
+    ),
+    (
+        "late_escalations",
+        ["Find incidents where escalation time was more than 10 mins after the event.",
+         "Incidents escalated later than 30 minutes"],
+        "SELECT * FROM incidents WHERE (julianday(escalation_time) - julianday(event_time)) * 1440 > {minutes} "
+        "ORDER BY event_time DESC",
+        {"minutes": 10},
+    ),
+    (
+        "top_clients_by_duration",
+        ["which 5 clients had the most incident duration and how long?", "Clients with the longest total outage"],
+        "SELECT client_name, ROUND(SUM(CAST(duration AS REAL)), 2) AS total_duration_hours FROM incidents "
+        "GROUP BY client_name ORDER BY total_duration_hours DESC LIMIT {limit}",
+        {"limit": 5},
+    ),
+    (
+        "incident_by_id",
+        ["Show incident 2288441", "Details of incident id 2288441", "What happened in incident #2288441?"],
+        "SELECT * FROM incidents WHERE incident_id = '{incident_id}'",
+        {"incident_id": None},
+    ),
+]
+
+PLACEHOLDER_RE = re.compile(r"\{(limit|start|end|minutes|incident_id|client)\}")
+
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+_MONTH_RE = "|".join(sorted(_MONTHS, key=len, reverse=True))
+
+_INCIDENT_ID_RE = re.compile(r"\b(?:incident|ticket)s?\s*(?:id|no\.?|number)?\s*#?\s*(\d{5,})\b", re.IGNORECASE)
+_MONTH_YEAR_RE = re.compile(rf"\b({_MONTH_RE})\.?,?\s+(\d{{4}})\b", re.IGNORECASE)
+_MONTH_ONLY_RE = re.compile(rf"\b(?:in|during|for|of|from)\s+({_MONTH_RE})\b", re.IGNORECASE)
+_YEAR_RE = re.compile(r"\b(?:in|during|for|of|from)\s+(20\d{2})\b", re.IGNORECASE)
+_LAST_DAYS_RE = re.compile(r"\b(?:last|past)\s+(\d{1,3})\s+days?\b", re.IGNORECASE)
+_RELATIVE_RE = re.compile(r"\b(today|yesterday|this week|last week|this month|last month)\b", re.IGNORECASE)
+_MINUTES_RE = re.compile(r"\b(\d{1,4})\s*(?:mins?|minutes?)\b", re.IGNORECASE)
+_HOURS_RE = re.compile(r"\b(\d{1,3})\s*(?:hrs?|hours?)\b", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"\b\d+\b")
+
+_COUNT_INTENT_RE = re.compile(r"\b(how many|number of|count)\b", re.IGNORECASE)
+_TOKEN_RE = re.compile(r"[a-z0-9_<>]+")
+_STOPWORDS = {
+    "a", "all", "an", "and", "any", "are", "by", "did", "do", "for", "from", "had", "has", "have", "in", "is",
+    "it", "me", "of", "on", "or", "show", "the", "their", "them", "there", "to", "was", "were", "what", "which",
+    "with",
+}
+
+
+def _month_range(year, month):
+    start = datetime(year, month, 1)
+    end = datetime(year + (month == 12), month % 12 + 1, 1)
+    return start, end
+
+
+def extract_params(question, now=None):
+    """Parameters a question supplies: incident_id, start/end dates, minutes and limit.
+
+    Returns ``(params, normalized_question)``; the normalized question has the
+    values replaced by ``<id>``, ``<date>`` and ``<n>`` for matching.
+    """
+    now = now or datetime.now()
+    today = datetime(now.year, now.month, now.day)
+    params = {}
+    text = question
+
+    def take(regex, mask, handle):
+        nonlocal text
+        found = regex.search(text)
+        if found:
+            handle(found)
+            text = text[:found.start()] + f" {mask} " + text[found.end():]
+        return found
+
+    take(_INCIDENT_ID_RE, "incident <id>", lambda m: params.update(incident_id=m.group(1)))
+
+    def set_range(start, end):
+        params.setdefault("start", start.strftime("%Y-%m-%d"))
+        params.setdefault("end", end.strftime("%Y-%m-%d"))
+
+    def month_year(m):
+        set_range(*_month_range(int(m.group(2)), _MONTHS[m.group(1).lower()]))
+
+    def month_only(m):
+        month = _MONTHS[m.group(1).lower()]
+        # The most recent such month
+        set_range(*_month_range(now.year if month <= now.month else now.year - 1, month))
+
+    def last_days(m):
+        set_range(today - timedelta(days=int(m.group(1))), today + timedelta(days=1))
+
+    def relative(m):
+        word = m.group(1).lower()
+        if word == "today":
+            set_range(today, today + timedelta(days=1))
+        elif word == "yesterday":
+            set_range(today - timedelta(days=1), today)
+        elif word == "this week":
+            set_range(today - timedelta(days=today.weekday()), today + timedelta(days=1))
+        elif word == "last week":
+            start = today - timedelta(days=today.weekday() + 7)
+            set_range(start, start + timedelta(days=7))
+        elif word == "this month":
+            set_range(datetime(now.year, now.month, 1), today + timedelta(days=1))
+        else:
+            previous = datetime(now.year, now.month, 1) - timedelta(days=1)
+            set_range(*_month_range(previous.year, previous.month))
+
+    if not take(_MONTH_YEAR_RE, "in <date>", month_year):
+        if not take(_LAST_DAYS_RE, "in <date>", last_days):
+            if not take(_RELATIVE_RE, "<date>", relative):
+                if not take(_MONTH_ONLY_RE, "in <date>", month_only):
+                    take(_YEAR_RE, "in <date>", lambda m: set_range(datetime(int(m.group(1)), 1, 1),
+                                                                  datetime(int(m.group(1)) + 1, 1, 1)))
+
+    take(_MINUTES_RE, "<n> minutes", lambda m: params.update(minutes=int(m.group(1))))
+    take(_HOURS_RE, "<n> minutes", lambda m: params.update(minutes=int(m.group(1)) * 60))
+
+    found = _NUMBER_RE.search(text)
+    if found and 0 < int(found.group()) <= MAX_LIMIT:
+        params["limit"] = int(found.group())
+        text = text[:found.start()] + "<n>" + text[found.end():]
+    return params, " ".join(text.split())
+
+
+def render(sql, params):
+    """Fill ``{placeholder}``s with validated values; None if one is missing"""
+    values = {}
+    for name in set(PLACEHOLDER_RE.findall(sql)):
+        value = params.get(name)
+        if value is None:
+            return None
+        if name in ("limit", "minutes"):
+            value = int(value)
+            if name == "limit":
+                value = max(1, min(value, MAX_LIMIT))
+        elif name in ("start", "end"):
+            value = datetime.strptime(str(value), "%Y-%m-%d").strftime("%Y-%m-%d")
+        elif name == "incident_id":
+            if not str(value).isdigit():
+                return None
+        else:
+            value = str(value).replace("'", "''")
+        values[name] = str(value)
+    return PLACEHOLDER_RE.sub(lambda m: values[m.group(1)], sql)
+
+
+def parameterize(question, sql):
+    """Turn a successful generated query into a template for its question.
+
+    Literal values that came from the question (the LIMIT, date bounds, minute
+    thresholds, the incident id) are replaced with placeholders; values that
+    cannot be located stay literal, and such a template then only serves as a
+    few-shot example for questions carrying other values.
+    """
+    params, _ = extract_params(question)
+    sql = sql.strip().rstrip(";")
+    if "limit" in params:
+        sql = re.sub(rf"\bLIMIT\s+{params['limit']}\b", "LIMIT {limit}", sql, flags=re.IGNORECASE)
+    for name in ("start", "end"):
+        if name in params:
+            sql = re.sub(rf"'{params[name]}(?: 00:00:00)?'", "'{" + name + "}'", sql)
+    if "minutes" in params:
+        sql = re.sub(rf"(>=?\s*){params['minutes']}\b", r"\g<1>{minutes}", sql)
+    if "incident_id" in params:
+        sql = sql.replace(f"'{params['incident_id']}'", "'{incident_id}'")
+    defaults = {name: params.get(name) for name in set(PLACEHOLDER_RE.findall(sql))}
+    return sql, defaults
+
+
+def _tokens(text):
+    return {token for token in _TOKEN_RE.findall(text.lower()) if token not in _STOPWORDS}
+
+
+def _keyword_similarity(a, b):
+    a, b = _tokens(a), _tokens(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+@dataclass
+class Template:
+    template_id: int
+    name: str
+    questions: list
+    sql: str
+    params: dict = field(default_factory=dict)
+    source: str = "seed"
+
+    @property
+    def placeholders(self):
+        return set(PLACEHOLDER_RE.findall(self.sql))
+
+    def example(self):
+        """(question, SQL) with the first phrasing's values filled in, for few-shot prompts"""
+        for question in self.questions:
+            params, _ = extract_params(question)
+            sql = render(self.sql, {**self.params, **params})
+            if sql:
+                return question, sql
+        return None
+
+
+@dataclass
+class TemplateMatch:
+    template: Template
+    score: float
+    sql: str = None  # Rendered SQL when the template can answer the question directly
+
+
+def ensure_templates_table(conn):
+    """Create the templates table with the seed templates if it does not exist"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (TEMPLATES_TABLE,)
+    ).fetchone()
+    if exists:
+        return
+    with conn:
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {TEMPLATES_TABLE} ("
+            "template_id INTEGER PRIMARY KEY, name TEXT, questions TEXT NOT NULL, sql TEXT NOT NULL UNIQUE, "
+            "params TEXT NOT NULL DEFAULT '{}', source TEXT, created_by TEXT, created_at TEXT, updated_at REAL)"
+        )
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {TEMPLATES_TABLE} "
+            "(name, questions, sql, params, source, created_by, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'seed', 'system', ?, ?)",
+            [(name, json.dumps(questions), sql, json.dumps(params), now, time.time())
+             for name, questions, sql, params in SEED_TEMPLATES],
+        )
+
+
+class TemplateLibrary:
+    """The templates of one database plus a per-process cache of their embeddings"""
+
+    def __init__(self, database_path, use_embeddings=True):
+        self.database_path = database_path
+        self.use_embeddings = use_embeddings
+        self._templates = []
+        self._version = None
+        self._vectors = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        return sqlite3.connect(self.database_path, timeout=30)
+
+    def ensure_table(self):
+        """Create and seed the templates table of an existing database; False if there is none yet"""
+        if not os.path.exists(self.database_path):
+            return False
+        conn = self._connect()
+        try:
+            ensure_templates_table(conn)
+        finally:
+            conn.close()
+        return True
+
+    def templates(self):
+        """Current templates, reloaded when another process changed the table.
+
+        Reads through a read-only connection and never creates anything: an
+        empty list while the database or the table does not exist yet.
+        """
+        try:
+            conn = sqlite3.connect(f"file:{self.database_path}?mode=ro", uri=True, timeout=30)
+        except sqlite3.OperationalError:
+            return []  # No database yet
+        try:
+            try:
+                version = conn.execute(f"SELECT COUNT(*), MAX(updated_at) FROM {TEMPLATES_TABLE}").fetchone()
+            except sqlite3.OperationalError:
+                return []  # Not seeded yet (see ensure_table)
+            with self._lock:
+                if version != self._version:
+                    rows = conn.execute(
+                        f"SELECT template_id, name, questions, sql, params, source FROM {TEMPLATES_TABLE} "
+                        "ORDER BY template_id"
+                    ).fetchall()
+                    self._templates = [
+                        Template(row[0], row[1], json.loads(row[2]), row[3], json.loads(row[4]), row[5])
+                        for row in rows
+                    ]
+                    self._version = version
+                return list(self._templates)
+        finally:
+            conn.close()
+
+    def warm_up(self):
+        """Seed the table if needed, load the templates and embed their phrasings"""
+        self.ensure_table()
+        templates = self.templates()
+        if self.use_embeddings:
+            for template in templates:
+                for question in template.questions:
+                    self._vector(extract_params(question)[1])
+
+    def _vector(self, text):
+        with self._lock:
+            vector = self._vectors.get(text)
+        if vector is None:
+            vector = embed_optional(text)
+            with self._lock:
+                self._vectors[text] = vector
+        return vector
+
+    def _scores(self, normalized, templates):
+        """``{template_id: (score, phrasing)}`` for each template's most similar phrasing"""
+        phrasings = [(t, q, extract_params(q)[1]) for t in templates for q in t.questions]
+        similarity = None
+        if self.use_embeddings:
+            try:
+                question_vector = self._vector(normalized)
+                similarity = lambda text: _cosine(question_vector, self._vector(text))  # noqa: E731
+                similarity(phrasings[0][2])
+            except Exception:
+                similarity = None  # Embedding model unavailable, keyword overlap only
+        if similarity is None:
+            similarity = lambda text: _keyword_similarity(normalized, text)  # noqa: E731
+        scores = {}
+        for template, question, text in phrasings:
+            score = similarity(text)
+            if score > scores.get(template.template_id, (-1.0, None))[0]:
+                scores[template.template_id] = (score, question)
+        return scores
+
+    def search(self, question, client=None):
+        """Templates ranked by similarity; the first has ``sql`` set if it can answer directly"""
+        templates = self.templates()
+        if not templates:
+            return []
+        params, normalized = extract_params(question)
+        if client is not None:
+            params["client"] = client
+        scores = self._scores(normalized, templates)
+        ranked = sorted(
+            (TemplateMatch(t, scores[t.template_id][0]) for t in templates if t.template_id in scores),
+            key=lambda m: m.score, reverse=True,
+        )
+        if not ranked:
+            return []
+        best = ranked[0]
+        supplied = set(params) - {"client"}
+        closest = scores[best.template.template_id][1]
+        if (
+            TEMPLATE_THRESHOLD > 0
+            and best.score >= TEMPLATE_THRESHOLD
+            and supplied <= best.template.placeholders
+            and bool(_COUNT_INTENT_RE.search(question)) == bool(_COUNT_INTENT_RE.search(closest))
+        ):
+            best.sql = render(best.template.sql, {**best.template.params, **params})
+        return ranked
+
+    def examples(self, matches, k=TEMPLATE_EXAMPLES, min_score=TEMPLATE_EXAMPLE_MIN):
+        """Up to ``k`` (question, SQL) pairs from the closest templates"""
+        examples = []
+        for match in matches:
+            if len(examples) >= k or match.score < min_score:
+                break
+            example = match.template.example()
+            if example:
+                examples.append(example)
+        return examples
+
+    def promote(self, question, sql, username):
+        """Store a generated query as a template; adds the question to an existing identical template"""
+        template_sql, defaults = parameterize(question, sql)
+        conn = self._connect()
+        try:
+            ensure_templates_table(conn)
+            with conn:
+                row = conn.execute(
+                    f"SELECT template_id, questions FROM {TEMPLATES_TABLE} WHERE sql = ?", (template_sql,)
+                ).fetchone()
+                if row:
+                    questions = json.loads(row[1])
+                    if question not in questions:
+                        questions.append(question)
+                    conn.execute(
+                        f"UPDATE {TEMPLATES_TABLE} SET questions = ?, updated_at = ? WHERE template_id = ?",
+                        (json.dumps(questions), time.time(), row[0]),
+                    )
+                    template_id = row[0]
+                else:
+                    template_id = conn.execute(
+                        f"INSERT INTO {TEMPLATES_TABLE} "
+                        "(name, questions, sql, params, source, created_by, created_at, updated_at) "
+                        "VALUES (?, ?, ?, ?, 'promoted', ?, ?, ?)",
+                        (re.sub(r"\W+", "_", question.lower()).strip("_")[:60], json.dumps([question]), template_sql,
+                         json.dumps(defaults), username, time.strftime("%Y-%m-%d %H:%M:%S"), time.time()),
+                    ).lastrowid
+        finally:
+            conn.close()
+        return template_id, template_sql
+
+
+def format_examples(examples):
+    """Few-shot block for the SQL prompt"""
+    if not examples:
+        return ""
+    lines = ["Verified examples:"]
+    for question, sql in examples:
+        lines.append(f"Question: {question}\nSQL: {sql}")
+    return "\n".join(lines) + "\n\n"
@@ -0,0 +1,124 @@
+"""Client-isolated, read-only connections for running LLM-generated SQL.
+
+Isolation is structural rather than textual. For a regular client the
+connection gets a temp view named ``incidents`` that shadows the real table
+(unqualified names resolve to the temp schema first):
+
+    CREATE TEMP VIEW incidents AS SELECT * FROM main.incidents WHERE client_name = '<client>'
+
+so generated SQL is compiled against the client's rows whatever GROUP BY,
+ORDER BY or LIMIT tail it has. SQLite flattens the view into the query, so the
+filter is an ordinary ``client_name = ?`` term that uses
+``idx_incidents_client_name``. The FTS index gets the same treatment: a temp
+view ``incidents_fts`` joins the index to the client's rows by rowid and
+exposes only ``rowid``, ``incident_id`` and the MATCH column, so a standalone
+full-text search returns the client's incidents only.
+
+An authorizer denies reads of ``main.incidents`` and ``main.incidents_fts``
+except through those views, other internal tables, the FTS auxiliary
+functions (``highlight``, ``snippet``, ``bm25``) and all writes. The
+authorizer only sees the name of the view or CTE a read comes through, so a
+CTE named like one of the views would pass as the view; ``guard_query``
+rejects such CTEs (see ``TenantAuthorizer.views``).
+
+The authorizer is only enforced while an untrusted statement is being
+compiled: ``arm()`` is called right before it, and the trace callback disarms
+it once the statement starts stepping. This lets SQLite's own internal
+statements (for example FTS5 reading its external content table) and the
+guard's bookkeeping queries run normally.
+"""
+import sqlite3
+
+from fts_index import FTS_TABLE, fts_available
+
+ALL_CLIENTS = "ALL"
+
+# Tables a regular client may read (through the view, for incidents)
+_SCHEMA_TABLES = {"sqlite_master", "sqlite_schema", "sqlite_temp_master", "sqlite_temp_schema"}
+# Temp views replacing the shared tables on a regular client's connection
+TENANT_VIEWS = frozenset({"incidents", FTS_TABLE})
+# Shared table -> the views allowed to read it
+_VIEW_READS = {"incidents": {"incidents", FTS_TABLE}, FTS_TABLE: {FTS_TABLE}}
+# Columns of the FTS index its view reads; its text columns are never readable
+_FTS_READABLE = {"incident_id", FTS_TABLE, "rowid", "ROWID"}
+# FTS5 auxiliary functions return indexed text or scores computed over all clients' rows
+_DENIED_FUNCTIONS = {"highlight", "snippet", "bm25"}
+
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+class TenantAuthorizer:
+    """sqlite3 authorizer callback restricting a connection to one client's rows"""
+
+    def __init__(self, client):
+        self.restricted = client != ALL_CLIENTS
+        # Names untrusted SQL must not redefine in a WITH clause
+        self.views = TENANT_VIEWS if self.restricted else frozenset()
+        self.armed = True
+
+    def arm(self):
+        self.armed = True
+
+    def disarm(self, _statement=None):
+        self.armed = False
+
+    def __call__(self, action, arg1, arg2, db_name, trigger_or_view):
+        if not self.armed:
+            return sqlite3.SQLITE_OK
+        if action == sqlite3.SQLITE_FUNCTION and self.restricted and arg2.lower() in _DENIED_FUNCTIONS:
+            return sqlite3.SQLITE_DENY
+        if action in _ALLOWED_ACTIONS:
+            return sqlite3.SQLITE_OK
+        if action != sqlite3.SQLITE_READ:
+            return sqlite3.SQLITE_DENY  # Writes, DDL, PRAGMA, ATTACH, transactions
+        if not self.restricted or db_name == "temp" or arg1 in _SCHEMA_TABLES:
+            return sqlite3.SQLITE_OK
+        if db_name != "main" or trigger_or_view not in _VIEW_READS.get(arg1, ()):
+            return sqlite3.SQLITE_DENY  # Only reachable through the client's views
+        if arg1 == FTS_TABLE and arg2 not in _FTS_READABLE:
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def ensure_client_index(conn):
+    """Index backing the per-client views"""
+    with conn:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_incidents_client_name ON incidents(client_name)")
+
+
+def open_client_connection(database_path, client, check_same_thread=True):
+    """Open a read-only connection whose ``incidents`` only shows the client's rows.
+
+    Returns ``(conn, authorizer)``; call ``authorizer.arm()`` right before
+    executing any untrusted SQL on it. Pooled connections pass
+    ``check_same_thread=False`` and must only be used by one thread at a time.
+    """
+    # Statement caching is off so untrusted SQL can never reuse a statement
+    # that was compiled while the authorizer was disarmed.
+    conn = sqlite3.connect(
+        f"file:{database_path}?mode=ro", uri=True, cached_statements=0, check_same_thread=check_same_thread
+    )
+    fts = fts_available(conn)
+    if client != ALL_CLIENTS:
+        conn.execute(
+            f"CREATE TEMP VIEW incidents AS SELECT * FROM main.incidents WHERE client_name = {_quote(client)}"
+        )
+        if fts:
+            conn.execute(
+                f"CREATE TEMP VIEW {FTS_TABLE} AS SELECT f.rowid AS rowid, f.incident_id AS incident_id, "
+                f"f.{FTS_TABLE} AS {FTS_TABLE} FROM main.{FTS_TABLE} AS f "
+                f"JOIN main.incidents AS i ON i.rowid = f.rowid WHERE i.client_name = {_quote(client)}"
+            )
+    if fts:
+        # Connect the FTS5 virtual table now; its constructor runs internal
+        # statements that must not be checked against the client's rules.
+        conn.execute(f"SELECT rowid FROM main.{FTS_TABLE} LIMIT 0").fetchall()
+    authorizer = TenantAuthorizer(client)
+    conn.set_authorizer(authorizer)
+    conn.set_trace_callback(authorizer.disarm)
+    authorizer.disarm()
+    return conn, authorizer
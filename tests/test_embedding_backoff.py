@@ -0,0 +1,24 @@
+"""An unreachable embedding server costs one failed call, not one per column per question."""
+import ollama_client
+import schema_catalog
+
+
+def test_failed_embedding_is_not_retried_within_the_backoff(monkeypatch):
+    calls = []
+
+    def unreachable(text, timeout=None):
+        calls.append(text)
+        raise ConnectionError("embedding server unreachable")
+
+    monkeypatch.setattr(ollama_client, "embed", unreachable)
+    monkeypatch.setattr(ollama_client, "_embed_down_until", 0.0)
+    monkeypatch.setattr(schema_catalog, "_column_embeddings", None)
+
+    for _ in range(3):
+        columns = schema_catalog.select_columns("Which districts have the most incidents and how many?")
+        assert "district" in columns
+    assert len(calls) == 1
+
+    monkeypatch.setattr(ollama_client, "_embed_down_until", 0.0)
+    schema_catalog.select_columns("Are there any unresolved incidents?")
+    assert len(calls) == 2
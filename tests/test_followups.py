@@ -0,0 +1,41 @@
+"""Follow-ups are answered from the asking user's previous result only, and only when they refer back to it."""
+import pandas as pd
+import pytest
+
+import noc_service
+from noc_service import NocService, authenticate
+from result_handles import is_followup
+
+
+def test_handles_are_scoped_to_the_user(tmp_path):
+    service = NocService(str(tmp_path / "incidents.db"))
+    gp, banglalink = authenticate("gp_user", "gp123"), authenticate("bl_user", "bl123")
+    rows = pd.DataFrame({"incident_id": ["BL-1", "BL-2"], "client_name": ["Banglalink"] * 2})
+    noc_service.result_store.put((banglalink.username, "shared"), rows, "open incidents")
+
+    assert service._answer_followup(banglalink, "shared", "how many of those are there?").text.startswith("There are 2")
+    assert service._answer_followup(gp, "shared", "how many of those are there?") is None
+    service.forget(gp, "shared")
+    assert noc_service.result_store.get_handle((banglalink.username, "shared")) is not None
+
+
+@pytest.mark.parametrize("question", [
+    "how many of those?",
+    "which of those are in Dhaka",
+    "which of them are still open",
+    "group those by district",
+    "what was the reason for the previous result",
+    "show only the ones from that district among them",
+])
+def test_explicit_references_are_followups(question):
+    assert is_followup(question)
+
+
+@pytest.mark.parametrize("question", [
+    # Reference question in text_csv_db.txt
+    "Which districts have the most incidents and how many? sort them in descending order",
+    "Which of the clients had the most outages last month?",
+    "Show me the list of open incidents",
+])
+def test_standalone_questions_are_not_followups(question):
+    assert not is_followup(question)
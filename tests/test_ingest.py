@@ -0,0 +1,52 @@
+"""The synchronous append writes rows and their stats deltas together, or neither."""
+import io
+import sqlite3
+
+import pytest
+
+import incident_ingest
+from noc_service import NocService, authenticate
+
+CSV = "incident_id,client_name,reason\nGP-1,GP,fire\nGP-2,GP,cable cut\nBL-1,Banglalink,power\n"
+
+
+def _count(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_append_updates_rows_and_stats(tmp_path):
+    path = str(tmp_path / "incidents.db")
+    service = NocService(path)
+    admin = authenticate("admin", "admin123")
+
+    result = service.ingest(admin, io.StringIO(CSV), mode="append", filename="export.csv")
+    assert result["inserted"] == 3
+    assert result["clients"] == ["Banglalink", "GP"]
+    assert _count(path, "SELECT COUNT(*) FROM incidents") == 3
+    assert service.database_stats(admin) is not None
+
+
+def test_failed_stats_update_rolls_back_the_rows(tmp_path, monkeypatch):
+    path = str(tmp_path / "incidents.db")
+    service = NocService(path)
+    admin = authenticate("admin", "admin123")
+    service.ingest(admin, io.StringIO(CSV), mode="append", filename="first.csv")
+
+    def broken_delta(conn, frame):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(incident_ingest, "apply_frame_delta", broken_delta)
+    with pytest.raises(sqlite3.OperationalError):
+        service.ingest(admin, io.StringIO(CSV), mode="append", filename="second.csv")
+    assert _count(path, "SELECT COUNT(*) FROM incidents") == 3
+
+
+def test_append_requires_client_name(tmp_path):
+    service = NocService(str(tmp_path / "incidents.db"))
+    with pytest.raises(ValueError, match="client_name"):
+        service.ingest(authenticate("admin", "admin123"), io.StringIO("incident_id,reason\nX-1,fire\n"),
+                       mode="append", filename="export.csv")
@@ -0,0 +1,21 @@
+"""Cost confirmations only run SQL the server generated, for the user and session it was shown to."""
+from noc_service import PendingQueries
+
+
+def test_confirmation_is_bound_to_owner_and_single_use():
+    pending = PendingQueries()
+    confirmation_id = pending.put(("gp_user", "s1"), "all incidents", "SELECT * FROM incidents")
+    assert pending.pop(("bl_user", "s1"), confirmation_id) is None
+    assert pending.pop(("gp_user", "s2"), confirmation_id) is None
+    assert pending.pop(("gp_user", "s1"), confirmation_id) == ("all incidents", "SELECT * FROM incidents")
+    assert pending.pop(("gp_user", "s1"), confirmation_id) is None
+
+
+def test_confirmation_expires():
+    pending = PendingQueries(ttl_s=-1)
+    confirmation_id = pending.put(("gp_user", "s1"), "q", "SELECT 1")
+    assert pending.pop(("gp_user", "s1"), confirmation_id) is None
+
+
+def test_unknown_id_is_rejected():
+    assert PendingQueries().pop(("gp_user", "s1"), "SELECT * FROM main.incidents") is None
@@ -0,0 +1,35 @@
+"""Row-level queries get an automatic LIMIT; queries reduced by an aggregate do not."""
+import sqlite3
+
+import pytest
+
+from query_guard import guard_query, is_aggregate_query
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT count(*) FROM incidents",
+    "SELECT ROUND(AVG(duration), 2) FROM incidents",
+    "SELECT district, count(*) FROM incidents GROUP BY district",
+    "SELECT count(*) FILTER (WHERE fault_status = 'open') FROM incidents",
+])
+def test_aggregates(sql):
+    assert is_aggregate_query(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT *, count(*) OVER () AS total FROM incidents",
+    "SELECT incident_id, sum(duration) OVER (PARTITION BY district) FROM incidents",
+    "SELECT incident_id, count(*) FILTER (WHERE fault_status = 'open') OVER w FROM incidents WINDOW w AS ()",
+    "SELECT *, (SELECT max(duration) FROM incidents) AS longest FROM incidents",
+    "SELECT * FROM incidents WHERE duration > (SELECT avg(duration) FROM incidents)",
+])
+def test_row_level_queries(sql):
+    assert not is_aggregate_query(sql)
+
+
+def test_window_query_is_capped():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE incidents (incident_id TEXT, district TEXT, duration REAL)")
+    guarded = guard_query(conn, "SELECT *, count(*) OVER () AS total FROM incidents", max_rows=50)
+    assert guarded.limit_added
+    assert guarded.sql.endswith("LIMIT 50")
@@ -0,0 +1,45 @@
+"""The SQL prompt only points the model at incidents_fts when the index exists."""
+import sqlite3
+
+import pytest
+
+import noc_service
+from fts_index import FTS_COLUMNS, ensure_fts_index
+from noc_service import SQL_SYSTEM_PROMPT, SQL_SYSTEM_PROMPT_LIKE, NocService, authenticate
+
+
+class _Unanswered:
+    status_code = 503
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = str(tmp_path / "incidents.db")
+    conn = sqlite3.connect(path)
+    columns = ["incident_id", "client_name"] + FTS_COLUMNS
+    conn.execute(f"CREATE TABLE incidents ({', '.join(col + ' TEXT' for col in columns)})")
+    conn.execute(f"INSERT INTO incidents VALUES ({', '.join('?' * len(columns))})", ["GP-1", "GP"] + ["fire"] * 5)
+    conn.commit()
+    conn.close()
+    return NocService(path)
+
+
+def test_prompt_follows_the_index(service, monkeypatch):
+    prompts = []
+
+    def post_chat(url, model, system_prompt, user_prompt, **kwargs):
+        prompts.append(system_prompt)
+        return _Unanswered()
+
+    monkeypatch.setattr(noc_service, "post_chat", post_chat)
+    user = authenticate("gp_user", "gp123")
+
+    service.ask(user, "s1", "Show incidents caused by a fire at the site")
+    assert prompts[-1] == SQL_SYSTEM_PROMPT_LIKE
+    assert "incidents_fts" not in SQL_SYSTEM_PROMPT_LIKE
+
+    conn = sqlite3.connect(service.database_path)
+    assert ensure_fts_index(conn)
+    conn.close()
+    service.ask(user, "s1", "Show incidents caused by a fire at the site")
+    assert prompts[-1] == SQL_SYSTEM_PROMPT
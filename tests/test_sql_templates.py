@@ -0,0 +1,35 @@
+"""Matching questions against templates only reads the database; seeding happens at start-up and ingest."""
+import io
+import os
+import sqlite3
+
+from noc_service import NocService, authenticate
+from sql_templates import TEMPLATES_TABLE, TemplateLibrary
+
+QUESTION = "Top 5 clients with most incidents and their count."
+
+
+def test_search_does_not_create_a_database(tmp_path):
+    path = str(tmp_path / "missing.db")
+    assert TemplateLibrary(path, use_embeddings=False).search(QUESTION, client="GP") == []
+    assert not os.path.exists(path)
+
+
+def test_search_does_not_create_the_table(tmp_path):
+    path = str(tmp_path / "incidents.db")
+    sqlite3.connect(path).close()
+    library = TemplateLibrary(path, use_embeddings=False)
+    assert library.search(QUESTION, client="GP") == []
+
+    assert library.ensure_table()
+    assert library.search(QUESTION, client="GP")[0].sql.endswith("LIMIT 5")
+
+
+def test_first_ingest_seeds_the_templates(tmp_path):
+    path = str(tmp_path / "incidents.db")
+    service = NocService(path)
+    service.ingest(authenticate("admin", "admin123"), io.StringIO("incident_id,client_name\nGP-1,GP\n"),
+                   filename="export.csv")
+    conn = sqlite3.connect(path)
+    assert conn.execute(f"SELECT COUNT(*) FROM {TEMPLATES_TABLE}").fetchone()[0] > 0
+    conn.close()
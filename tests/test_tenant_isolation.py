@@ -0,0 +1,87 @@
+"""Generated SQL must only ever see the client's own incidents."""
+import sqlite3
+
+import pytest
+
+from fts_index import FTS_COLUMNS, ensure_fts_index
+from query_guard import QueryRejected, guard_query
+from tenant_db import ensure_client_index, open_client_connection
+
+COLUMNS = ["incident_id", "client_name"] + FTS_COLUMNS
+
+
+@pytest.fixture
+def gp_connection(tmp_path):
+    path = str(tmp_path / "incidents.db")
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE incidents ({', '.join(col + ' TEXT' for col in COLUMNS)})")
+    conn.executemany(
+        f"INSERT INTO incidents VALUES ({', '.join('?' * len(COLUMNS))})",
+        [
+            ("GP-1", "GP") + ("fire at gp site",) * len(FTS_COLUMNS),
+            ("BL-1", "Banglalink") + ("fire at banglalink site",) * len(FTS_COLUMNS),
+        ],
+    )
+    conn.commit()
+    ensure_fts_index(conn)
+    ensure_client_index(conn)
+    conn.close()
+    conn, authorizer = open_client_connection(path, "GP")
+    yield conn, authorizer
+    conn.close()
+
+
+def run(connection, sql):
+    """Guard and execute like NocService.execute_sql"""
+    conn, authorizer = connection
+    guarded = guard_query(conn, sql, authorizer=authorizer)
+    authorizer.arm()
+    try:
+        return conn.execute(guarded.sql).fetchall()
+    finally:
+        authorizer.disarm()
+
+
+def test_view_shows_own_rows(gp_connection):
+    assert run(gp_connection, "SELECT incident_id FROM incidents") == [("GP-1",)]
+
+
+@pytest.mark.parametrize("sql", [
+    "WITH incidents AS (SELECT * FROM main.incidents) SELECT incident_id FROM incidents",
+    'WITH "Incidents"(incident_id) AS (SELECT incident_id FROM main.incidents) SELECT * FROM incidents',
+    "SELECT * FROM (WITH incidents AS MATERIALIZED (SELECT * FROM main.incidents) SELECT incident_id FROM incidents)",
+    "WITH incidents_fts AS (SELECT * FROM main.incidents_fts) SELECT incident_id FROM incidents_fts",
+    "WITH x AS (SELECT * FROM main.incidents) SELECT incident_id FROM x",
+    "SELECT incident_id FROM (SELECT * FROM main.incidents) AS incidents",
+    "SELECT incident_id FROM main.incidents",
+])
+def test_shadowing_or_direct_reads_are_blocked(gp_connection, sql):
+    with pytest.raises(QueryRejected):
+        run(gp_connection, sql)
+
+
+def test_full_text_search_returns_own_ids_only(gp_connection):
+    sql = "SELECT incident_id FROM incidents_fts WHERE incidents_fts MATCH 'fire'"
+    assert run(gp_connection, sql) == [("GP-1",)]
+    sql = "SELECT incident_id FROM main.incidents_fts WHERE incidents_fts MATCH 'fire'"
+    with pytest.raises(QueryRejected):
+        run(gp_connection, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT highlight(incidents_fts, 1, '[', ']') FROM incidents_fts WHERE incidents_fts MATCH 'fire'",
+    "SELECT snippet(incidents_fts, 1, '[', ']', '...', 8) FROM incidents_fts WHERE incidents_fts MATCH 'fire'",
+    "SELECT bm25(incidents_fts) FROM incidents_fts WHERE incidents_fts MATCH 'fire'",
+    "SELECT reason FROM main.incidents_fts WHERE incidents_fts MATCH 'fire'",
+])
+def test_fts_text_and_auxiliary_functions_are_blocked(gp_connection, sql):
+    with pytest.raises(QueryRejected):
+        run(gp_connection, sql)
+
+
+def test_fts_subquery_pattern_still_works(gp_connection):
+    sql = (
+        "SELECT incident_id FROM incidents WHERE incident_id IN "
+        "(SELECT incident_id FROM incidents_fts WHERE incidents_fts MATCH '{reason} : fire')"
+    )
+    assert run(gp_connection, sql) == [("GP-1",)]
@@ -0,0 +1,42 @@
+"""The trace file stays bounded and the admin summary reads only its tail."""
+import json
+
+import tracing
+from tracing import Span, Tracer, read_traces, summarize_traces
+
+
+def test_trace_file_is_rotated(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(str(path), max_bytes=2000)
+    for i in range(100):
+        tracer.record(Span("sql.execute", {"i": i}), 0.01)
+
+    assert path.stat().st_size <= 2000 + 200
+    assert (tmp_path / "traces.jsonl.1").exists()
+    assert read_traces(str(path))[-1]["i"] == 99
+
+
+def test_read_traces_returns_the_tail(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    with open(path, "w") as f:
+        for i in range(5000):
+            f.write(json.dumps({"stage": "llm.sql", "ms": float(i), "i": i}) + "\n")
+
+    records = read_traces(str(path), last_n=100)
+    assert [r["i"] for r in records] == list(range(4900, 5000))
+    assert summarize_traces(records)[0]["count"] == 100
+
+
+def test_unchanged_file_is_not_reread(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    path.write_text(json.dumps({"stage": "llm.sql", "ms": 1.0}) + "\n")
+    reads = []
+    tail_lines = tracing._tail_lines
+    monkeypatch.setattr(tracing, "_tail_lines", lambda *args: reads.append(1) or tail_lines(*args))
+
+    assert read_traces(str(path)) == read_traces(str(path))
+    assert len(reads) == 1
+    with open(path, "a") as f:
+        f.write(json.dumps({"stage": "llm.chat", "ms": 2.0}) + "\n")
+    assert len(read_traces(str(path))) == 2
+    assert len(reads) == 2
@@ -0,0 +1,305 @@
+"""Per-stage tracing and metrics for the NL-to-SQL and RAG pipelines.
+
+Wrap each pipeline stage in a span:
+
+    with request_context(session=session_id, client=client):
+        with span("llm.sql", model=SQL_MODEL) as s:
+            response = post_chat(...)
+            s.set(tokens=...)
+
+Every finished span records its wall time, optional token and row counts, the
+current request id and labels. Spans are appended to a JSONL trace file
+(``TRACE_LOG``, default ``traces.jsonl``, rotated to ``<file>.1`` once it passes
+``TRACE_LOG_MAX_BYTES``) and aggregated in memory for a Prometheus-style text
+endpoint (``start_metrics_server``, enabled by setting ``METRICS_PORT``).
+``summarize_traces`` computes p50/p95 per stage from the tail of the trace file
+for the admin panel, so it covers every process writing to it.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+TRACE_LOG = os.getenv("TRACE_LOG", "traces.jsonl")
+# The trace file is moved to <file>.1 (replacing the previous one) past this size
+TRACE_LOG_MAX_BYTES = int(os.getenv("TRACE_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PREFIX = "noc_assistant"
+# Recent durations kept per stage for the in-memory quantiles
+WINDOW = 1000
+
+_request = contextvars.ContextVar("trace_request", default=None)
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def request_context(request_id=None, **labels):
+    """Give every span inside the block the same request id and labels (session, client, ...)"""
+    parent = _request.get() or {}
+    context = {**parent, **labels, "request_id": request_id or parent.get("request_id") or new_request_id()}
+    token = _request.set(context)
+    try:
+        yield context["request_id"]
+    finally:
+        _request.reset(token)
+
+
+def current_request_id():
+    context = _request.get()
+    return context["request_id"] if context else None
+
+
+def _quantile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class StageMetrics:
+    """Running totals and a window of recent durations for one stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.tokens = 0
+        self.rows = 0
+        self.recent = deque(maxlen=WINDOW)
+
+    def observe(self, seconds, tokens=None, rows=None, error=False):
+        self.count += 1
+        self.seconds += seconds
+        self.tokens += tokens or 0
+        self.rows += rows or 0
+        self.errors += int(error)
+        self.recent.append(seconds)
+
+
+class Span:
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.tokens = None
+        self.rows = None
+        self.start = time.perf_counter()
+
+    def set(self, tokens=None, rows=None, **labels):
+        """Attach token / row counts or extra labels to the span"""
+        if tokens is not None:
+            self.tokens = (self.tokens or 0) + int(tokens)
+        if rows is not None:
+            self.rows = int(rows)
+        self.labels.update(labels)
+
+
+class Tracer:
+    def __init__(self, path=TRACE_LOG, max_bytes=TRACE_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def record(self, span, seconds, error=None):
+        context = _request.get() or {}
+        record = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stage": span.stage,
+            "ms": round(seconds * 1000, 2),
+            **{key: value for key, value in context.items()},
+            **span.labels,
+        }
+        if span.tokens is not None:
+            record["tokens"] = span.tokens
+        if span.rows is not None:
+            record["rows"] = span.rows
+        if error is not None:
+            record["error"] = type(error).__name__
+        with self._lock:
+            self.metrics.setdefault(span.stage, StageMetrics()).observe(
+                seconds, span.tokens, span.rows, error is not None
+            )
+            if self.path:
+                try:
+                    with open(self.path, "a") as f:
+                        f.write(json.dumps(record, default=str) + "\n")
+                        size = f.tell()
+                    if self.max_bytes and size > self.max_bytes:
+                        os.replace(self.path, f"{self.path}.1")
+                except OSError:
+                    logger.warning("Could not write trace log %s", self.path)
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format"""
+        name = f"{METRICS_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} Wall time per pipeline stage", f"# TYPE {name} summary"]
+        counters = {"tokens": [], "rows": [], "errors": []}
+        with self._lock:
+            stages = sorted(self.metrics.items())
+            for stage, m in stages:
+                recent = list(m.recent)
+                for q in (0.5, 0.95):
+                    lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {_quantile(recent, q):.6f}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {m.seconds:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {m.count}')
+                counters["tokens"].append(f'{METRICS_PREFIX}_stage_tokens_total{{stage="{stage}"}} {m.tokens}')
+                counters["rows"].append(f'{METRICS_PREFIX}_stage_rows_total{{stage="{stage}"}} {m.rows}')
+                counters["errors"].append(f'{METRICS_PREFIX}_stage_errors_total{{stage="{stage}"}} {m.errors}')
+        for kind, samples in counters.items():
+            lines.append(f"# TYPE {METRICS_PREFIX}_stage_{kind}_total counter")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a pipeline stage; the yielded Span takes tokens / rows via ``set``"""
+    current = Span(stage, labels)
+    try:
+        yield current
+    except Exception as e:
+        tracer.record(current, time.perf_counter() - current.start, error=e)
+        raise
+    tracer.record(current, time.perf_counter() - current.start)
+
+
+def observe(stage, seconds, rows=None, **labels):
+    """Record a duration measured outside a span (e.g. data freshness lag) like a span's wall time"""
+    current = Span(stage, labels)
+    current.set(rows=rows)
+    tracer.record(current, seconds)
+
+
+def traced(stage, **labels):
+    """Decorator form of ``span``; DataFrame / list results are counted as rows"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, **labels) as s:
+                result = func(*args, **kwargs)
+                if hasattr(result, "__len__") and not isinstance(result, (str, bytes, dict)):
+                    s.set(rows=len(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def llm_tokens(data):
+    """Prompt + output tokens from an Ollama response body"""
+    return data.get("prompt_eval_count", 0) + data.get("eval_count", 0)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server = None
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on a background thread (once per process; no-op when port is 0)"""
+    global _metrics_server
+    if not port or _metrics_server is not None:
+        return _metrics_server
+    try:
+        _metrics_server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    except OSError as e:
+        logger.warning("Metrics endpoint not started on port %s: %s", port, e)
+        return None
+    threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server
+
+
+# Bytes read from the end of the trace file per requested line; spans are ~200-300 bytes
+_TAIL_BYTES_PER_LINE = 512
+_traces_cache = {}
+
+
+def _tail_lines(f, size, last_n):
+    """Up to ``last_n`` complete lines from the end of a binary file of ``size`` bytes"""
+    start = max(0, size - last_n * _TAIL_BYTES_PER_LINE)
+    f.seek(start)
+    lines = f.read(size - start).splitlines()
+    if start > 0 and lines:
+        lines = lines[1:]  # Partial first line
+    return lines[-last_n:]
+
+
+def read_traces(path=TRACE_LOG, last_n=20000):
+    """The most recent spans from the trace file, re-read only when it changed.
+
+    Only the tail of the file is read, so the cost is bounded by ``last_n``
+    rather than by how long the service has been running.
+    """
+    if not path:
+        return []
+    try:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            key = (path, last_n)
+            version = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            cached = _traces_cache.get(key)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            lines = _tail_lines(f, stat.st_size, last_n)
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    _traces_cache[key] = (version, records)
+    return records
+
+
+def summarize_traces(records):
+    """Per-stage count, p50/p95 wall time, mean tokens and rows, sorted by total time"""
+    by_stage = {}
+    for record in records:
+        by_stage.setdefault(record["stage"], []).append(record)
+    summary = []
+    for stage, spans in by_stage.items():
+        durations = [r["ms"] for r in spans]
+        tokens = [r["tokens"] for r in spans if "tokens" in r]
+        rows = [r["rows"] for r in spans if "rows" in r]
+        summary.append({
+            "stage": stage,
+            "count": len(spans),
+            "p50_ms": _quantile(durations, 0.5),
+            "p95_ms": _quantile(durations, 0.95),
+            "total_s": round(sum(durations) / 1000, 2),
+            "avg_tokens": round(sum(tokens) / len(tokens), 1) if tokens else None,
+            "avg_rows": round(sum(rows) / len(rows), 1) if rows else None,
+            "errors": sum(1 for r in spans if "error" in r),
+        })
+    return sorted(summary, key=lambda s: s["total_s"], reverse=True)
@@ -0,0 +1,58 @@
+"""Background warm-up for the Streamlit apps.
+
+Streamlit executes the whole script before the first page appears, so the apps
+import pandas, sqlalchemy, langchain, sentence-transformers and friends only
+inside the features that use them, and the login page renders without them.
+So the first question does not pay for those imports either, each app passes
+its preload tasks to ``start_warmup`` once the page is up. Those tasks import
+the pipeline, open database connections and load the Ollama models. They run
+on a daemon thread, once per server process (Streamlit keeps imported modules
+across reruns).
+
+Every task is traced as ``warmup.<task>``. A failing task is logged and
+skipped. Set ``APP_WARMUP=0`` to turn warm-up off.
+"""
+import logging
+import os
+import threading
+
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+APP_WARMUP = os.getenv("APP_WARMUP", "1") == "1"
+
+_started = set()
+_started_lock = threading.Lock()
+
+
+def _run(app, tasks):
+    for name, task in tasks:
+        try:
+            with span(f"warmup.{name}", app=app):
+                task()
+        except Exception as e:
+            logger.warning("Warm-up task %s of %s failed: %s", name, app, e)
+
+
+def start_warmup(app, tasks):
+    """Run ``[(name, callable), ...]`` in the background, once per process and app.
+
+    Returns the started thread, or None if warm-up is disabled or already ran.
+    """
+    if not APP_WARMUP:
+        return None
+    with _started_lock:
+        if app in _started:
+            return None
+        _started.add(app)
+    thread = threading.Thread(target=_run, args=(app, tasks), name=f"warmup-{app}", daemon=True)
+    try:
+        # Lets tasks use st.cache_resource functions without "missing ScriptRunContext" warnings
+        from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+        add_script_run_ctx(thread)
+    except ImportError:
+        pass
+    thread.start()
+    return thread